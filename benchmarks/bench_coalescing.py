@@ -0,0 +1,50 @@
+"""
+Check + benchmark: N concurrent identical reads through coalesced_read_records()
+produce exactly one upstream request, versus N with plain read_records().
+
+    python -m benchmarks.bench_coalescing --callers 500 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.stub_server import StubServer
+
+async def burst(read, callers: int):
+    started = time.perf_counter()
+    results = await asyncio.gather(*(read("listings", "id=eq.42", "*,photos(*)") for _ in range(callers)))
+    return time.perf_counter() - started, results
+
+async def main(args):
+    server = StubServer(latency=args.latency, body=[{"id": 42, "title": "2BR in Kilimani"}]).start()
+    os.environ["SUPABASE_URL"] = server.url
+    from database import gateway
+    from routers.crud import read_records
+    from routers.coalesce import coalesced_read_records, read_flight
+
+    report = []
+    try:
+        for label, read in (("read_records", read_records), ("coalesced_read_records", coalesced_read_records)):
+            server.reset_counters()
+            seconds, results = await burst(read, args.callers)
+            assert all(r == results[0] for r in results)
+            report.append({
+                "variant": label,
+                "callers": args.callers,
+                "upstream_requests": server.requests,
+                "seconds": round(seconds, 4),
+            })
+        assert report[1]["upstream_requests"] == 1, report
+        assert read_flight.stats()["shared"] == args.callers - 1
+    finally:
+        await gateway.close()
+        server.stop()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub server delay per request, seconds")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,282 @@
+"""
+Endpoint benchmark: runs the real app (uvicorn) against benchmarks.fake_supabase
+and sweeps concurrency per endpoint. Prints JSON with throughput, p50/p95/p99
+latency, errors and upstream (fake Supabase) calls per request.
+
+    python -m benchmarks.bench_endpoints --latency-ms 5 --concurrency 1 16 64 --requests 400
+    python -m benchmarks.bench_endpoints --output after.json --baseline before.json
+
+With --baseline the output also lists endpoints whose throughput fell or p95 rose
+by more than --threshold percent (exit status 1 if any did).
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from jose import jwt
+
+JWT_SECRET = "bench-secret"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """
+    Nearest-rank percentile of an ascending list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def sample_image() -> bytes:
+    try:
+        from PIL import Image
+    except ImportError:
+        return os.urandom(200 * 1024)
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 1200), (180, 120, 60)).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+# --- Scenarios: name -> function(i) returning request kwargs ---
+def scenarios(listings: int, users: int) -> dict:
+    token = jwt.encode({"sub": "1", "role": "authenticated", "exp": int(time.time()) + 7200}, JWT_SECRET, algorithm="HS256")
+    image = sample_image()
+    rng = random.Random(1)
+    run_id = int(time.time())
+    return {
+        "counties": lambda i: {"method": "GET", "url": "/counties/"},
+        "regions_by_county": lambda i: {"method": "GET", "url": f"/regions/?county_id={rng.randint(1, 47)}"},
+        "listings_page": lambda i: {"method": "GET", "url": "/listings/?limit=20"},
+        "listings_page_thumbs": lambda i: {"method": "GET", "url": "/listings/?limit=20&photo_size=thumb"},
+        "listings_cursor": lambda i: {"method": "GET", "url": "/listings/?paginate=cursor&limit=20&sort=-price"},
+        "listings_map": lambda i: {"method": "GET", "url": "/listings/?limit=200&fields=id,price,region_id&embed="},
+        "listing_detail": lambda i: {"method": "GET", "url": f"/listings/{rng.randint(1, listings)}"},
+        "listing_search": lambda i: {"method": "GET", "url": f"/listings/search?q={rng.choice(['spacious', 'balcony parking', 'gated'])}"},
+        "listings_nearby": lambda i: {
+            "method": "GET",
+            "url": f"/listings/nearby?lat={-1.286 + rng.uniform(-0.3, 0.3):.5f}&lng={36.817 + rng.uniform(-0.3, 0.3):.5f}&radius_km=3",
+        },
+        "favourite_ids": lambda i: {"method": "GET", "url": f"/favourites/ids?user_id={rng.randint(1, users)}"},
+        "auth_me": lambda i: {"method": "GET", "url": "/auth/me", "headers": {"Authorization": f"Bearer {token}"}},
+        "add_favourite": lambda i: {
+            "method": "POST", "url": "/favourites/",
+            "json": {"user_id": rng.randint(1, users), "listing_id": rng.randint(1, listings)},
+        },
+        "create_payment": lambda i: {
+            "method": "POST", "url": "/payments/",
+            "json": {"user_id": rng.randint(1, users), "listing_id": rng.randint(1, listings), "amount": 1000},
+        },
+        "mpesa_webhook": lambda i: {
+            "method": "POST", "url": "/payments/mpesa/webhook",
+            "json": {"Body": {"stkCallback": {"CheckoutRequestID": f"bench_{run_id}_{i}", "ResultCode": 0}}},
+        },
+        "photo_upload": lambda i: {
+            "method": "POST", "url": "/photos/upload/",
+            "data": {"listing_id": str(rng.randint(1, listings))},
+            "files": {"file": ("house.jpg", image, "image/jpeg")},
+        },
+    }
+
+# --- Processes ---
+def start_process(args: list, env: dict, port: int) -> subprocess.Popen:
+    process = subprocess.Popen(args, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{args[2]} exited: {process.stderr.read().decode()[-2000:]}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{args[2]} did not start on port {port}")
+
+def stop_process(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+# --- Load ---
+async def sweep(client: httpx.AsyncClient, fake: httpx.AsyncClient, name: str, make_request, concurrency: int, total: int) -> dict:
+    await fake.post("/__reset")
+    latencies, statuses = [], {}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            request = make_request(i)
+            started = time.perf_counter()
+            try:
+                resp = await client.request(**request)
+                status = resp.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    upstream = (await fake.get("/__stats")).json()
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500)
+    return {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "seconds": round(elapsed, 4),
+        "req_per_s": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "errors": errors,
+        "statuses": statuses,
+        "upstream_calls": upstream["total"],
+        "upstream_per_request": round(upstream["total"] / total, 3),
+        "upstream_by_route": upstream["by_route"],
+    }
+
+def compare(results: list, baseline: dict, threshold: float) -> list:
+    before = {(row["endpoint"], row["concurrency"]): row for row in baseline.get("results", [])}
+    regressions = []
+    for row in results:
+        old = before.get((row["endpoint"], row["concurrency"]))
+        if old is None:
+            continue
+        throughput = (row["req_per_s"] - old["req_per_s"]) / old["req_per_s"] * 100 if old["req_per_s"] else 0.0
+        p95 = (row["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        if throughput < -threshold or p95 > threshold or row["upstream_per_request"] > old["upstream_per_request"]:
+            regressions.append({
+                "endpoint": row["endpoint"],
+                "concurrency": row["concurrency"],
+                "req_per_s_change_pct": round(throughput, 1),
+                "p95_change_pct": round(p95, 1),
+                "upstream_per_request": [old["upstream_per_request"], row["upstream_per_request"]],
+            })
+    return regressions
+
+async def run(args, app_url: str, fake_url: str) -> list:
+    chosen = scenarios(args.listings, args.users)
+    names = args.endpoints or list(chosen)
+    unknown = [name for name in names if name not in chosen]
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(unknown)}. Choose from: {', '.join(chosen)}")
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    results = []
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=60) as client, \
+            httpx.AsyncClient(base_url=fake_url) as fake:
+        # Let background warm-up (reference caches, listing feed) finish before measuring
+        for _ in range(100):
+            if (await client.get("/listings/search?q=warmup")).status_code != 503:
+                break
+            await asyncio.sleep(0.2)
+        for name in names:
+            for concurrency in args.concurrency:
+                await sweep(client, fake, name, chosen[name], concurrency, min(args.warmup, args.requests))
+                result = await sweep(client, fake, name, chosen[name], concurrency, args.requests)
+                results.append(result)
+                print(
+                    f"{name:<22} c={concurrency:<4} {result['req_per_s']:>8} req/s  p50 {result['p50_ms']:>8} ms  "
+                    f"p99 {result['p99_ms']:>8} ms  upstream/req {result['upstream_per_request']}",
+                    file=sys.stderr,
+                )
+    return results
+
+def main(args):
+    fake_port, app_port = free_port(), free_port()
+    journal = tempfile.NamedTemporaryFile(prefix="bench-mpesa-", suffix=".sqlite3", delete=False)
+    journal.close()
+    env = {
+        **os.environ,
+        "SUPABASE_URL": f"http://127.0.0.1:{fake_port}",
+        "SUPABASE_KEY": "bench-key",
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "MAIL_USERNAME": os.getenv("MAIL_USERNAME", "bench"),
+        "MAIL_PASSWORD": os.getenv("MAIL_PASSWORD", "bench"),
+        "MAIL_FROM": os.getenv("MAIL_FROM", "bench@example.com"),
+        "MAIL_SERVER": os.getenv("MAIL_SERVER", "127.0.0.1"),
+        "MPESA_JOURNAL_PATH": journal.name,
+        # One client address drives all the load; per-client limits would turn it into 429s
+        "RATE_LIMIT_ENABLED": os.getenv("RATE_LIMIT_ENABLED", "false"),
+    }
+    fake = start_process(
+        [sys.executable, "-m", "benchmarks.fake_supabase", "--port", str(fake_port),
+         "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+         "--listings", str(args.listings), "--users", str(args.users), "--jwt-secret", JWT_SECRET],
+        env, fake_port,
+    )
+    try:
+        app = start_process(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port),
+             "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+            env, app_port,
+        )
+        try:
+            results = asyncio.run(run(args, f"http://127.0.0.1:{app_port}", f"http://127.0.0.1:{fake_port}"))
+        finally:
+            stop_process(app)
+    finally:
+        stop_process(fake)
+        os.unlink(journal.name)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    report = {
+        "meta": {
+            "commit": commit,
+            "python": platform.python_version(),
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "listings": args.listings,
+            "users": args.users,
+            "workers": args.workers,
+            "requests_per_level": args.requests,
+        },
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(results, json.load(f), args.threshold)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if report.get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="*", help="Scenario names (default: all)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=400, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests before each level")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Fake Supabase latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=2.0)
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    main(parser.parse_args())
@@ -0,0 +1,119 @@
+"""
+Microbenchmark: /listings/facets on routers/listing_snapshot.py at 100k listings.
+Snapshot build, incremental apply, and cold / cached facet counts checked against
+a plain-Python count over the rows.
+
+    python -m benchmarks.bench_facets --listings 100000 --queries 300
+"""
+import argparse
+import json
+import random
+import time
+
+from .bench_geo import percentiles_us, synthetic_listings
+
+def brute_force(rows: list, county_of: dict, price_edges: list, region_id, county_id, type, price_min, price_max) -> dict:
+    """
+    Same counts, one row at a time: each facet skips its own filter.
+    """
+    def passes(row, skip):
+        price = row.get("price")
+        return (
+            (skip == "type" or type is None or (row.get("type") or "").lower() == type.lower())
+            and (skip == "price" or price_min is None or (price is not None and price >= price_min))
+            and (skip == "price" or price_max is None or (price is not None and price <= price_max))
+            and (skip == "region" or region_id is None or row.get("region_id") == region_id)
+            and (skip == "county" or county_id is None or county_of.get(row.get("region_id")) == county_id)
+        )
+
+    counts = {"total": 0, "type": {}, "price": [0] * (len(price_edges) + 1), "region": {}, "county": {}}
+    for row in rows:
+        counts["total"] += passes(row, None)
+        if passes(row, "type"):
+            counts["type"][row["type"]] = counts["type"].get(row["type"], 0) + 1
+        if passes(row, "price") and row.get("price") is not None:
+            counts["price"][sum(row["price"] >= edge for edge in price_edges)] += 1
+        if passes(row, "region"):
+            counts["region"][row["region_id"]] = counts["region"].get(row["region_id"], 0) + 1
+        county = county_of.get(row.get("region_id"))
+        if passes(row, "county") and county is not None:
+            counts["county"][county] = counts["county"].get(county, 0) + 1
+    return counts
+
+def as_counts(result: dict) -> dict:
+    return {
+        "total": result["total"],
+        "type": {item["value"]: item["count"] for item in result["type"]},
+        "price": [item["count"] for item in result["price"]],
+        "region": {item["id"]: item["count"] for item in result["region"]},
+        "county": {item["id"]: item["count"] for item in result["county"]},
+    }
+
+def main(args):
+    from routers.cache import regions_cache
+    from routers.listing_snapshot import ListingSnapshot
+
+    rows, region_rows = synthetic_listings(args.listings, args.regions, located_share=0.7)
+    rng = random.Random(13)
+    for region in region_rows:
+        region["county_id"] = rng.randrange(1, args.counties + 1)
+    regions_cache.rows = region_rows
+    regions_cache.fingerprint = "bench"
+    county_of = {region["id"]: region["county_id"] for region in region_rows}
+    snapshot = ListingSnapshot()
+
+    started = time.perf_counter()
+    snapshot.rebuild(rows)
+    result = {"listings": args.listings, "rebuild_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    changed = [{**row, "price": row["price"] + 500, "type": "2BR"} for row in rng.sample(rows, args.changed)]
+    started = time.perf_counter()
+    snapshot.apply(changed)
+    result[f"apply_{args.changed}_rows_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    by_id = {row["id"]: row for row in rows}
+    by_id.update((row["id"], row) for row in changed)
+    rows = list(by_id.values())
+
+    queries = []
+    for _ in range(args.queries):
+        query = {
+            "region_id": rng.choice([None, rng.randrange(1, args.regions + 1)]),
+            "county_id": rng.choice([None, None, rng.randrange(1, args.counties + 1)]),
+            "type": rng.choice([None, "bedsitter", "1br", "2BR", "3BR"]),
+            "price_min": rng.choice([None, 10_000, 25_000]),
+            "price_max": rng.choice([None, 40_000, 90_000]),
+        }
+        queries.append(query)
+
+    cold, cached = [], []
+    for query in queries:
+        snapshot.facet_cache.clear()
+        started = time.perf_counter()
+        snapshot.facets(**query)
+        cold.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        snapshot.facets(**query)
+        cached.append(time.perf_counter() - started)
+    result["cold"] = percentiles_us(cold)
+    result["cached"] = percentiles_us(cached)
+
+    edges = snapshot.price_edges.tolist()
+    brute = []
+    for query in queries[:args.checked]:
+        started = time.perf_counter()
+        expected = brute_force(rows, county_of, edges, **query)
+        brute.append(time.perf_counter() - started)
+        if as_counts(snapshot.facets(**query)) != expected:
+            raise SystemExit(f"Mismatch for {query}")
+    result["brute_force"] = percentiles_us(brute)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=100_000)
+    parser.add_argument("--regions", type=int, default=300)
+    parser.add_argument("--counties", type=int, default=47)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--checked", type=int, default=20, help="Queries also counted in plain Python (slow)")
+    parser.add_argument("--changed", type=int, default=100, help="Rows in the incremental apply")
+    main(parser.parse_args())
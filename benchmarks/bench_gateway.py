@@ -0,0 +1,80 @@
+"""
+Benchmark: per-call httpx clients (old crud.py) vs the pooled SupabaseGateway.
+
+Runs the same read_records workload against a local stub server and reports
+throughput, latency percentiles and how many TCP connections each approach
+opened.
+
+    python -m benchmarks.bench_gateway --requests 2000 --concurrency 50 --latency 0.002
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+import httpx
+
+from benchmarks.stub_server import StubServer
+
+async def old_read_records(base_url: str, table: str, query: str = "", select: str = "*"):
+    # Old behaviour: a brand new client (and connection) per call
+    url = f"{base_url}/rest/v1/{table}?select={select}"
+    if query:
+        url += f"&{query}"
+    async with httpx.AsyncClient() as client:
+        resp = await client.get(url)
+    return resp.json()
+
+async def run(label, call, total: int, concurrency: int, server: StubServer):
+    server.reset_counters()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "variant": label,
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 4),
+        "req_per_s": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+        "tcp_connections": server.connections,
+    }
+
+async def main(args):
+    server = StubServer(latency=args.latency).start()
+    os.environ["SUPABASE_URL"] = server.url
+    from database import gateway
+    from routers.crud import read_records
+
+    await gateway.start()
+    try:
+        results = [
+            await run("per_call_client", lambda i: old_read_records(server.url, "counties", f"id=eq.{i}"),
+                      args.requests, args.concurrency, server),
+            await run("pooled_gateway", lambda i: read_records("counties", f"id=eq.{i}"),
+                      args.requests, args.concurrency, server),
+        ]
+    finally:
+        await gateway.close()
+        server.stop()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub server delay per request, seconds")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,120 @@
+"""
+Microbenchmark: /listings/nearby matching on routers/geo_index.py at 100k listings.
+Index build, incremental apply and grid queries against a brute-force scan.
+
+    python -m benchmarks.bench_geo --listings 100000 --radius-km 1 3 10 --queries 500
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+# Nairobi metro: listings within ~40 km of the CBD
+CENTER = (-1.286, 36.817)
+SPREAD_DEG = 0.35
+
+def synthetic_listings(count: int, regions: int, located_share: float, seed: int = 7) -> tuple:
+    """
+    (listing rows, region rows); listings without lat/lng fall back to their region's centroid.
+    """
+    rng = random.Random(seed)
+    region_rows = [
+        {"id": region_id, "name": f"Region {region_id}",
+         "lat": CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG), "lng": CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)}
+        for region_id in range(1, regions + 1)
+    ]
+    rows = []
+    for listing_id in range(1, count + 1):
+        region = rng.choice(region_rows)
+        row = {
+            "id": listing_id,
+            "price": rng.randrange(6_000, 120_000, 500),
+            "type": rng.choice(["bedsitter", "1BR", "2BR", "3BR"]),
+            "region_id": region["id"],
+        }
+        if rng.random() < located_share:
+            row["lat"] = region["lat"] + rng.gauss(0, 0.02)
+            row["lng"] = region["lng"] + rng.gauss(0, 0.02)
+        rows.append(row)
+    return rows, region_rows
+
+def percentiles_us(samples: list) -> dict:
+    samples = sorted(samples)
+    return {f"p{p}_us": round(samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1e6, 1) for p in (50, 95, 99)}
+
+def brute_force(index, lat: float, lng: float, radius_km: float, limit: int):
+    """
+    Same answer without the grid: distance to every listing.
+    """
+    from routers.geo_index import haversine_km
+
+    distances = haversine_km(lat, lng, index.lat, index.lng)
+    rows = np.flatnonzero(distances <= radius_km)
+    ids = index.snapshot.ids
+    ranked = rows[np.lexsort((ids[rows], distances[rows]))][:limit]
+    return len(rows), ids[ranked].tolist()
+
+def main(args):
+    from routers.cache import regions_cache
+    from routers.geo_index import GeoIndex
+    from routers.listing_snapshot import ListingSnapshot
+
+    rows, region_rows = synthetic_listings(args.listings, args.regions, args.located_share)
+    regions_cache.rows = region_rows
+    regions_cache.fingerprint = "bench"
+    snapshot = ListingSnapshot()
+    index = GeoIndex(snapshot, args.cell_km)
+
+    started = time.perf_counter()
+    snapshot.rebuild(rows)
+    result = {
+        "listings": args.listings,
+        "cell_km": args.cell_km,
+        "snapshot_rebuild_ms": round((time.perf_counter() - started) * 1000, 1),
+        "reindex_ms": round(index.reindex_ms, 1),
+    }
+
+    rng = random.Random(11)
+    changed = [{**row, "price": row["price"] + 500} for row in rng.sample(rows, args.changed)]
+    started = time.perf_counter()
+    snapshot.apply(changed)
+    result[f"apply_{args.changed}_rows_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    points = [
+        (CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG), CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG))
+        for _ in range(args.queries)
+    ]
+    result["queries"] = []
+    for radius_km in args.radius_km:
+        grid, brute, matches = [], [], []
+        for lat, lng in points:
+            started = time.perf_counter()
+            total, hits = index.nearby(lat, lng, radius_km, limit=args.limit)
+            grid.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            expected_total, expected_ids = brute_force(index, lat, lng, radius_km, args.limit)
+            brute.append(time.perf_counter() - started)
+            if (total, [listing_id for listing_id, _, _ in hits]) != (expected_total, expected_ids):
+                raise SystemExit(f"Mismatch at ({lat}, {lng}) r={radius_km}")
+            matches.append(total)
+        result["queries"].append({
+            "radius_km": radius_km,
+            "avg_matches": round(sum(matches) / len(matches), 1),
+            "grid": percentiles_us(grid),
+            "brute_force": percentiles_us(brute),
+        })
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=100_000)
+    parser.add_argument("--regions", type=int, default=300)
+    parser.add_argument("--located-share", type=float, default=0.7, help="Share of listings with their own lat/lng")
+    parser.add_argument("--cell-km", type=float, default=2.0)
+    parser.add_argument("--radius-km", type=float, nargs="+", default=[1.0, 3.0, 10.0])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--changed", type=int, default=100, help="Rows in the incremental apply")
+    main(parser.parse_args())
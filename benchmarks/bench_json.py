@@ -0,0 +1,95 @@
+"""
+Microbenchmark: encoding a /listings/ page (embedded photos, region, county) the
+FastAPI default way vs routers/responses.py, and gzip vs brotli on the result.
+
+    python -m benchmarks.bench_json --listings 20 100 --iterations 200
+"""
+import argparse
+import json
+import random
+import time
+import zlib
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+def listing_page(count: int, seed: int = 7) -> list:
+    """
+    Rows shaped like select=*,photos(*),regions(*),counties(*).
+    """
+    rng = random.Random(seed)
+    words = "spacious sunny bedsitter apartment balcony parking borehole water gated secure near stage shops".split()
+    rows = []
+    for i in range(count):
+        listing_id = 10_000 + i
+        rows.append({
+            "id": listing_id,
+            "title": f"{rng.choice(['Bedsitter', '1BR', '2BR', '3BR'])} in {rng.choice(['Kilimani', 'Roysambu', 'Kasarani'])}",
+            "description": " ".join(rng.choice(words) for _ in range(90)),
+            "type": rng.choice(["bedsitter", "1BR", "2BR"]),
+            "price": rng.randrange(6_000, 120_000, 500),
+            "region_id": rng.randrange(1, 300),
+            "landlord_id": rng.randrange(1, 5000),
+            "created_at": f"2024-0{rng.randrange(1, 9)}-1{rng.randrange(0, 9)}T10:21:33.512+00:00",
+            "updated_at": f"2024-0{rng.randrange(1, 9)}-1{rng.randrange(0, 9)}T12:00:00.000+00:00",
+            "photos": [
+                {
+                    "id": listing_id * 10 + p,
+                    "listing_id": listing_id,
+                    "url": f"https://project.supabase.co/storage/v1/object/public/photos/{rng.getrandbits(64):016x}_house.jpg",
+                    "variants": {
+                        name: f"https://project.supabase.co/storage/v1/object/public/photos/{rng.getrandbits(64):016x}__{name}.webp"
+                        for name in ("thumb", "medium", "webp")
+                    },
+                }
+                for p in range(rng.randrange(3, 9))
+            ],
+            "regions": {"id": 12, "name": "Kilimani", "county_id": 47},
+            "counties": {"id": 47, "name": "Nairobi"},
+        })
+    return rows
+
+def per_call_ms(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1000
+
+def main(args):
+    from routers import responses
+    from routers.compression import BROTLI_QUALITY, GZIP_LEVEL, brotli
+
+    results = []
+    for count in args.listings:
+        rows = listing_page(count)
+        raw = json.dumps(rows).encode()  # What PostgREST sends
+        fast_body = responses.dumps(rows)
+        result = {
+            "listings": count,
+            "body_bytes": len(fast_body),
+            "encoder": "orjson" if responses.orjson is not None else "json",
+            # FastAPI default: decode the upstream body, jsonable_encoder, json.dumps
+            "default_ms": per_call_ms(lambda: JSONResponse(jsonable_encoder(json.loads(raw))).body, args.iterations),
+            # Default response class, route still returns the dict (jsonable_encoder still runs)
+            "fast_class_ms": per_call_ms(
+                lambda: responses.FastJSONResponse(jsonable_encoder(json.loads(raw))).body, args.iterations
+            ),
+            # Route returns FastJSONResponse itself (what the listing routes do)
+            "fast_direct_ms": per_call_ms(lambda: responses.FastJSONResponse(json.loads(raw)).body, args.iterations),
+            # read_records_raw -> RawJSONResponse
+            "raw_passthrough_ms": per_call_ms(lambda: responses.RawJSONResponse(raw).body, args.iterations),
+        }
+        gzip_body = zlib.compress(fast_body, GZIP_LEVEL)
+        result["gzip_bytes"] = len(gzip_body)
+        result["gzip_ms"] = per_call_ms(lambda: zlib.compress(fast_body, GZIP_LEVEL), args.iterations)
+        if brotli is not None:
+            result["brotli_bytes"] = len(brotli.compress(fast_body, quality=BROTLI_QUALITY))
+            result["brotli_ms"] = per_call_ms(lambda: brotli.compress(fast_body, quality=BROTLI_QUALITY), args.iterations)
+        results.append({key: round(value, 3) if isinstance(value, float) else value for key, value in result.items()})
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, nargs="+", default=[20, 100], help="Listings per page")
+    parser.add_argument("--iterations", type=int, default=200)
+    main(parser.parse_args())
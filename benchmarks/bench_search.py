@@ -0,0 +1,88 @@
+"""
+Benchmark: in-memory listing search index on synthetic listings.
+
+Measures full build time, incremental apply of changed rows and query latency
+for keyword-only and keyword + filter searches.
+
+    python -m benchmarks.bench_search --listings 100000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from routers.search_index import ListingSearchIndex
+
+TYPES = ["bedsitter", "studio", "1BR", "2BR", "3BR", "4BR", "maisonette", "bungalow"]
+PLACES = ["kilimani", "kileleshwa", "westlands", "karen", "lavington", "ruaka", "rongai", "kitengela",
+          "nyali", "bamburi", "milimani", "thika", "juja", "syokimau", "embakasi", "donholm"]
+WORDS = ["spacious", "modern", "cozy", "furnished", "unfurnished", "balcony", "parking", "gym", "pool",
+         "borehole", "secure", "gated", "garden", "sunny", "quiet", "new", "renovated", "tiled", "wifi",
+         "servant", "quarter", "lift", "backup", "generator", "view", "near", "mall", "school", "road"]
+
+def synthetic_listings(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(1, count + 1):
+        place = rng.choice(PLACES)
+        listing_type = rng.choice(TYPES)
+        rows.append({
+            "id": i,
+            "title": f"{rng.choice(WORDS).title()} {listing_type} in {place.title()}",
+            "description": " ".join(rng.choices(WORDS + PLACES, k=rng.randint(8, 30))),
+            "type": listing_type,
+            "price": float(rng.randrange(5000, 400000, 500)),
+            "region_id": rng.randint(1, 300),
+        })
+    return rows
+
+def timed(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p99_ms": round(samples[max(int(len(samples) * 0.99) - 1, 0)] * 1000, 3),
+    }
+
+def main(args):
+    rows = synthetic_listings(args.listings)
+    index = ListingSearchIndex()
+    started = time.perf_counter()
+    index.rebuild(rows)
+    build_seconds = time.perf_counter() - started
+
+    rng = random.Random(11)
+    changed = [dict(rng.choice(rows), price=float(rng.randrange(5000, 400000, 500))) for _ in range(1000)]
+    started = time.perf_counter()
+    index.apply(changed)
+    apply_seconds = time.perf_counter() - started
+
+    regions = set(range(1, 60))
+    report = {
+        "listings": args.listings,
+        "terms": len(index.postings),
+        "build_seconds": round(build_seconds, 3),
+        "apply_1000_changed_rows_ms": round(apply_seconds * 1000, 3),
+        "queries": {
+            "rare_keyword": timed(lambda: index.search("lavington borehole"), args.repeat),
+            "common_keyword": timed(lambda: index.search("spacious modern parking"), args.repeat),
+            "keyword_type_price": timed(
+                lambda: index.search("kilimani balcony", type="2BR", price_min=30000, price_max=80000), args.repeat
+            ),
+            "keyword_regions_price": timed(
+                lambda: index.search("gated garden", region_ids=regions, price_max=60000), args.repeat
+            ),
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=50)
+    main(parser.parse_args())
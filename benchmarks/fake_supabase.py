@@ -0,0 +1,378 @@
+"""
+Local stand-in for the parts of Supabase the routers call, for endpoint benchmarks.
+
+- /rest/v1/{table}: an in-memory PostgREST subset. Supports select with embeds
+  (listings -> photos/regions/counties, saved_listings -> listing:listings),
+  column filters (eq, neq, gt, gte, lt, lte, in, is), or=()/and() groups as built
+  by keyset_filter, order, limit, offset, on_conflict and Prefer return/resolution.
+- /storage/v1/object/{bucket}/{name}: accepts (and discards) uploads.
+- /auth/v1/signup and /auth/v1/token: fake users and HS256 tokens signed with
+  SUPABASE_JWT_SECRET, so the app's own JWT verification accepts them.
+
+Every upstream request is counted (GET /__stats, POST /__reset) and answered
+after --latency-ms (+ up to --jitter-ms).
+
+    python -m benchmarks.fake_supabase --port 54321 --latency-ms 5 --listings 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from jose import jwt
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+WORDS = (
+    "spacious sunny bedsitter apartment balcony parking borehole water gated secure near stage shops "
+    "modern kitchen tiled ensuite garden quiet estate wifi cctv lift rooftop views furnished"
+).split()
+TYPES = ("bedsitter", "1BR", "2BR", "3BR")
+FILTER_OPS = ("eq", "neq", "gt", "gte", "lt", "lte", "in", "is")
+RESERVED_PARAMS = ("select", "order", "limit", "offset", "on_conflict", "columns")
+UNIQUE_KEYS = {"saved_listings": ("user_id", "listing_id")}
+# (table, embed name) -> (kind, local column, target table, target column)
+RELATIONS = {
+    ("listings", "photos"): ("many", "id", "photos", "listing_id"),
+    ("listings", "regions"): ("one", "region_id", "regions", "id"),
+    ("listings", "counties"): ("county", "region_id", "counties", "id"),
+    ("saved_listings", "listings"): ("one", "listing_id", "listings", "id"),
+    ("payments", "listings"): ("one", "listing_id", "listings", "id"),
+    ("photos", "listings"): ("one", "listing_id", "listings", "id"),
+}
+
+# --- Tiny PostgREST query parser ---
+def split_top(text: str, sep: str = ",") -> list:
+    """
+    Split on `sep` outside parentheses and double quotes.
+    """
+    parts, depth, quoted, current = [], 0, False, []
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == sep and depth == 0 and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    if current:
+        parts.append("".join(current))
+    return parts
+
+def sort_key(value):
+    if value is None:
+        return (0, 0, "")
+    if isinstance(value, bool):
+        return (1, int(value), "")
+    try:
+        return (1, float(value), "")
+    except (TypeError, ValueError):
+        return (2, 0, str(value))
+
+def as_text(value) -> str:
+    return json.dumps(value) if isinstance(value, bool) else str(value)
+
+def make_test(op: str, literal: str):
+    """
+    Compile `op.literal` once into a test on a column value.
+    """
+    literal = literal.strip('"')
+    if op == "is":
+        expected = {"null": None, "true": True, "false": False}.get(literal, ...)
+        return lambda actual: actual is expected
+    if op == "in":
+        values = [value.strip().strip('"') for value in split_top(literal.strip("()"))]
+        keys = {sort_key(value) for value in values} | {(3, 0, value) for value in values}
+        return lambda actual: actual is not None and (sort_key(actual) in keys or (3, 0, as_text(actual)) in keys)
+    right = sort_key(literal)
+    if op in ("eq", "neq"):
+        matches = lambda actual: actual is not None and (sort_key(actual) == right or as_text(actual) == literal)
+        return matches if op == "eq" else (lambda actual: not matches(actual))
+    compare = {"gt": tuple.__gt__, "gte": tuple.__ge__, "lt": tuple.__lt__, "lte": tuple.__le__}[op]
+    return lambda actual: actual is not None and compare(sort_key(actual), right)
+
+def condition(text: str):
+    """
+    'col.op.value', 'or(...)' or 'and(...)' -> predicate(row).
+    """
+    for group, combine in (("or(", any), ("and(", all)):
+        if text.startswith(group):
+            parts = [condition(part) for part in split_top(text[len(group):-1])]
+            return lambda row: combine(part(row) for part in parts)
+    column, op, literal = text.split(".", 2)
+    return column_filter(column, f"{op}.{literal}")
+
+def column_filter(column: str, expression: str):
+    if column in ("or", "and"):
+        return condition(f"{column}{expression}")
+    op, _, literal = expression.partition(".")
+    negate = op == "not"
+    if negate:
+        op, _, literal = literal.partition(".")
+    if op not in FILTER_OPS:
+        return lambda row: True
+    test = make_test(op, literal)
+    if negate:
+        return lambda row: not test(row.get(column))
+    return lambda row: test(row.get(column))
+
+def parse_select(select: str) -> tuple:
+    """
+    'id,price,photos(*),listing:listings(*)' -> (columns or None for *, [(alias, table, inner select)])
+    """
+    items = [item.strip() for item in split_top(select or "*")]
+    columns = None if "*" in items else [item for item in items if "(" not in item]
+    embeds = []
+    for item in items:
+        if "(" in item:
+            name, inner = item.split("(", 1)
+            alias, _, table = name.rpartition(":")
+            embeds.append((alias or table, table, inner[:-1]))
+    return columns, embeds
+
+# --- In-memory database ---
+class FakeDatabase:
+    def __init__(self, listings: int = 5000, users: int = 1000, seed: int = 42):
+        self.rng = random.Random(seed)
+        self.tables = defaultdict(dict)  # table -> {id: row}
+        self.next_id = defaultdict(int)
+        self.children = defaultdict(lambda: defaultdict(list))  # (table, column) -> value -> rows
+        self.unique = defaultdict(set)
+        self.seed(listings, users)
+
+    def insert(self, table: str, row: dict) -> dict:
+        if "id" not in row:
+            self.next_id[table] += 1
+            row["id"] = self.next_id[table]
+        elif isinstance(row["id"], int):
+            self.next_id[table] = max(self.next_id[table], row["id"])
+        self.tables[table][row["id"]] = row
+        if table == "photos":
+            self.children[("photos", "listing_id")][row.get("listing_id")].append(row)
+        if table in UNIQUE_KEYS:
+            self.unique[table].add(tuple(str(row.get(column)) for column in UNIQUE_KEYS[table]))
+        return row
+
+    def delete(self, table: str, row: dict):
+        self.tables[table].pop(row["id"], None)
+        if table == "photos":
+            siblings = self.children[("photos", "listing_id")][row.get("listing_id")]
+            if row in siblings:
+                siblings.remove(row)
+        if table in UNIQUE_KEYS:
+            self.unique[table].discard(tuple(str(row.get(column)) for column in UNIQUE_KEYS[table]))
+
+    def seed(self, listings: int, users: int):
+        rng = self.rng
+        for county in range(1, 48):
+            self.insert("counties", {"id": county, "name": f"County {county}"})
+        geo = random.Random(17)  # Separate stream: coordinates don't change the rest of the data
+        centroids = {}
+        for region in range(1, 301):
+            self.insert("regions", {"id": region, "name": f"Region {region}", "county_id": rng.randint(1, 47)})
+            centroids[region] = (-1.286 + geo.uniform(-0.35, 0.35), 36.817 + geo.uniform(-0.35, 0.35))
+        for user in range(1, users + 1):
+            role = "landlord" if user % 5 == 0 else "user"
+            self.insert("users", {"id": user, "email": f"user{user}@example.com", "role": role})
+        started = time.time() - 180 * 86400
+        for listing in range(1, listings + 1):
+            created = started + listing * (180 * 86400 / max(listings, 1))
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(created))
+            row = self.insert("listings", {
+                "id": listing,
+                "title": f"{rng.choice(TYPES)} {' '.join(rng.choice(WORDS) for _ in range(3))}",
+                "type": rng.choice(TYPES),
+                "price": rng.randrange(5000, 150000, 500),
+                "region_id": rng.randint(1, 300),
+                "description": " ".join(rng.choice(WORDS) for _ in range(60)),
+                "created_at": stamp,
+                "updated_at": stamp,
+            })
+            if geo.random() < 0.7:  # The rest fall back to their region's centroid
+                lat, lng = centroids[row["region_id"]]
+                row.update(lat=round(lat + geo.gauss(0, 0.02), 6), lng=round(lng + geo.gauss(0, 0.02), 6))
+            else:
+                row.update(lat=None, lng=None)
+            for _ in range(3):
+                key = uuid.UUID(int=rng.getrandbits(128)).hex
+                self.insert("photos", {
+                    "listing_id": listing,
+                    "url": f"https://fake.supabase.co/storage/v1/object/public/photos/{key}_house.jpg",
+                    "variants": None,
+                })
+        for payment in range(1, users // 2 + 1):
+            self.insert("payments", {
+                "user_id": rng.randint(1, users),
+                "listing_id": rng.randint(1, max(listings, 1)),
+                "amount": 1000,
+                "confirmed": rng.random() < 0.8,
+                "checkout_request_id": f"ws_CO_{payment}",
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()),
+            })
+
+    # --- Queries ---
+    def select(self, table: str, params) -> list:
+        filters = [(column, value) for column, value in params if column not in RESERVED_PARAMS]
+        candidates = self.tables[table].values()
+        for column, value in filters:
+            # Primary-key lookups (id=eq.N / id=in.(...)) skip the table scan
+            if column == "id" and value.startswith(("eq.", "in.")):
+                ids = value[3:].strip("()").split(",")
+                table_rows = self.tables[table]
+                candidates = [table_rows[key] for key in (int(i) if i.strip().isdigit() else i.strip('" ') for i in ids) if key in table_rows]
+                break
+        predicates = [column_filter(column, value) for column, value in filters]
+        rows = [row for row in candidates if all(predicate(row) for predicate in predicates)]
+        order = dict(params).get("order")
+        if order:
+            for term in reversed(order.split(",")):
+                column, *modifiers = term.split(".")
+                descending = "desc" in modifiers
+                rows.sort(key=lambda row: sort_key(row.get(column)), reverse=descending)
+                # PostgreSQL default: NULLs sort as the largest value
+                nulls_first = "nullsfirst" in modifiers or (descending and "nullslast" not in modifiers)
+                rows.sort(key=lambda row: (row.get(column) is None) != nulls_first)
+        offset = int(dict(params).get("offset", 0))
+        limit = dict(params).get("limit")
+        return rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+
+    def render(self, table: str, rows: list, select: str) -> list:
+        columns, embeds = parse_select(select)
+        rendered = []
+        for row in rows:
+            out = dict(row) if columns is None else {column: row.get(column) for column in columns}
+            for alias, target, inner in embeds:
+                out[alias] = self.embed(table, row, target, inner)
+            rendered.append(out)
+        return rendered
+
+    def embed(self, table: str, row: dict, target: str, inner: str):
+        relation = RELATIONS.get((table, target))
+        if relation is None:
+            return None
+        kind, local, target_table, target_column = relation
+        if kind == "many":
+            children = self.children[(target_table, target_column)].get(row.get(local), [])
+            return self.render(target_table, children, inner)
+        if kind == "county":
+            region = self.tables["regions"].get(row.get(local))
+            county = self.tables["counties"].get(region["county_id"]) if region else None
+            return self.render(target_table, [county], inner)[0] if county else None
+        related = self.tables[target_table].get(row.get(local))
+        if related is None and row.get(local) is not None:
+            related = self.tables[target_table].get(int(row[local])) if str(row[local]).isdigit() else None
+        return self.render(target_table, [related], inner)[0] if related else None
+
+# --- HTTP app ---
+def create_app(db: FakeDatabase, latency: float = 0.0, jitter: float = 0.0, jwt_secret: str = "bench-secret"):
+    calls = Counter()
+
+    async def delay():
+        if latency or jitter:
+            await asyncio.sleep(latency + random.random() * jitter)
+
+    async def rest(request: Request):
+        table = request.path_params["table"]
+        calls[f"{request.method} /rest/v1/{table}"] += 1
+        await delay()
+        params = list(request.query_params.multi_items())
+        prefer = request.headers.get("prefer", "")
+        wants_rows = "return=representation" in prefer
+        if request.method == "GET":
+            rows = db.select(table, params)
+            return Response(json.dumps(db.render(table, rows, request.query_params.get("select", "*"))),
+                            media_type="application/json")
+        if request.method == "POST":
+            body = json.loads(await request.body() or b"[]")
+            created = []
+            for row in body if isinstance(body, list) else [body]:
+                if table in UNIQUE_KEYS:
+                    key = tuple(str(row.get(column)) for column in UNIQUE_KEYS[table])
+                    if key in db.unique[table]:
+                        if "ignore-duplicates" in prefer:
+                            continue
+                        return JSONResponse({"code": "23505", "message": "duplicate key"}, status_code=409)
+                created.append(db.insert(table, dict(row)))
+            return JSONResponse(created if wants_rows else None, status_code=201)
+        rows = db.select(table, params)
+        if request.method == "PATCH":
+            changes = json.loads(await request.body() or b"{}")
+            for row in rows:
+                row.update(changes)
+            return JSONResponse(rows) if wants_rows else Response(status_code=204)
+        if request.method == "DELETE":
+            for row in rows:
+                db.delete(table, row)
+            return JSONResponse(rows) if wants_rows else Response(status_code=204)
+        return Response(status_code=405)
+
+    async def storage(request: Request):
+        calls[f"{request.method} /storage/v1/object"] += 1
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+        await delay()
+        return JSONResponse({"Key": request.path_params["path"], "size": size})
+
+    async def signup(request: Request):
+        calls["POST /auth/v1/signup"] += 1
+        await delay()
+        body = await request.json()
+        return JSONResponse({"user": {"id": str(uuid.uuid4()), "email": body.get("email")}})
+
+    async def token(request: Request):
+        calls["POST /auth/v1/token"] += 1
+        await delay()
+        body = await request.json()
+        user_id = str(abs(hash(body.get("email"))) % 1000 + 1)
+        claims = {"sub": user_id, "email": body.get("email"), "role": "authenticated", "exp": int(time.time()) + 3600}
+        return JSONResponse({
+            "access_token": jwt.encode(claims, jwt_secret, algorithm="HS256"),
+            "token_type": "bearer",
+            "expires_in": 3600,
+        })
+
+    async def stats(request: Request):
+        return JSONResponse({"total": sum(calls.values()), "by_route": dict(calls)})
+
+    async def reset(request: Request):
+        calls.clear()
+        return JSONResponse({"ok": True})
+
+    return Starlette(routes=[
+        Route("/rest/v1/{table}", rest, methods=["GET", "POST", "PATCH", "DELETE"]),
+        Route("/storage/v1/object/{path:path}", storage, methods=["POST", "PUT"]),
+        Route("/auth/v1/signup", signup, methods=["POST"]),
+        Route("/auth/v1/token", token, methods=["POST"]),
+        Route("/__stats", stats, methods=["GET"]),
+        Route("/__reset", reset, methods=["POST"]),
+    ])
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Added to every upstream call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency, 0..jitter")
+    parser.add_argument("--listings", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--jwt-secret", default=os.getenv("SUPABASE_JWT_SECRET", "bench-secret"))
+    args = parser.parse_args(argv)
+    app = create_app(
+        FakeDatabase(args.listings, args.users), args.latency_ms / 1000, args.jitter_ms / 1000, args.jwt_secret
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
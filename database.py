@@ -1,6 +1,9 @@
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 import httpx
+from resilience import CircuitBreaker, UpstreamUnavailable, backoff_delay
 
 # --- Load environment variables for all database/Supabase config ---
 load_dotenv()
@@ -9,6 +12,40 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "listing-photos")  # Default bucket if not set
 
+# --- Connection pool tuning (all optional) ---
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "100"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "false").lower() in ("1", "true", "yes")
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+
+# --- Per-operation deadlines in seconds, retries included (override with e.g. SUPABASE_TIMEOUT_READ=3) ---
+SUPABASE_TIMEOUTS = {
+    operation: float(os.getenv(f"SUPABASE_TIMEOUT_{operation.upper()}", default))
+    for operation, default in {
+        "read": "10",
+        "create": "15",
+        "update": "15",
+        "delete": "15",
+        "auth": "15",
+        "storage": "60",
+    }.items()
+}
+
+# --- Retries and hedging (idempotent reads only) ---
+SUPABASE_READ_RETRIES = int(os.getenv("SUPABASE_READ_RETRIES", "2"))  # Extra attempts after a failed read
+SUPABASE_RETRY_BACKOFF = float(os.getenv("SUPABASE_RETRY_BACKOFF", "0.05"))  # Base of the jittered exponential backoff
+SUPABASE_RETRY_BACKOFF_MAX = float(os.getenv("SUPABASE_RETRY_BACKOFF_MAX", "1"))
+SUPABASE_HEDGE_AFTER = float(os.getenv("SUPABASE_HEDGE_AFTER", "0"))  # Send a duplicate read after this many seconds (0 = off)
+RETRYABLE_STATUSES = (502, 503, 504)
+
+# --- Circuit breaker (fail fast while Supabase is unhealthy) ---
+SUPABASE_BREAKER = os.getenv("SUPABASE_BREAKER", "true").lower() in ("1", "true", "yes")
+SUPABASE_BREAKER_WINDOW = float(os.getenv("SUPABASE_BREAKER_WINDOW", "10"))
+SUPABASE_BREAKER_MIN_FAILURES = int(os.getenv("SUPABASE_BREAKER_MIN_FAILURES", "10"))
+SUPABASE_BREAKER_RATIO = float(os.getenv("SUPABASE_BREAKER_RATIO", "0.5"))  # Failed share of calls in the window that opens it
+SUPABASE_BREAKER_COOLDOWN = float(os.getenv("SUPABASE_BREAKER_COOLDOWN", "15"))  # Seconds open before a probe is let through
+
 # --- Helper: Standard headers for Supabase HTTP requests ---
 def get_supabase_headers():
     return {
@@ -17,9 +54,181 @@ def get_supabase_headers():
         "Content-Type": "application/json"
     }
 
-# --- Optional: Shared HTTP client ---
-# Use 'await client.aclose()' at shutdown if you leverage this singleton
-client = httpx.AsyncClient()
+# --- Shared, pooled HTTP gateway to Supabase (REST, Auth and Storage) ---
+class SupabaseGateway:
+    """
+    One pooled httpx.AsyncClient for every call to Supabase.
+    Started and closed by the FastAPI lifespan in main.py; created lazily
+    if used outside the app (scripts, benchmarks).
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = SUPABASE_MAX_CONNECTIONS,
+        max_keepalive: int = SUPABASE_MAX_KEEPALIVE,
+        keepalive_expiry: float = SUPABASE_KEEPALIVE_EXPIRY,
+        http2: bool = SUPABASE_HTTP2,
+        connect_timeout: float = SUPABASE_CONNECT_TIMEOUT,
+        timeouts: dict = None,
+        read_retries: int = SUPABASE_READ_RETRIES,
+        hedge_after: float = SUPABASE_HEDGE_AFTER,
+        breaker: CircuitBreaker = None,
+    ):
+        self.base_url = (base_url or "").rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.connect_timeout = connect_timeout
+        self.timeouts = dict(SUPABASE_TIMEOUTS if timeouts is None else timeouts)
+        self.read_retries = read_retries
+        self.hedge_after = hedge_after
+        self.breaker = breaker if breaker is not None else CircuitBreaker(
+            "Supabase",
+            window=SUPABASE_BREAKER_WINDOW,
+            min_failures=SUPABASE_BREAKER_MIN_FAILURES,
+            failure_ratio=SUPABASE_BREAKER_RATIO,
+            cooldown=SUPABASE_BREAKER_COOLDOWN,
+            enabled=SUPABASE_BREAKER,
+        )
+        self.retries = 0
+        self.hedges = 0
+        self.observers = []  # Called as fn(method, path, operation, status, bytes, seconds) after every call
+        self._client = None
+
+    async def start(self):
+        self.client  # Opens the pool if it isn't open yet
+        return self
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                http2=self.http2,
+                timeout=self.timeout("read"),
+            )
+        return self._client
+
+    def deadline(self, operation: str) -> float:
+        """
+        Seconds an operation ('read', 'create', 'update', 'delete', 'auth', 'storage') may take, retries included.
+        """
+        return self.timeouts.get(operation, self.timeouts.get("read", 10.0))
+
+    def timeout(self, operation: str, remaining: float = None) -> httpx.Timeout:
+        total = self.deadline(operation) if remaining is None else remaining
+        return httpx.Timeout(total, connect=min(self.connect_timeout, total))
+
+    async def request(self, method: str, path: str, operation: str, headers: dict = None, **kwargs) -> httpx.Response:
+        """
+        Send a request to `path` (e.g. '/rest/v1/listings?select=*') on the shared pool.
+        The whole call, retries included, must finish within the operation's deadline.
+        Reads (GET, operation 'read') are retried on connection errors, timeouts and
+        502/503/504 with jittered backoff, and hedged if SUPABASE_HEDGE_AFTER is set.
+        Writes are sent once. Raises UpstreamUnavailable (503) when the breaker is open
+        or Supabase could not be reached in time.
+        """
+        if headers is None:
+            headers = get_supabase_headers()
+        idempotent = method == "GET" and operation == "read"
+        attempts = 1 + (self.read_retries if idempotent else 0)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline(operation)
+        for attempt in range(attempts):
+            self.breaker.allow()
+            remaining = deadline - loop.time()
+            try:
+                if idempotent and self.hedge_after > 0:
+                    resp = await self._hedged(method, path, operation, headers, remaining, **kwargs)
+                else:
+                    resp = await self._send(method, path, operation, headers, remaining, **kwargs)
+            except httpx.TransportError as e:  # Includes timeouts
+                self.breaker.record(False)
+                error = e
+            else:
+                self.breaker.record(resp.status_code < 500)
+                if not idempotent or resp.status_code not in RETRYABLE_STATUSES or attempt == attempts - 1:
+                    return resp
+                error = None
+            delay = backoff_delay(attempt, SUPABASE_RETRY_BACKOFF, SUPABASE_RETRY_BACKOFF_MAX)
+            if attempt == attempts - 1 or loop.time() + delay >= deadline:
+                break
+            self.retries += 1
+            await asyncio.sleep(delay)
+        if error is None:
+            return resp
+        if isinstance(error, httpx.TimeoutException):
+            raise UpstreamUnavailable(f"Supabase {operation} timed out.") from error
+        raise UpstreamUnavailable(f"Supabase {operation} failed: {error.__class__.__name__}.") from error
+
+    async def _send(self, method: str, path: str, operation: str, headers: dict, remaining: float, **kwargs) -> httpx.Response:
+        """
+        One attempt, cut off when the deadline passes.
+        """
+        started = time.perf_counter()
+        status, size = "error", 0
+        try:
+            if remaining <= 0:
+                raise httpx.TimeoutException(f"Supabase {operation} deadline exceeded")
+            try:
+                resp = await asyncio.wait_for(
+                    self.client.request(method, path, headers=headers, timeout=self.timeout(operation, remaining), **kwargs),
+                    remaining,
+                )
+            except asyncio.TimeoutError:
+                raise httpx.TimeoutException(f"Supabase {operation} deadline exceeded") from None
+            status, size = resp.status_code, len(resp.content)
+            return resp
+        finally:
+            if self.observers:
+                elapsed = time.perf_counter() - started
+                for observer in self.observers:
+                    observer(method, path, operation, status, size, elapsed)
+
+    async def _hedged(self, method: str, path: str, operation: str, headers: dict, remaining: float, **kwargs) -> httpx.Response:
+        """
+        Send the read; if it hasn't answered after `hedge_after` seconds send a duplicate
+        and take whichever good response comes first (the other is cancelled).
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + remaining
+        first = asyncio.ensure_future(self._send(method, path, operation, headers, remaining, **kwargs))
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=min(self.hedge_after, remaining))
+            if done:
+                return first.result()
+            self.hedges += 1
+            second = asyncio.ensure_future(self._send(method, path, operation, headers, deadline - loop.time(), **kwargs))
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRYABLE_STATUSES:
+                        return task.result()
+            # Both failed: prefer a response over an exception
+            for task in (second, first):
+                if task.exception() is None:
+                    return task.result()
+            return second.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {**self.breaker.stats(), "retries": self.retries, "hedges": self.hedges}
+
+gateway = SupabaseGateway(SUPABASE_URL)
 
 # --- Usage Docs (for teammate or future you) ---
 """
@@ -30,10 +239,17 @@ from database import (
     SUPABASE_KEY,
     SUPABASE_BUCKET,
     get_supabase_headers,
-    client,
+    gateway,
 )
 
 - Use SUPABASE_URL, SUPABASE_KEY, etc. where you need URLs or keys.
 - Use get_supabase_headers() to get standard headers for all httpx calls to Supabase.
-- Use 'client' for making async HTTP calls if you want to re-use connections (optional).
+- Use 'gateway.request(method, path, operation, ...)' for every call to Supabase so
+  connections are re-used. Never open a new httpx.AsyncClient per request.
+- Pool size, keep-alive, HTTP/2 and timeouts come from the SUPABASE_MAX_CONNECTIONS,
+  SUPABASE_MAX_KEEPALIVE, SUPABASE_KEEPALIVE_EXPIRY, SUPABASE_HTTP2 and
+  SUPABASE_TIMEOUT_<OPERATION> environment variables.
+- Reads are retried (SUPABASE_READ_RETRIES) and optionally hedged (SUPABASE_HEDGE_AFTER);
+  writes never are. While Supabase keeps failing the breaker (SUPABASE_BREAKER_*) makes
+  calls raise UpstreamUnavailable (503 + Retry-After) at once instead of waiting.
 """
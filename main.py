@@ -1,13 +1,46 @@
 from dotenv import load_dotenv
 load_dotenv()  # This must come first!
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from database import gateway
 from routers import all_routers
+from routers.cache import cache_stats, warm_reference_caches
+from routers.listing_feed import listing_feed
+from routers.photos import UploadSizeMiddleware
+from routers.imaging import start_image_pool, shutdown_image_pool
+from routers.licensing import warm_license_state
+from routers.mpesa_journal import mpesa_journal
+from routers.responses import FastJSONResponse
+from routers.compression import CompressionMiddleware
+from routers.metrics import TimingMiddleware, render_metrics
+from routers.ratelimit import RateLimitMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled Supabase client per worker, opened at startup and closed at shutdown
+    await gateway.start()
+    await warm_reference_caches()
+    await warm_license_state()
+    # Keeps the in-memory listing indexes (search) in sync in the background
+    listing_feed.start()
+    # Worker processes for photo thumbnails/WebP renditions (no-op without Pillow)
+    start_image_pool()
+    # Applies journaled M-PESA callbacks to payments in the background
+    mpesa_journal.start()
+    yield
+    await mpesa_journal.stop()
+    shutdown_image_pool()
+    await listing_feed.stop()
+    await gateway.close()
 
 app = FastAPI(
     title="KejaHunt API",
     description="FastAPI backend for KejaHunt property listing and landlord services, powered by Supabase.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,  # orjson when installed
 )
 
 # CORS setup: allow frontend to access API
@@ -18,6 +51,14 @@ origins = [
     "https://your-frontend-domain.com",  # Production frontend domain (replace with real domain)
 ]
 
+# Per-client rate limits (429) and per-route-class concurrency budgets (503), inside CORS
+# so rejections still carry CORS headers
+app.add_middleware(RateLimitMiddleware)
+
+# Reject oversized photo uploads from the Content-Length header, before the body is read;
+# also inside CORS so the 413 carries CORS headers
+app.add_middleware(UploadSizeMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,       # Allowed frontend origins
@@ -26,6 +67,12 @@ app.add_middleware(
     allow_headers=["*"],         # Allow all headers
 )
 
+# Request timing, upstream breakdown (Server-Timing header) and /metrics histograms
+app.add_middleware(TimingMiddleware)
+
+# gzip/brotli for JSON, NDJSON and text bodies of COMPRESS_MIN_BYTES or more
+app.add_middleware(CompressionMiddleware)
+
 # Include all routers from routers/__init__.py
 for router in all_routers:
     app.include_router(router)
@@ -33,3 +80,17 @@ for router in all_routers:
 @app.get("/")
 async def root():
     return {"msg": "Welcome to the KejaHunt API"}
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Hit/miss counters for the in-process caches.
+    """
+    return cache_stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus text format: request/upstream latency histograms and cache stats.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
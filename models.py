@@ -47,6 +47,7 @@ class ListingCreate(ListingBase):
 class ListingResponse(ListingBase):
     id: int
     photos: Optional[list] = None
+    updated_at: Optional[str] = None  # Bumped by the listings_set_updated_at trigger
 
 # --- Photo Schemas ---
 class PhotoBase(BaseModel):
@@ -65,6 +66,7 @@ class PaymentBase(BaseModel):
     listing_id: int
     amount: float
     confirmed: bool = False
+    checkout_request_id: Optional[str] = None  # M-PESA CheckoutRequestID of the STK push; callbacks match on it
 
 class PaymentCreate(PaymentBase):
     pass
@@ -0,0 +1,135 @@
+import math
+import random
+import time
+from collections import deque
+from fastapi import HTTPException
+
+# --- Errors surfaced to clients ---
+class UpstreamUnavailable(HTTPException):
+    """
+    Supabase is failing, too slow, or the circuit breaker is open.
+    A 503 with Retry-After; routers re-raise it like any other HTTPException.
+    """
+
+    def __init__(self, detail: str = "Supabase is unavailable, try again shortly.", retry_after: float = 1.0):
+        super().__init__(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        self.retry_after = retry_after
+
+# --- Retry backoff ---
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    "Full jitter": uniform in [0, min(cap, base * 2**attempt)], so retries from
+    many workers after the same blip don't arrive in lock-step.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    """
+    Closed: calls go through; outcomes are counted in one-second buckets over `window` seconds.
+    Opens when at least `min_failures` calls failed and they are `failure_ratio` or more of
+    the window. Open: calls fail fast with UpstreamUnavailable for `cooldown` seconds.
+    Half-open: one probe call per `probe_interval`; a success closes the breaker, a failure
+    re-opens it.
+    Single event loop per worker, so no locks.
+    """
+    STATES = ("closed", "half_open", "open")
+
+    def __init__(
+        self,
+        name: str,
+        window: float = 10.0,
+        min_failures: int = 10,
+        failure_ratio: float = 0.5,
+        cooldown: float = 15.0,
+        probe_interval: float = 1.0,
+        enabled: bool = True,
+    ):
+        self.name = name
+        self.window = window
+        self.min_failures = min_failures
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.probe_interval = probe_interval
+        self.enabled = enabled
+        self.state = "closed"
+        self.opened_at = None
+        self.last_probe = 0.0
+        self._buckets = deque()  # [second, successes, failures]
+        self.opened = 0
+        self.rejected = 0
+
+    def _bucket(self, now: float) -> list:
+        second = int(now)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        return self._buckets[-1]
+
+    def retry_after(self, now: float = None) -> float:
+        if self.opened_at is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(self.cooldown - (now - self.opened_at), self.probe_interval)
+
+    def allow(self):
+        """
+        Call before each upstream call; raises UpstreamUnavailable when load is being shed.
+        """
+        if not self.enabled or self.state == "closed":
+            return
+        now = time.monotonic()
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open" and now - self.last_probe >= self.probe_interval:
+            self.last_probe = now
+            return
+        self.rejected += 1
+        raise UpstreamUnavailable(f"{self.name} is unavailable, try again shortly.", self.retry_after(now))
+
+    def record(self, ok: bool):
+        now = time.monotonic()
+        if self.state != "closed":
+            if ok:
+                self.reset()
+            else:
+                self._open(now)
+            return
+        bucket = self._bucket(now)
+        bucket[1 if ok else 2] += 1
+        if not ok:
+            failures = sum(b[2] for b in self._buckets)
+            total = failures + sum(b[1] for b in self._buckets)
+            if failures >= self.min_failures and failures >= self.failure_ratio * total:
+                self._open(now)
+
+    def _open(self, now: float):
+        if self.state != "open":
+            self.opened += 1
+        self.state = "open"
+        self.opened_at = now
+        self._buckets.clear()
+
+    def reset(self):
+        self.state = "closed"
+        self.opened_at = None
+        self._buckets.clear()
+
+    def stats(self) -> dict:
+        successes = sum(b[1] for b in self._buckets)
+        failures = sum(b[2] for b in self._buckets)
+        return {
+            "state": self.state,
+            "state_code": self.STATES.index(self.state),  # 0 closed, 1 half-open, 2 open
+            "enabled": self.enabled,
+            "window_successes": successes,
+            "window_failures": failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 1) if self.state != "closed" else 0,
+        }
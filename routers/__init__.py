@@ -7,7 +7,8 @@ from .favourites import router as favourites_router
 from .counties import router as counties_router
 from .auth import router as auth_router
 
-# Note: crud.py provides helpers, not a router, so do NOT include it in the list below!
+# Note: crud.py and the other helper modules (cache.py, coalesce.py, listing_feed.py, search_index.py, ...)
+# provide helpers, not routers, so do NOT include them in the list below!
 
 all_routers = [
     regions_router,
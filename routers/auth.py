@@ -1,19 +1,32 @@
-from fastapi import APIRouter, HTTPException, Request, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Request, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from .crud import read_records, create_record
+from .crud import read_records, create_record, iter_records
+from .mailer import BulkMailer
+from .cache import CACHES, TTLCache
+from .coalesce import coalesced_read_records
+from .licensing import license_state
+from database import gateway
+import hashlib
 import os
-import httpx
+import time
 from datetime import datetime, timedelta
+from typing import Optional
 from dotenv import load_dotenv
-from jose import jwt
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+from jose import jwt, JWTError
+from fastapi_mail import ConnectionConfig
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-SUPABASE_AUTH_URL = f"{SUPABASE_URL}/auth/v1"
+SUPABASE_AUTH_PATH = "/auth/v1"
 SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+# Key rotation: tokens signed with any of these (comma-separated) are still accepted
+SUPABASE_JWT_PREVIOUS_SECRETS = [
+    secret.strip() for secret in os.getenv("SUPABASE_JWT_PREVIOUS_SECRETS", "").split(",") if secret.strip()
+]
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+JWT_CACHE_MAX_TTL = float(os.getenv("JWT_CACHE_MAX_TTL", "300"))  # Upper bound, entries also expire at the token's exp
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
 SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 SMTP_HOST = os.getenv("SMTP_HOST")
@@ -37,13 +50,6 @@ router = APIRouter(
 
 security = HTTPBearer()
 
-def get_supabase_headers():
-    return {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/json"
-    }
-
 @router.post("/register")
 async def register(payload: dict):
     """
@@ -58,23 +64,25 @@ async def register(payload: dict):
     if role not in ["landlord", "user"]:
         raise HTTPException(status_code=400, detail="Role must be 'landlord' or 'user'.")
     # Register in Supabase Auth
-    url = f"{SUPABASE_AUTH_URL}/signup"
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(url, headers=get_supabase_headers(), json={"email": email, "password": password})
-        if resp.status_code not in (200, 201):
-            raise HTTPException(status_code=resp.status_code, detail=resp.text)
-        user_info = resp.json()
-        user_id = user_info.get("user", {}).get("id")
-        # Register in users table with helper
-        if user_id:
-            try:
-                await create_record("users", {
-                    "id": user_id,
-                    "email": email,
-                    "role": role
-                })
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=str(e))
+    resp = await gateway.request(
+        "POST", f"{SUPABASE_AUTH_PATH}/signup", "auth", json={"email": email, "password": password}
+    )
+    if resp.status_code not in (200, 201):
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    user_info = resp.json()
+    user_id = user_info.get("user", {}).get("id")
+    # Register in users table with helper
+    if user_id:
+        try:
+            await create_record("users", {
+                "id": user_id,
+                "email": email,
+                "role": role
+            })
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
     return {"msg": "Registration successful.", "user": user_info}
 
 @router.post("/login")
@@ -88,96 +96,217 @@ async def login(payload: dict):
     if not email or not password:
         raise HTTPException(status_code=400, detail="Email and password are required.")
 
-    url = f"{SUPABASE_AUTH_URL}/token?grant_type=password"
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(url, headers=get_supabase_headers(), json={"email": email, "password": password})
-        if resp.status_code != 200:
-            raise HTTPException(status_code=resp.status_code, detail=resp.text)
-        data = resp.json()
+    resp = await gateway.request(
+        "POST", f"{SUPABASE_AUTH_PATH}/token?grant_type=password", "auth", json={"email": email, "password": password}
+    )
+    if resp.status_code != 200:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    data = resp.json()
     return {"msg": "Login successful.", "auth": data}
 
-def verify_jwt_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# --- JWT verification with a cache of validated claims ---
+jwt_secrets = [secret for secret in [SUPABASE_JWT_SECRET] + SUPABASE_JWT_PREVIOUS_SECRETS if secret]
+token_cache = TTLCache("verified_tokens", maxsize=JWT_CACHE_SIZE, ttl=JWT_CACHE_MAX_TTL)
+
+class AuthTimer:
+    """
+    Time spent verifying bearer tokens (shown under 'jwt_verification' in /cache/stats).
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        CACHES["jwt_verification"] = self
+
+    def record(self, seconds: float):
+        self.requests += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "avg_us": round(self.total_seconds / self.requests * 1e6, 1) if self.requests else None,
+            "max_us": round(self.max_seconds * 1e6, 1),
+        }
+
+auth_timer = AuthTimer()
+
+def set_jwt_secrets(current: str, previous: list = ()):
+    """
+    Swap signing secrets at runtime (key rotation). Cached claims are dropped.
+    """
+    jwt_secrets[:] = [secret for secret in [current, *previous] if secret]
+    token_cache.clear()
+
+def decode_token(token: str) -> dict:
+    """
+    Full signature + claims check, trying the current secret first, then previous ones.
+    """
+    error = None
+    for secret in jwt_secrets:
+        try:
+            return jwt.decode(token, secret, algorithms=["HS256"])
+        except JWTError as e:
+            error = e
+    raise error or JWTError("No JWT secret configured")
+
+def verify_token(token: str) -> dict:
+    """
+    Validated claims for `token`, from the cache when this token was verified before.
+    Entries are keyed by a SHA-256 digest of the token and expire at its `exp`.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(key)
+    if claims is not None:
+        if claims.get("exp") is None or claims["exp"] > time.time():
+            return claims
+        token_cache.pop(key)
+    claims = decode_token(token)
+    exp = claims.get("exp")
+    token_cache.set(key, claims, ttl=min(JWT_CACHE_MAX_TTL, exp - time.time()) if exp is not None else None)
+    return claims
+
+def verify_jwt_token(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
     Verifies Supabase JWT for protected routes.
     """
-    token = credentials.credentials
+    started = time.perf_counter()
     try:
-        payload = jwt.decode(token, SUPABASE_JWT_SECRET, algorithms=["HS256"])
+        payload = verify_token(credentials.credentials)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid authentication token.")
+    finally:
+        elapsed = time.perf_counter() - started
+        auth_timer.record(elapsed)
+        request.state.auth_seconds = elapsed
     return payload
 
-@router.get("/me")
-async def get_user_me(user=Depends(verify_jwt_token)):
+# --- Current user: profile loaded at most once per request, cached per user ---
+profile_cache = TTLCache("user_profiles", maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+async def load_profile(user_id) -> Optional[dict]:
     """
-    Returns authenticated user's info and role.
+    The user's row (email, role) from the short-TTL profile cache or the users table.
+    Unknown users are not cached.
     """
-    user_id = user.get("sub")
+    key = str(user_id)
+    profile = profile_cache.get(key)
+    if profile is None:
+        rows = await coalesced_read_records("users", f"id=eq.{user_id}", "email,role")
+        profile = rows[0] if rows else None
+        if profile is not None:
+            profile_cache.set(key, profile)
+    return profile
+
+def invalidate_profile(user_id):
+    """
+    Call after changing or deleting a user so the next request sees the new profile.
+    """
+    profile_cache.pop(str(user_id))
+
+async def get_current_user(claims=Depends(verify_jwt_token)) -> dict:
+    """
+    Dependency: { "id", "claims", "profile" } for the authenticated caller.
+    FastAPI caches it per request, so routes and sub-dependencies share one lookup.
+    """
+    user_id = claims.get("sub")
     try:
-        profile = await read_records("users", f"id=eq.{user_id}", "email,role")
-        return {"user": user, "profile": profile[0] if profile else None}
-    except Exception as e:
+        profile = await load_profile(user_id)
+    except HTTPException as he:
+        raise he
+    except Exception:
         raise HTTPException(status_code=500, detail="Could not retrieve user info")
+    return {"id": user_id, "claims": claims, "profile": profile}
+
+@router.get("/me")
+async def get_user_me(user=Depends(get_current_user)):
+    """
+    Returns authenticated user's info and role.
+    """
+    return {"user": user["claims"], "profile": user["profile"]}
 
 # LANDLORD LISTING LICENSE CHECK (helper for listings.py etc)
 async def check_landlord_can_list(user_id):
-    now = datetime.utcnow()
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    try:
-        payments = await read_records(
-            "payments",
-            f"user_id=eq.{user_id}&confirmed=eq.true&created_at=gte.{month_start.isoformat()}",
-        )
-        if not payments:
-            raise HTTPException(
-                status_code=402,
-                detail="Renew your monthly landlord license/payment to list houses."
+    """
+    Raises 402 unless the landlord has a confirmed payment this month.
+    Answered from the in-memory license state; the payments table is only
+    queried when the state has no license for this landlord.
+    """
+    if license_state.is_licensed(user_id):
+        return
+    if license_state.needs_db_check(user_id):
+        now = datetime.utcnow()
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        try:
+            payments = await read_records(
+                "payments",
+                f"user_id=eq.{user_id}&confirmed=eq.true&created_at=gte.{month_start.isoformat()}",
+                "id,created_at",
             )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        for payment in payments:
+            license_state.record_payment(user_id, payment["created_at"])
+        if payments:
+            return
+        license_state.mark_unlicensed(user_id)
+    raise HTTPException(
+        status_code=402,
+        detail="Renew your monthly landlord license/payment to list houses."
+    )
 
 # === AUTOMATED EMAIL REMINDER ===
+REMINDER_SUBJECT = "Renew your KejaHunt monthly listing license"
+REMINDER_BODY = (
+    "Dear Landlord,\n\n"
+    "Your monthly listing license is about to expire. Please pay your listing fee to continue posting properties on KejaHunt. If you've already paid, you can ignore this message!\n\n"
+    "Thank you for using KejaHunt."
+)
+
 async def get_landlords_needing_payment_reminder():
+    """
+    Emails of landlords with no confirmed payment this month (only during the last week).
+    Two bulk queries (landlords, this month's confirmed payers) and an in-memory anti-join.
+    """
+    now = datetime.utcnow()
+    if now.day <= 23:  # Remind during last week
+        return []
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
     try:
-        landlords = await read_records("users", "role=eq.landlord", "id,email")
+        paid = set()
+        async for chunk in iter_records(
+            "payments",
+            f"confirmed=eq.true&created_at=gte.{month_start.isoformat()}&created_at=lt.{next_month_start.isoformat()}",
+            "id,user_id",
+        ):
+            paid.update(str(payment["user_id"]) for payment in chunk)
         reminder_list = []
-        now = datetime.utcnow()
-        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        next_month_start = (month_start + timedelta(days=32)).replace(day=1)
-        for landlord in landlords:
-            user_id = landlord["id"]
-            payments = await read_records(
-                "payments",
-                f"user_id=eq.{user_id}&confirmed=eq.true&created_at=gte.{month_start.isoformat()}&created_at=lt.{next_month_start.isoformat()}"
-            )
-            if not payments and now.day > 23:  # Remind during last week
-                reminder_list.append(landlord["email"])
+        async for chunk in iter_records("users", "role=eq.landlord", "id,email"):
+            reminder_list.extend(landlord["email"] for landlord in chunk if str(landlord["id"]) not in paid)
         return reminder_list
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def send_reminder_email(recipient_email, fm: FastMail):
-    subject = "Renew your KejaHunt monthly listing license"
-    body = (
-        "Dear Landlord,\n\n"
-        "Your monthly listing license is about to expire. Please pay your listing fee to continue posting properties on KejaHunt. If you've already paid, you can ignore this message!\n\n"
-        "Thank you for using KejaHunt."
-    )
-    message = MessageSchema(
-        subject=subject,
-        recipients=[recipient_email],
-        body=body,
-        subtype="plain"
-    )
-    await fm.send_message(message)
-
 @router.post("/send_landlord_payment_reminders")
-async def run_landlord_reminder_emails(background_tasks: BackgroundTasks):
+async def run_landlord_reminder_emails():
     """
     Call this endpoint (manually, with a scheduler, or a CRON job) to send payment reminders.
+    Reports delivery counts, failures and throughput for the run.
     """
     emails = await get_landlords_needing_payment_reminder()
-    fm = FastMail(conf)
-    for email in emails:
-        background_tasks.add_task(send_reminder_email, email, fm)
-    return {"success": True, "emails_sent": emails}
+    if not emails:
+        return {"success": True, "emails_sent": [], "stats": None}
+    stats = await BulkMailer.from_config(conf).send(emails, REMINDER_SUBJECT, REMINDER_BODY)
+    failed = set(stats["failed"])
+    return {
+        "success": not failed,
+        "emails_sent": [email for email in emails if email not in failed],
+        "stats": stats,
+    }
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from .crud import read_records
+from .conditional import rows_fingerprint
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "3600"))  # Counties/regions change a few times a year
+REFERENCE_CACHE_MIN_RELOAD = float(os.getenv("REFERENCE_CACHE_MIN_RELOAD", "10"))  # Throttle reloads on unknown ids
+
+# Every cache registers here so hit/miss counters can be exposed in one place (see /cache/stats)
+CACHES = {}
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+# --- Bounded LRU cache with per-entry expiry ---
+class TTLCache:
+    """
+    Small LRU cache: at most `maxsize` entries, each expiring after its own TTL.
+    Not shared between workers; values must be safe to hand to several requests.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 60.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        CACHES[name] = self
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+# --- Whole-table snapshot for small reference tables ---
+class ReferenceTable:
+    """
+    In-memory copy of a small, rarely changing table (counties, regions).
+    Loaded at startup, reloaded after `ttl` seconds or after invalidate().
+    Reads never go upstream while the snapshot is fresh.
+    """
+
+    def __init__(self, table: str, ttl: float = REFERENCE_CACHE_TTL, min_reload: float = REFERENCE_CACHE_MIN_RELOAD):
+        self.table = table
+        self.ttl = ttl
+        self.min_reload = min_reload
+        self.rows = []
+        self.by_id = {}
+        self.loaded_at = None
+        self.version = 0  # Bumped on every reload
+        self.fingerprint = None  # Digest of row ids/versions: same data -> same value in every worker
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self._lock = asyncio.Lock()
+        CACHES[table] = self
+
+    def age(self) -> float:
+        return float("inf") if self.loaded_at is None else time.monotonic() - self.loaded_at
+
+    def is_fresh(self) -> bool:
+        return self.age() < self.ttl
+
+    async def load(self):
+        rows = await read_records(self.table)
+        self.rows = rows
+        self.by_id = {row["id"]: row for row in rows}
+        self.fingerprint = rows_fingerprint(rows)
+        self.loaded_at = time.monotonic()
+        self.version += 1
+        self.loads += 1
+        return rows
+
+    async def _ensure_fresh(self):
+        if self.is_fresh():
+            self.hits += 1
+            return
+        async with self._lock:
+            # Another request may have reloaded while we waited for the lock
+            if self.is_fresh():
+                self.hits += 1
+                return
+            self.misses += 1
+            await self.load()
+
+    async def all(self) -> list:
+        await self._ensure_fresh()
+        return self.rows
+
+    async def get(self, row_id):
+        """
+        Row by id, or None. An unknown id triggers at most one reload per `min_reload`
+        seconds, so rows added by another worker show up without hammering Supabase.
+        """
+        await self._ensure_fresh()
+        row = self.by_id.get(row_id)
+        if row is None and self.age() >= self.min_reload:
+            async with self._lock:
+                if self.age() >= self.min_reload:
+                    self.misses += 1
+                    await self.load()
+            row = self.by_id.get(row_id)
+        return row
+
+    async def find(self, **fields) -> list:
+        """
+        Rows whose fields equal the given values (compared as text, like PostgREST `eq.`).
+        """
+        rows = await self.all()
+        wanted = {key: str(value) for key, value in fields.items()}
+        return [row for row in rows if all(str(row.get(key)) == value for key, value in wanted.items())]
+
+    def invalidate(self):
+        """
+        Drop freshness so the next read reloads (call after writes to the table).
+        """
+        self.loaded_at = None
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self.rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "version": self.version,
+            "fresh": self.is_fresh(),
+        }
+
+counties_cache = ReferenceTable("counties")
+regions_cache = ReferenceTable("regions")
+
+async def warm_reference_caches():
+    """
+    Load counties and regions at startup. Failures are logged, not fatal:
+    the caches load lazily on first use instead.
+    """
+    for cache in (counties_cache, regions_cache):
+        try:
+            await cache.load()
+        except Exception as e:
+            logger.warning("Could not warm %s cache: %s", cache.table, e)
@@ -0,0 +1,67 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from .crud import read_records
+from .cache import CACHES, TTLCache
+
+load_dotenv()
+
+READ_REUSE_WINDOW = float(os.getenv("READ_REUSE_WINDOW", "0"))  # Seconds to reuse a coalesced result; 0 = off
+
+# --- Singleflight: one upstream call per key, shared by every concurrent caller ---
+class Singleflight:
+    """
+    Concurrent calls with the same key share one in-flight task and its result
+    (or exception). The shared task is shielded, so one caller disconnecting
+    does not cancel the request for everyone else.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self.calls = 0     # Upstream calls actually made
+        self.shared = 0    # Callers that joined an in-flight call
+        CACHES[name] = self
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved even if every caller went away
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "upstream_calls": self.calls, "shared": self.shared}
+
+read_flight = Singleflight("read_singleflight")
+recent_reads = TTLCache("read_reuse", maxsize=2048, ttl=READ_REUSE_WINDOW)
+
+_MISSING = object()
+
+async def coalesced_read_records(table: str, query: str = "", select: str = "*", reuse_for: float = None):
+    """
+    Drop-in for read_records() that coalesces identical concurrent reads, keyed by
+    (table, query, select). With a reuse window (`reuse_for` or READ_REUSE_WINDOW)
+    the result is also served to identical reads for that many seconds.
+    The returned list is shared between callers: do not mutate it.
+    """
+    key = (table, query, select)
+    window = READ_REUSE_WINDOW if reuse_for is None else reuse_for
+    if window > 0:
+        cached = recent_reads.get(key, _MISSING)
+        if cached is not _MISSING:
+            return cached
+    result = await read_flight.do(key, lambda: read_records(table, query, select))
+    if window > 0:
+        recent_reads.set(key, result, ttl=window)
+    return result
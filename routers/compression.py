@@ -0,0 +1,140 @@
+import asyncio
+import os
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from dotenv import load_dotenv
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: gzip only without it
+    brotli = None
+
+load_dotenv()
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))  # Smaller bodies are sent as is
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))  # 4-5 compresses better than gzip -6 at similar CPU
+COMPRESS_IN_THREAD_BYTES = 256 * 1024  # Larger chunks are compressed off the event loop
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+def choose_encoding(accept_encoding: str):
+    """
+    'br' or 'gzip' from an Accept-Encoding header (brotli preferred when installed), else None.
+    """
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(coding.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+class Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """
+        Compress a chunk; non-final chunks are flushed so streamed rows reach the client.
+        """
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+    async def compress_async(self, data: bytes, final: bool) -> bytes:
+        if len(data) >= COMPRESS_IN_THREAD_BYTES:
+            return await asyncio.to_thread(self.compress, data, final)
+        return self.compress(data, final)
+
+def mark_encoded(headers: MutableHeaders):
+    """
+    Vary: Accept-Encoding and a weak ETag for a response whose bytes depend on the negotiated encoding.
+    """
+    headers.add_vary_header("Accept-Encoding")
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+# --- Negotiated response compression (ASGI middleware) ---
+class CompressionMiddleware:
+    """
+    Compresses JSON/NDJSON/text responses of at least `minimum_size` bytes with
+    brotli or gzip, whichever the client accepts (streamed responses chunk by chunk).
+    Compressed responses get Vary: Accept-Encoding and a weak ETag, since the
+    bytes differ from the identity representation the strong ETag names; a 304 to a
+    client that negotiated an encoding gets the same two headers, so revalidation
+    sees the validator the compressed 200 carried.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "").lower()
+                passthrough = (
+                    "content-encoding" in headers
+                    or message["status"] in (204, 206, 304)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if message["status"] == 304:
+                    mark_encoded(MutableHeaders(raw=message["headers"]))
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message  # Held until the first body chunk shows the size
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if len(body) < self.minimum_size and not more_body:
+                    await send(start)
+                    await send(message)
+                    passthrough = True
+                    return
+                compressor = Compressor(encoding)
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoding
+                mark_encoded(headers)
+                body = await compressor.compress_async(body, final=not more_body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+            else:
+                body = await compressor.compress_async(body, final=not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
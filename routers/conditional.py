@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+from fastapi import Request, Response
+from .responses import FastJSONResponse, RawJSONResponse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REFERENCE_CACHE_CONTROL = os.getenv("REFERENCE_CACHE_CONTROL", "public, max-age=300")
+LISTINGS_CACHE_CONTROL = os.getenv("LISTINGS_CACHE_CONTROL", "public, no-cache")  # Always revalidate; 304s keep it cheap
+PRIVATE_CACHE_CONTROL = "private, no-cache"  # Responses that depend on the caller (e.g. is_favourite)
+
+# --- Strong ETags: decoded rows by their versions, raw pass-through bodies by their bytes ---
+def row_version(row: dict, version_column: str = "updated_at"):
+    """
+    What identifies this version of a row: its version column, else the whole row.
+    """
+    version = row.get(version_column)
+    if version is None:
+        return json.dumps(row, sort_keys=True, default=str)
+    return version
+
+def rows_fingerprint(rows: list, version_column: str = "updated_at", nested: tuple = ()) -> str:
+    """
+    Digest of (id, version) for every row, plus the ids and versions of embedded
+    rows named in `nested` (e.g. "photos"). Same rows in the same order -> same digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        digest.update(repr((row.get("id"), row_version(row, version_column))).encode())
+        for name in nested:
+            for child in row.get(name) or ():
+                digest.update(repr((name, child.get("id"), row_version(child, version_column))).encode())
+    return digest.hexdigest()
+
+def bytes_fingerprint(body: bytes) -> str:
+    """
+    For bodies passed through undecoded: hashing the bytes is cheaper than parsing them
+    to read row versions, and PostgREST serializes the same rows to the same bytes.
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def make_etag(*parts) -> str:
+    """
+    Strong ETag over a fingerprint and whatever else shapes the response (filters, options).
+    """
+    return '"' + hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    If-None-Match handling (RFC 9110: weak comparison, '*' matches anything).
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in header.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+def not_modified(request: Request, etag: str, cache_control: str):
+    """
+    The 304 for a client that already has this version, else None.
+    """
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    return None
+
+def conditional_response(request: Request, etag: str, cache_control: str, content) -> Response:
+    """
+    304 when the client already has this version, else the content as JSON
+    (bytes are sent as already-encoded JSON). Both carry ETag and Cache-Control.
+    """
+    response = not_modified(request, etag, cache_control)
+    if response is not None:
+        return response
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if isinstance(content, bytes):
+        return RawJSONResponse(content, headers=headers)
+    return FastJSONResponse(content, headers=headers)
@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException
-from .crud import read_records, create_record
+from fastapi import APIRouter, HTTPException, Request
+from .crud import create_record
+from .cache import counties_cache
+from .conditional import REFERENCE_CACHE_CONTROL, conditional_response, make_etag
 
 COUNTIES_TABLE = "counties"
 
@@ -9,28 +11,35 @@ router = APIRouter(
 )
 
 @router.get("/")
-async def get_counties():
+async def get_counties(request: Request):
     """
-    Get all counties in Kenya.
+    Get all counties in Kenya (served from the in-memory reference cache).
+    Sends an ETag; If-None-Match with the current one gets a 304.
     """
     try:
-        counties = await read_records(COUNTIES_TABLE)
-        return counties
+        counties = await counties_cache.all()
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    etag = make_etag(COUNTIES_TABLE, counties_cache.fingerprint)
+    return conditional_response(request, etag, REFERENCE_CACHE_CONTROL, counties)
 
 @router.get("/{county_id}")
-async def get_county(county_id: int):
+async def get_county(county_id: int, request: Request):
     """
-    Get details for a single county by ID.
+    Get details for a single county by ID (with an ETag, like the list).
     """
     try:
-        result = await read_records(COUNTIES_TABLE, f"id=eq.{county_id}")
-        if not result:
-            raise HTTPException(status_code=404, detail="County not found.")
-        return result[0]
+        result = await counties_cache.get(county_id)
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not result:
+        raise HTTPException(status_code=404, detail="County not found.")
+    etag = make_etag(COUNTIES_TABLE, counties_cache.fingerprint, county_id)
+    return conditional_response(request, etag, REFERENCE_CACHE_CONTROL, result)
 
 @router.post("/")
 async def add_county(payload: dict):
@@ -42,11 +51,12 @@ async def add_county(payload: dict):
     if not name:
         raise HTTPException(status_code=400, detail="County name required.")
     try:
-        # Optionally check for duplicates before adding
-        dups = await read_records(COUNTIES_TABLE, f"name=eq.{name}")
+        # Duplicate check is answered from the reference cache
+        dups = await counties_cache.find(name=name)
         if dups:
             raise HTTPException(status_code=409, detail="County name already exists.")
         await create_record(COUNTIES_TABLE, {"name": name})
+        counties_cache.invalidate()
         return {"success": True, "msg": "County added successfully."}
     except HTTPException as he:
         raise he
@@ -1,69 +1,120 @@
-import httpx
-import os
-from dotenv import load_dotenv
+from typing import Union
+from urllib.parse import quote
+from database import RETRYABLE_STATUSES, gateway, get_supabase_headers
+from resilience import UpstreamUnavailable
 
-load_dotenv()
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-
-def get_supabase_headers():
-    return {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/json"
-    }
+def _check(resp, ok: tuple, action: str):
+    """
+    Raise for a non-success PostgREST response; gateway errors (502/503/504) become
+    UpstreamUnavailable (503) so clients know to retry.
+    """
+    if resp.status_code in ok:
+        return
+    if resp.status_code in RETRYABLE_STATUSES:
+        raise UpstreamUnavailable(f"{action} failed: Supabase returned {resp.status_code}.")
+    raise Exception(f"{action} failed: {resp.status_code} - {resp.text}")
 
-async def create_record(table: str, data: dict):
+async def create_record(table: str, data: Union[dict, list], on_conflict: str = None):
     """
     Create a new record in the specified Supabase table.
+    Pass a list of dicts to insert many rows in one request (bulk insert).
+    With `on_conflict` (comma-separated unique columns) rows that already exist are
+    skipped instead of failing (upsert, ignore duplicates).
+    Returns the created rows (skipped duplicates are not included).
     """
-    url = f"{SUPABASE_URL}/rest/v1/{table}"
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(url, headers=get_supabase_headers(), json=data)
-    if resp.status_code not in (200, 201):
-        raise Exception(f"Create failed: {resp.status_code} - {resp.text}")
+    headers = get_supabase_headers()
+    headers["Prefer"] = "return=representation"
+    path = f"/rest/v1/{table}"
+    if on_conflict:
+        headers["Prefer"] = "resolution=ignore-duplicates,return=representation"
+        path += f"?on_conflict={on_conflict}"
+    resp = await gateway.request("POST", path, "create", headers=headers, json=data)
+    _check(resp, (200, 201), "Create")
     return resp.json()
 
+async def _read(table: str, query: str, select: str):
+    path = f"/rest/v1/{table}?select={select}"
+    if query:
+        path += f"&{query}"
+    resp = await gateway.request("GET", path, "read")
+    _check(resp, (200,), "Read")
+    return resp
+
 async def read_records(table: str, query: str = "", select: str = "*"):
     """
     Read records from the specified Supabase table.
     `query` example: 'county_id=eq.2', 'role=eq.landlord'
     `select` example: 'id,email,role'
     """
-    url = f"{SUPABASE_URL}/rest/v1/{table}?select={select}"
-    if query:
-        url += f"&{query}"
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers=get_supabase_headers())
-    if resp.status_code != 200:
-        raise Exception(f"Read failed: {resp.status_code} - {resp.text}")
-    return resp.json()
+    return (await _read(table, query, select)).json()
 
-async def update_record(table: str, query: str, data: dict):
+async def read_records_raw(table: str, query: str = "", select: str = "*") -> bytes:
+    """
+    Like read_records(), but returns the JSON array exactly as PostgREST sent it.
+    For routes that pass rows through unchanged (no decode/re-encode).
+    """
+    return (await _read(table, query, select)).content
+
+async def update_record(table: str, query: str, data: dict, return_rows: bool = False):
     """
     Update records in the specified Supabase table.
     `query` example: 'id=eq.7'
+    With `return_rows=True` the updated rows are returned instead of True.
     """
-    url = f"{SUPABASE_URL}/rest/v1/{table}?{query}"
     headers = get_supabase_headers()
     headers["Prefer"] = "resolution=merge-duplicates"
-    async with httpx.AsyncClient() as client:
-        resp = await client.patch(url, headers=headers, json=data)
-    if resp.status_code not in (200, 204):
-        raise Exception(f"Update failed: {resp.status_code} - {resp.text}")
-    return True
+    if return_rows:
+        headers["Prefer"] += ",return=representation"
+    resp = await gateway.request("PATCH", f"/rest/v1/{table}?{query}", "update", headers=headers, json=data)
+    _check(resp, (200, 204), "Update")
+    return resp.json() if return_rows else True
 
-async def delete_record(table: str, query: str):
+async def delete_record(table: str, query: str, return_rows: bool = False):
     """
     Delete records from the specified Supabase table.
     `query` example: 'id=eq.17'
+    With `return_rows=True` the deleted rows are returned instead of True
+    (an empty list means nothing matched).
     """
-    url = f"{SUPABASE_URL}/rest/v1/{table}?{query}"
     headers = get_supabase_headers()
     headers["Prefer"] = "return=representation"
-    async with httpx.AsyncClient() as client:
-        resp = await client.delete(url, headers=headers)
-    if resp.status_code not in (200, 204):
-        raise Exception(f"Delete failed: {resp.status_code} - {resp.text}")
+    resp = await gateway.request("DELETE", f"/rest/v1/{table}?{query}", "delete", headers=headers)
+    _check(resp, (200, 204), "Delete")
+    if return_rows:
+        return resp.json() if resp.content else []
     return True
+
+async def iter_records(table: str, query: str = "", select: str = "*", chunk_size: int = 1000):
+    """
+    Async generator over a (possibly huge) table in chunks of `chunk_size` rows.
+    Pages by keyset on `id` (never offset), so every chunk costs the same.
+    `select` must include `id`.
+    """
+    last_id = None
+    while True:
+        filters = [query] if query else []
+        if last_id is not None:
+            filters.append(f"id=gt.{last_id}")
+        filters += ["order=id.asc", f"limit={chunk_size}"]
+        chunk = await read_records(table, "&".join(filters), select)
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1]["id"]
+
+def keyset_filter(column: str, descending: bool, value, last_id: int, nulls_last: bool = False) -> str:
+    """
+    PostgREST filter for rows strictly after (value, last_id) in (column, id) order.
+    Use with `order={column}.asc,id.asc` (or .desc for both). With `nulls_last`
+    (order `{column}.asc.nullslast` / `.desc.nullslast`) rows whose column is NULL
+    follow all others, by id; a NULL `value` means the walk is already among them.
+    """
+    op = "lt" if descending else "gt"
+    last_id = int(last_id)
+    if value is None:
+        return f"and=({column}.is.null,id.{op}.{last_id})"
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    literal = quote(f'"{escaped}"', safe="")  # Quoted so timestamps with ':' and '+' survive
+    nulls = f",{column}.is.null" if nulls_last else ""
+    return f"or=({column}.{op}.{literal},and({column}.eq.{literal},id.{op}.{last_id}){nulls})"
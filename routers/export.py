@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from .crud import iter_records
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))  # Rows held in memory at once
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+def _ndjson_chunk(rows: list) -> bytes:
+    return "".join(json.dumps(row, default=str) + "\n" for row in rows).encode()
+
+def export_columns(select: str) -> list:
+    """
+    Output columns of a PostgREST select, in order: 'id,listing:listings(id,title),photos(*)'
+    -> ['id', 'listing', 'photos']. Exports list their columns, so '*' is not accepted.
+    """
+    columns, depth, current = [], 0, []
+    for char in select + ",":
+        if char == "," and depth == 0:
+            name = "".join(current).split("(")[0].split(":")[0].strip()
+            if not name or name == "*":
+                raise ValueError(f"Export select must name its columns: {select!r}")
+            columns.append(name)
+            current = []
+            continue
+        depth += (char == "(") - (char == ")")
+        current.append(char)
+    return columns
+
+def _csv_field(value) -> str:
+    """
+    NULL is an empty field and an empty string is "", so the two stay apart; booleans
+    are true/false and embedded objects/arrays JSON text, as in the NDJSON export.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        text = "true" if value else "false"
+    elif isinstance(value, (dict, list)):
+        text = json.dumps(value, default=str)
+    else:
+        text = str(value)
+    if not text or any(char in text for char in ',"\r\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+def _csv_chunk(rows: list, columns: list, header: bool) -> bytes:
+    lines = [",".join(_csv_field(column) for column in columns)] if header else []
+    lines += [",".join(_csv_field(row.get(column)) for column in columns) for row in rows]
+    return "".join(line + "\r\n" for line in lines).encode()
+
+async def export_response(table: str, query: str, select: str, format: str, filename: str) -> StreamingResponse:
+    """
+    Stream every row of `table` matching `query` as NDJSON or CSV.
+    `select` names the columns; they are the CSV header whatever the rows hold.
+    Rows are fetched EXPORT_CHUNK_SIZE at a time, so memory stays flat however big the export.
+    The first chunk is fetched before responding, so upstream errors still return a 500.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}.")
+    columns = export_columns(select)
+    chunks = iter_records(table, query, select, EXPORT_CHUNK_SIZE)
+    try:
+        first = await anext(chunks, [])
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def body():
+        chunk, header = first, True
+        try:
+            while True:
+                if format == "ndjson":
+                    yield _ndjson_chunk(chunk)
+                else:
+                    yield _csv_chunk(chunk, columns, header)
+                    header = False
+                chunk = await anext(chunks, None)
+                if chunk is None:
+                    return
+        except Exception as e:
+            # Headers are already sent; the client sees a truncated file
+            logger.error("Export of %s aborted: %s", table, e)
+            raise
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
@@ -1,14 +1,59 @@
 from fastapi import APIRouter, HTTPException, Query
-from .crud import read_records, create_record, delete_record
+from pydantic import BaseModel
+from typing import List
+from .crud import read_records, read_records_raw, create_record, delete_record
+from .responses import RawJSONResponse
+from .cache import TTLCache
+from .validation import validate_references, invalid_references
+import asyncio
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
 
 FAVOURITES_TABLE = "saved_listings"
 LISTINGS_TABLE = "listings"
+FAVOURITES_UNIQUE = "user_id,listing_id"  # Unique constraint the upserts resolve against
+FAVOURITE_IDS_CACHE_SIZE = int(os.getenv("FAVOURITE_IDS_CACHE_SIZE", "10000"))
+# Per worker: writes update this worker's cached set at once, other workers see them within the TTL
+FAVOURITE_IDS_TTL = float(os.getenv("FAVOURITE_IDS_TTL", "30"))
+FAVOURITES_SYNC_MAX = int(os.getenv("FAVOURITES_SYNC_MAX", "500"))  # Listing ids per sync call
 
 router = APIRouter(
     prefix="/favourites",
     tags=["favourites"]
 )
 
+# --- Per-user set of favourited listing ids (for marking hearts in feeds) ---
+favourite_ids_cache = TTLCache("favourite_ids", maxsize=FAVOURITE_IDS_CACHE_SIZE, ttl=FAVOURITE_IDS_TTL)
+
+async def favourite_ids(user_id) -> frozenset:
+    """
+    Listing ids the user has favourited: one narrow read, then served from cache.
+    """
+    key = str(user_id)
+    ids = favourite_ids_cache.get(key)
+    if ids is None:
+        rows = await read_records(FAVOURITES_TABLE, f"user_id=eq.{user_id}", "listing_id")
+        ids = frozenset(row["listing_id"] for row in rows)
+        favourite_ids_cache.set(key, ids)
+    return ids
+
+def update_favourite_ids(user_id, added=(), removed=()):
+    """
+    Apply a write to the cached set (if the user has one); sets are replaced, never mutated.
+    """
+    key = str(user_id)
+    ids = favourite_ids_cache.get(key)
+    if ids is not None:
+        favourite_ids_cache.set(key, (ids | frozenset(added)) - frozenset(removed))
+
+def mark_favourites(listings: list, ids: frozenset) -> list:
+    """
+    Copies of `listings` with `is_favourite` set from the user's favourite ids.
+    """
+    return [{**listing, "is_favourite": listing.get("id") in ids} for listing in listings]
+
 @router.get("/")
 async def get_favourites(
     user_id: int = Query(..., description="User ID to fetch favourites for")
@@ -18,34 +63,60 @@ async def get_favourites(
     """
     select = f"*,listing:{LISTINGS_TABLE}(*)"
     try:
-        favourites = await read_records(FAVOURITES_TABLE, f"user_id=eq.{user_id}", select)
-        return favourites
+        return RawJSONResponse(await read_records_raw(FAVOURITES_TABLE, f"user_id=eq.{user_id}", select))
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/ids")
+async def get_favourite_ids(
+    user_id: int = Query(..., description="User ID to fetch favourite listing ids for")
+):
+    """
+    Just the ids of the listings a user has favourited (cached per user).
+    """
+    try:
+        ids = await favourite_ids(user_id)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"user_id": user_id, "listing_ids": sorted(ids)}
+
+class FavouriteCreate(BaseModel):
+    user_id: int
+    listing_id: int
+
+class FavouritesSync(BaseModel):
+    user_id: int
+    add: List[int] = []
+    remove: List[int] = []
+
 @router.post("/")
-async def add_favourite(payload: dict):
+async def add_favourite(payload: FavouriteCreate):
     """
     Save (favourite) a listing for a user.
-    Prevents duplicates.
+    Idempotent: one upsert that skips an existing favourite, so double-taps are safe.
     Payload must contain `user_id` and `listing_id`.
     """
-    user_id = payload.get("user_id")
-    listing_id = payload.get("listing_id")
+    user_id, listing_id = payload.user_id, payload.listing_id
     if not user_id or not listing_id:
         raise HTTPException(status_code=400, detail="user_id and listing_id required")
+    await validate_references(user_id=user_id, listing_id=listing_id)
 
     try:
-        # Check for existing favourite to prevent duplicates
-        dups = await read_records(FAVOURITES_TABLE, f"user_id=eq.{user_id}&listing_id=eq.{listing_id}")
-        if dups:
-            raise HTTPException(status_code=409, detail="Listing is already in favourites.")
-        await create_record(FAVOURITES_TABLE, payload)
-        return {"success": True, "msg": "Favourite added."}
+        created = await create_record(
+            FAVOURITES_TABLE, {"user_id": user_id, "listing_id": listing_id}, on_conflict=FAVOURITES_UNIQUE
+        )
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    update_favourite_ids(user_id, added=[listing_id])
+    if not created:
+        return {"success": True, "created": False, "msg": "Listing is already in favourites."}
+    return {"success": True, "created": True, "msg": "Favourite added."}
 
 @router.delete("/")
 async def remove_favourite(
@@ -53,17 +124,63 @@ async def remove_favourite(
 ):
     """
     Remove (un-favourite) a specific listing for a user.
+    One conditional delete; 404 if nothing was deleted.
     """
     if not user_id or not listing_id:
         raise HTTPException(status_code=400, detail="user_id and listing_id required")
     try:
-        # Confirm it exists first
-        dups = await read_records(FAVOURITES_TABLE, f"user_id=eq.{user_id}&listing_id=eq.{listing_id}")
-        if not dups:
-            raise HTTPException(status_code=404, detail="Favourite not found.")
-        await delete_record(FAVOURITES_TABLE, f"user_id=eq.{user_id}&listing_id=eq.{listing_id}")
-        return {"success": True, "msg": "Favourite removed."}
+        deleted = await delete_record(
+            FAVOURITES_TABLE, f"user_id=eq.{user_id}&listing_id=eq.{listing_id}", return_rows=True
+        )
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    update_favourite_ids(user_id, removed=[listing_id])
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Favourite not found.")
+    return {"success": True, "msg": "Favourite removed."}
+
+@router.post("/sync")
+async def sync_favourites(payload: FavouritesSync):
+    """
+    Push a batch of favourite changes from the app in one call.
+    Payload: { "user_id": ..., "add": [listing ids], "remove": [listing ids] }
+    Adds are one bulk upsert, removes one bulk delete; both run concurrently.
+    An id in both lists is treated as added.
+    """
+    user_id = payload.user_id
+    add = list(dict.fromkeys(payload.add))
+    remove = [listing_id for listing_id in dict.fromkeys(payload.remove) if listing_id not in add]
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id required")
+    if len(add) + len(remove) > FAVOURITES_SYNC_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {FAVOURITES_SYNC_MAX} listing ids per sync.")
+
+    await validate_references(user_id=user_id)
+    invalid = await invalid_references("listing_id", add)
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid listing_id: {', '.join(map(str, invalid))}")
+
+    async def no_rows():
+        return []
+
+    try:
+        created, deleted = await asyncio.gather(
+            create_record(
+                FAVOURITES_TABLE,
+                [{"user_id": user_id, "listing_id": listing_id} for listing_id in add],
+                on_conflict=FAVOURITES_UNIQUE,
+            ) if add else no_rows(),
+            delete_record(
+                FAVOURITES_TABLE,
+                f"user_id=eq.{user_id}&listing_id=in.({','.join(map(str, remove))})",
+                return_rows=True,
+            ) if remove else no_rows(),
+        )
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    update_favourite_ids(user_id, added=add, removed=remove)
+    return {"success": True, "added": len(created), "removed": len(deleted)}
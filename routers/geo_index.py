@@ -0,0 +1,164 @@
+import math
+import os
+import time
+import numpy as np
+from dotenv import load_dotenv
+from .cache import CACHES, regions_cache
+from .listing_snapshot import ListingSnapshot, listing_snapshot, number
+
+load_dotenv()
+
+GEO_CELL_KM = float(os.getenv("GEO_CELL_KM", "2"))  # Grid cell edge (north-south); about the typical search radius
+GEO_MAX_RADIUS_KM = float(os.getenv("GEO_MAX_RADIUS_KM", "50"))
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def haversine_km(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+# --- Grid index over listing positions ---
+class GeoIndex:
+    """
+    Listing positions bucketed into a lat/lng grid of GEO_CELL_KM cells.
+    Cells are numbered row-major, so the cells of one grid row that a search circle
+    overlaps are a single range of the sorted keys: a query is a few searchsorted calls,
+    then vectorized haversine distances over the candidates only.
+    Positions come from the optional `lat`/`lng` columns of the listing snapshot;
+    listings without them are placed at their region's centroid. Re-sorted whenever
+    the snapshot changes.
+    """
+
+    def __init__(self, snapshot: ListingSnapshot, cell_km: float = GEO_CELL_KM):
+        self.snapshot = snapshot
+        self.cell = cell_km / KM_PER_DEGREE  # Degrees, same size for lat and lng
+        self.columns = math.ceil(360 / self.cell) + 1
+        self.reindexes = 0
+        self.reindex_ms = 0.0
+        # Effective positions (own, else region centroid) and the grid, rebuilt by reindex()
+        self.lat = np.empty(0)
+        self.lng = np.empty(0)
+        self.sorted_keys = np.empty(0, dtype=np.int64)
+        self.order = np.empty(0, dtype=np.int64)
+        snapshot.listeners.append(self.reindex)
+
+    def region_centroids(self) -> tuple:
+        """
+        (sorted region ids, lat, lng): the region row's own coordinates where it has
+        them, otherwise the mean position of its listings that have coordinates.
+        """
+        snapshot = self.snapshot
+        own = ~np.isnan(snapshot.lat) & ~np.isnan(snapshot.lng) & (snapshot.region >= 0)
+        regions, inverse = np.unique(snapshot.region[own], return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(regions))
+        centroids = dict(zip(
+            regions.tolist(),
+            zip((np.bincount(inverse, snapshot.lat[own], len(regions)) / counts).tolist(),
+                (np.bincount(inverse, snapshot.lng[own], len(regions)) / counts).tolist()),
+        ))
+        for row in regions_cache.rows:
+            lat, lng = number(row, "lat"), number(row, "lng")
+            if not (math.isnan(lat) or math.isnan(lng)):
+                centroids[row["id"]] = (lat, lng)
+        region_ids = np.fromiter(centroids, dtype=np.int64, count=len(centroids))
+        order = np.argsort(region_ids)
+        lats = np.fromiter((lat for lat, _ in centroids.values()), dtype=np.float64, count=len(centroids))
+        lngs = np.fromiter((lng for _, lng in centroids.values()), dtype=np.float64, count=len(centroids))
+        return region_ids[order], lats[order], lngs[order]
+
+    def cell_keys(self, lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+        rows = np.floor((lat + 90) / self.cell).astype(np.int64)
+        columns = np.floor((lng + 180) / self.cell).astype(np.int64)
+        return rows * self.columns + columns
+
+    def reindex(self):
+        started = time.perf_counter()
+        region = self.snapshot.region
+        lat, lng = self.snapshot.lat.copy(), self.snapshot.lng.copy()
+        missing = (np.isnan(lat) | np.isnan(lng)) & (region >= 0)
+        if missing.any():
+            region_ids, region_lat, region_lng = self.region_centroids()
+            if len(region_ids):
+                slot = np.minimum(np.searchsorted(region_ids, region[missing]), len(region_ids) - 1)
+                found = region_ids[slot] == region[missing]
+                rows = np.flatnonzero(missing)[found]
+                lat[rows] = region_lat[slot[found]]
+                lng[rows] = region_lng[slot[found]]
+        self.lat, self.lng = lat, lng
+        located = np.flatnonzero(~np.isnan(lat) & ~np.isnan(lng))
+        keys = self.cell_keys(lat[located], lng[located])
+        order = np.argsort(keys, kind="stable")
+        self.sorted_keys = keys[order]
+        self.order = located[order]
+        self.reindexes += 1
+        self.reindex_ms = (time.perf_counter() - started) * 1000
+
+    def candidates(self, lat: float, lng: float, radius_km: float) -> np.ndarray:
+        """
+        Rows in the grid cells overlapping the circle's bounding box.
+        """
+        dlat = radius_km / KM_PER_DEGREE
+        dlng = min(radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)), 180.0)
+        row_lo, row_hi = (int((min(max(value, -90.0), 90.0) + 90) // self.cell) for value in (lat - dlat, lat + dlat))
+        col_lo, col_hi = (int((min(max(value, -180.0), 180.0) + 180) // self.cell) for value in (lng - dlng, lng + dlng))
+        rows = np.arange(row_lo, row_hi + 1, dtype=np.int64) * self.columns
+        starts = np.searchsorted(self.sorted_keys, rows + col_lo, side="left")
+        ends = np.searchsorted(self.sorted_keys, rows + col_hi, side="right")
+        return np.concatenate([self.order[start:end] for start, end in zip(starts.tolist(), ends.tolist())] or [self.order[:0]])
+
+    def nearby(
+        self,
+        lat: float,
+        lng: float,
+        radius_km: float,
+        region_ids: set = None,
+        type: str = None,
+        price_min: float = None,
+        price_max: float = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> tuple:
+        """
+        Listings within `radius_km` of (lat, lng) passing the filters, nearest first (ties by id).
+        Returns (total matches, [(listing_id, distance_km, approximate), ...] for the requested page);
+        `approximate` means the listing was placed at its region's centroid.
+        """
+        snapshot = self.snapshot
+        snapshot.refresh()  # Region centroids may have changed
+        rows = self.candidates(lat, lng, radius_km)
+        if type is not None:
+            rows = rows[snapshot.type[rows] == snapshot.type_code(type, add=False)]
+        if region_ids is not None:
+            rows = rows[np.isin(snapshot.region[rows], np.fromiter(region_ids, dtype=np.int64, count=len(region_ids)))]
+        if price_min is not None:
+            rows = rows[snapshot.price[rows] >= price_min]
+        if price_max is not None:
+            rows = rows[snapshot.price[rows] <= price_max]
+        distances = haversine_km(lat, lng, self.lat[rows], self.lng[rows])
+        inside = distances <= radius_km
+        rows, distances = rows[inside], distances[inside]
+        total = len(rows)
+        end = min(offset + limit, total)
+        if end < total:
+            # Only the first `end` need sorting; include every row tied with the cut-off distance
+            cutoff = np.partition(distances, end - 1)[end - 1] if end else -1.0
+            keep = distances <= cutoff
+            rows, distances = rows[keep], distances[keep]
+        ranked = rows[np.lexsort((snapshot.ids[rows], distances))[offset:end]]
+        approximate = np.isnan(snapshot.lat[ranked]) | np.isnan(snapshot.lng[ranked])
+        distances = haversine_km(lat, lng, self.lat[ranked], self.lng[ranked])
+        return total, list(zip(snapshot.ids[ranked].tolist(), np.round(distances, 3).tolist(), approximate.tolist()))
+
+    def stats(self) -> dict:
+        return {
+            "located": len(self.order),
+            "exact": int(np.count_nonzero(~np.isnan(self.snapshot.lat) & ~np.isnan(self.snapshot.lng))),
+            "cell_km": round(self.cell * KM_PER_DEGREE, 3),
+            "reindexes": self.reindexes,
+            "reindex_ms": round(self.reindex_ms, 2),
+        }
+
+geo_index = GeoIndex(listing_snapshot)
+CACHES["listing_geo"] = geo_index
@@ -0,0 +1,101 @@
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional: without it only originals are stored
+    Image = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(max((os.cpu_count() or 2) - 1, 1))))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+# Variant name -> longest edge in pixels (None keeps the original size). All variants are WebP.
+PHOTO_VARIANTS = {
+    "thumb": 320,
+    "medium": 1024,
+    "webp": None,
+}
+
+_pool = None
+
+def derivatives_enabled() -> bool:
+    return Image is not None and IMAGE_WORKERS > 0
+
+def render_variants(path: str) -> dict:
+    """
+    Runs in a worker process: decode the image at `path` once and encode every
+    variant as WebP. Returns {variant name: bytes}.
+    """
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        rendered = {}
+        for name, edge in PHOTO_VARIANTS.items():
+            variant = image.copy()
+            if edge is not None:
+                variant.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=3.0)
+            buffer = io.BytesIO()
+            variant.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+            rendered[name] = buffer.getvalue()
+    return rendered
+
+def start_image_pool():
+    global _pool
+    if _pool is None and derivatives_enabled():
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _pool
+
+def shutdown_image_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+async def make_variants(path: str) -> dict:
+    """
+    Render all variants of the image file at `path` off the event loop.
+    Returns {} when Pillow is missing or the file is not a readable image.
+    """
+    pool = start_image_pool()
+    if pool is None:
+        return {}
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, render_variants, path)
+    except Exception as e:
+        logger.warning("Could not render photo variants: %s", e)
+        return {}
+
+def variant_filename(filename: str, variant: str) -> str:
+    """
+    Storage name for a variant, next to the original: 'abc_house.jpg' -> 'abc_house__thumb.webp'.
+    """
+    stem = filename.rsplit(".", 1)[0]
+    return f"{stem}__{variant}.webp"
+
+def with_photo_variant(listings: list, variant: str) -> list:
+    """
+    Copies of `listings` whose embedded photos use `variant` as `url` where it exists
+    (the original stays in `original_url`). The input rows are not modified.
+    """
+    if not variant or variant == "original":
+        return listings
+    result = []
+    for listing in listings:
+        photos = listing.get("photos")
+        if photos:
+            photos = [
+                {**photo, "url": photo["variants"][variant], "original_url": photo.get("url")}
+                if (photo.get("variants") or {}).get(variant) else photo
+                for photo in photos
+            ]
+            listing = {**listing, "photos": photos}
+        result.append(listing)
+    return result
@@ -0,0 +1,116 @@
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+from dotenv import load_dotenv
+from .cache import CACHES
+from .crud import iter_records
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PAYMENTS_TABLE = "payments"
+LICENSE_RECHECK_SECONDS = float(os.getenv("LICENSE_RECHECK_SECONDS", "30"))  # How long a "not licensed" answer is trusted
+
+def month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_month_start(moment: datetime) -> datetime:
+    start = month_start(moment)
+    return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+
+def parse_timestamp(value) -> datetime:
+    """
+    PostgREST timestamp (ISO string, with or without offset) -> naive UTC datetime.
+    """
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+# --- Materialized "licensed until" per landlord ---
+class LicenseState:
+    """
+    A confirmed payment made in a month licenses the landlord until the start of
+    the next month. Kept in memory: rebuilt in bulk at startup, updated when a
+    payment is confirmed (PATCH /payments/{id}/confirm or the M-PESA webhook).
+    """
+
+    def __init__(self):
+        self.licensed_until = {}  # str(user_id) -> naive UTC datetime
+        self.checked_unlicensed = {}  # str(user_id) -> monotonic time of the last DB miss
+        self.ready = False
+        self.hits = 0
+        self.fallbacks = 0
+        CACHES["landlord_licenses"] = self
+
+    def record_payment(self, user_id, paid_at):
+        """
+        Extend the landlord's license for the month of a confirmed payment.
+        """
+        key = str(user_id)
+        until = next_month_start(parse_timestamp(paid_at))
+        if until > self.licensed_until.get(key, datetime.min):
+            self.licensed_until[key] = until
+        self.checked_unlicensed.pop(key, None)
+
+    def is_licensed(self, user_id, now: datetime = None) -> bool:
+        until = self.licensed_until.get(str(user_id))
+        licensed = until is not None and until > (now or datetime.utcnow())
+        if licensed:
+            self.hits += 1
+        return licensed
+
+    def needs_db_check(self, user_id) -> bool:
+        """
+        True unless the database said "not licensed" within LICENSE_RECHECK_SECONDS.
+        """
+        checked = self.checked_unlicensed.get(str(user_id))
+        if checked is not None and time.monotonic() - checked < LICENSE_RECHECK_SECONDS:
+            self.hits += 1
+            return False
+        self.fallbacks += 1
+        return True
+
+    def mark_unlicensed(self, user_id):
+        self.checked_unlicensed[str(user_id)] = time.monotonic()
+
+    async def rebuild(self, now: datetime = None):
+        """
+        Bulk-load this month's confirmed payments (one keyset-paged query).
+        """
+        start = month_start(now or datetime.utcnow())
+        licensed_until = {}
+        async for chunk in iter_records(
+            PAYMENTS_TABLE, f"confirmed=eq.true&created_at=gte.{start.isoformat()}", "id,user_id,created_at"
+        ):
+            for payment in chunk:
+                key = str(payment["user_id"])
+                until = next_month_start(parse_timestamp(payment["created_at"]))
+                if until > licensed_until.get(key, datetime.min):
+                    licensed_until[key] = until
+        self.licensed_until = licensed_until
+        self.checked_unlicensed = {}
+        self.ready = True
+        return len(licensed_until)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "licensed_landlords": len(self.licensed_until),
+            "hits": self.hits,
+            "db_fallbacks": self.fallbacks,
+        }
+
+license_state = LicenseState()
+
+async def warm_license_state():
+    try:
+        await license_state.rebuild()
+    except Exception as e:
+        logger.warning("Could not build landlord license state: %s", e)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+import time
+from dotenv import load_dotenv
+from .crud import read_records, keyset_filter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LISTINGS_TABLE = "listings"
+LISTING_VERSION_COLUMN = os.getenv("LISTING_VERSION_COLUMN", "updated_at")  # Bumped by a DB trigger on every change (see README)
+LISTING_SYNC_INTERVAL = float(os.getenv("LISTING_SYNC_INTERVAL", "30"))  # Seconds between incremental syncs
+LISTING_FULL_SYNC_INTERVAL = float(os.getenv("LISTING_FULL_SYNC_INTERVAL", "900"))  # Full rebuilds also drop deleted rows
+LISTING_SYNC_PAGE = int(os.getenv("LISTING_SYNC_PAGE", "1000"))
+
+# --- Keeps in-memory listing indexes in step with the listings table ---
+class ListingFeed:
+    """
+    Streams listing rows from Supabase into registered consumers.
+    A consumer has `rebuild(rows)` (full snapshot) and `apply(rows)` (changed rows).
+    Incremental syncs fetch only rows whose version column moved past the watermark.
+    If the table has no version column, incremental syncs are turned off (with a
+    warning) and the indexes refresh on full syncs only.
+    """
+
+    def __init__(self, table: str = LISTINGS_TABLE, version_column: str = LISTING_VERSION_COLUMN):
+        self.table = table
+        self.version_column = version_column
+        self.consumers = []
+        self.watermark = None  # (version value, id) of the newest row seen
+        self.last_full_sync = None
+        self.last_sync = None
+        self.rows_applied = 0
+        self.incremental = True  # False once a full sync shows the version column is missing
+        self._task = None
+
+    def subscribe(self, consumer):
+        self.consumers.append(consumer)
+        return consumer
+
+    @property
+    def ready(self) -> bool:
+        return self.last_full_sync is not None
+
+    async def _fetch(self, filters: list, order_column: str) -> list:
+        """
+        All rows matching `filters`, fetched in keyset pages ordered by (order_column, id).
+        """
+        rows = []
+        last = None
+        while True:
+            page_filters = list(filters)
+            if last is not None:
+                if order_column == "id":
+                    page_filters.append(f"id=gt.{last['id']}")
+                else:
+                    page_filters.append(keyset_filter(order_column, False, last[order_column], last["id"]))
+            order = "order=id.asc" if order_column == "id" else f"order={order_column}.asc,id.asc"
+            page = await read_records(self.table, "&".join(page_filters + [order, f"limit={LISTING_SYNC_PAGE}"]))
+            rows.extend(page)
+            if len(page) < LISTING_SYNC_PAGE:
+                return rows
+            last = page[-1]
+
+    def _advance_watermark(self, rows: list):
+        for row in rows:
+            version = row.get(self.version_column)
+            if version is None:
+                continue
+            if self.watermark is None or (version, row["id"]) > self.watermark:
+                self.watermark = (version, row["id"])
+
+    async def full_sync(self):
+        rows = await self._fetch([], "id")
+        has_version = not rows or self.version_column in rows[0]
+        if not has_version and self.incremental:
+            logger.warning(
+                "%s.%s does not exist: incremental listing sync is off, indexes refresh every %ss by full sync",
+                self.table, self.version_column, LISTING_FULL_SYNC_INTERVAL,
+            )
+        self.incremental = has_version
+        for consumer in self.consumers:
+            consumer.rebuild(rows)
+        self.watermark = None
+        self._advance_watermark(rows)
+        self.last_full_sync = self.last_sync = time.monotonic()
+        return len(rows)
+
+    async def incremental_sync(self):
+        if self.watermark is None:
+            return await self.full_sync()
+        version, last_id = self.watermark
+        rows = await self._fetch([keyset_filter(self.version_column, False, version, last_id)], self.version_column)
+        if rows:
+            for consumer in self.consumers:
+                consumer.apply(rows)
+            self._advance_watermark(rows)
+            self.rows_applied += len(rows)
+        self.last_sync = time.monotonic()
+        return len(rows)
+
+    async def run(self):
+        while True:
+            try:
+                if self.last_full_sync is None or time.monotonic() - self.last_full_sync >= LISTING_FULL_SYNC_INTERVAL:
+                    await self.full_sync()
+                elif self.incremental:
+                    await self.incremental_sync()
+            except Exception as e:
+                logger.warning("Listing sync failed: %s", e)
+            await asyncio.sleep(LISTING_SYNC_INTERVAL)
+
+    def start(self):
+        if self._task is None and self.consumers:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "ready": self.ready,
+            "incremental": self.incremental,
+            "consumers": len(self.consumers),
+            "rows_applied": self.rows_applied,
+            "seconds_since_sync": round(now - self.last_sync, 1) if self.last_sync else None,
+            "seconds_since_full_sync": round(now - self.last_full_sync, 1) if self.last_full_sync else None,
+        }
+
+listing_feed = ListingFeed()
@@ -0,0 +1,259 @@
+import math
+import os
+import numpy as np
+from dotenv import load_dotenv
+from .cache import CACHES, TTLCache, counties_cache, regions_cache
+from .listing_feed import listing_feed
+
+load_dotenv()
+
+# Upper bounds of the price facet buckets; the last bucket is open-ended
+FACET_PRICE_EDGES = tuple(float(edge) for edge in os.getenv("FACET_PRICE_EDGES", "10000,20000,30000,50000,80000,120000").split(","))
+FACET_CACHE_SIZE = int(os.getenv("FACET_CACHE_SIZE", "1024"))  # Results per filter set, until the snapshot changes
+FACET_CACHE_TTL = float(os.getenv("FACET_CACHE_TTL", "300"))
+
+def number(row: dict, column: str) -> float:
+    value = row.get(column)
+    try:
+        return float(value) if value is not None else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+# --- Columnar copy of the listing attributes used for filtering ---
+class ListingSnapshot:
+    """
+    One slot per listing in NumPy columns (id, price, type code, region, lat, lng),
+    plus the county (from regions_cache) and a region-ordered copy for facet counts.
+    Fed by ListingFeed: rebuild() for full snapshots, apply()
+    overwrites or appends only the changed rows. Listeners (e.g. the geo index) are
+    called after every change.
+    """
+
+    def __init__(self, price_edges: tuple = FACET_PRICE_EDGES):
+        self.price_edges = np.asarray(sorted(price_edges), dtype=np.float64)
+        self.type_codes = {}  # lowercased type -> code
+        self.type_names = []  # code -> type as first seen
+        self.listeners = []
+        self.version = 0  # Bumped on every change
+        self.facet_cache = TTLCache("listing_facets", maxsize=FACET_CACHE_SIZE, ttl=FACET_CACHE_TTL)  # Keyed by version
+        self._reset()
+
+    def _reset(self):
+        self.position = {}  # listing_id -> slot
+        self.ids = np.empty(0, dtype=np.int64)
+        self.price = np.empty(0)  # NaN when unknown
+        self.type = np.empty(0, dtype=np.int32)  # -1 when unknown
+        self.region = np.empty(0, dtype=np.int64)  # -1 when unknown
+        self.lat = np.empty(0)  # NaN when the listing has no coordinates
+        self.lng = np.empty(0)
+        self.county = np.empty(0, dtype=np.int64)  # From regions_cache; -1 when the region (or its county) is unknown
+        self.regions_fingerprint = None
+        self._facet_layout()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def type_code(self, listing_type, add: bool = True) -> int:
+        """
+        Code for a type (case-insensitive); -1 for none, -2 for a type no listing has.
+        """
+        if not listing_type:
+            return -1
+        key = str(listing_type).lower()
+        code = self.type_codes.get(key)
+        if code is None:
+            if not add:
+                return -2
+            code = self.type_codes[key] = len(self.type_names)
+            self.type_names.append(str(listing_type))
+        return code
+
+    def _columns(self, rows: list) -> tuple:
+        n = len(rows)
+        return (
+            np.fromiter((row["id"] for row in rows), dtype=np.int64, count=n),
+            np.fromiter((number(row, "price") for row in rows), dtype=np.float64, count=n),
+            np.fromiter((self.type_code(row.get("type")) for row in rows), dtype=np.int32, count=n),
+            np.fromiter((row.get("region_id") if row.get("region_id") is not None else -1 for row in rows), dtype=np.int64, count=n),
+            np.fromiter((number(row, "lat") for row in rows), dtype=np.float64, count=n),
+            np.fromiter((number(row, "lng") for row in rows), dtype=np.float64, count=n),
+        )
+
+    def rebuild(self, rows: list):
+        self._reset()
+        self.ids, self.price, self.type, self.region, self.lat, self.lng = self._columns(rows)
+        self.position = {listing_id: i for i, listing_id in enumerate(self.ids.tolist())}
+        self._derive()
+
+    def apply(self, rows: list):
+        """
+        Changed rows overwrite their slot in place; new rows are appended.
+        """
+        ids, price, listing_type, region, lat, lng = self._columns(rows)
+        slots = np.fromiter((self.position.get(listing_id, -1) for listing_id in ids.tolist()), dtype=np.int64, count=len(rows))
+        known = slots >= 0
+        for column, values in ((self.price, price), (self.type, listing_type), (self.region, region), (self.lat, lat), (self.lng, lng)):
+            column[slots[known]] = values[known]
+        new = ~known
+        if new.any():
+            # The same id twice in one batch: keep the last row
+            _, last = np.unique(ids[new][::-1], return_index=True)
+            pick = np.flatnonzero(new)[::-1][last]
+            start = len(self.ids)
+            self.ids = np.concatenate([self.ids, ids[pick]])
+            self.price = np.concatenate([self.price, price[pick]])
+            self.type = np.concatenate([self.type, listing_type[pick]])
+            self.region = np.concatenate([self.region, region[pick]])
+            self.lat = np.concatenate([self.lat, lat[pick]])
+            self.lng = np.concatenate([self.lng, lng[pick]])
+            self.position.update((listing_id, start + i) for i, listing_id in enumerate(ids[pick].tolist()))
+        self._derive()
+
+    def _derive(self):
+        region_ids = np.fromiter((row["id"] for row in regions_cache.rows), dtype=np.int64, count=len(regions_cache.rows))
+        county_ids = np.fromiter(
+            (row.get("county_id") if row.get("county_id") is not None else -1 for row in regions_cache.rows),
+            dtype=np.int64,
+            count=len(regions_cache.rows),
+        )
+        order = np.argsort(region_ids)
+        region_ids, county_ids = region_ids[order], county_ids[order]
+        county = np.full(len(self.ids), -1, dtype=np.int64)
+        if len(region_ids):
+            slot = np.minimum(np.searchsorted(region_ids, self.region), len(region_ids) - 1)
+            found = region_ids[slot] == self.region
+            county[found] = county_ids[slot[found]]
+        self.county = county
+        self._facet_layout()
+        self.regions_fingerprint = regions_cache.fingerprint
+        self.version += 1
+        for listener in self.listeners:
+            listener()
+
+    def _facet_layout(self):
+        """
+        The filter columns re-ordered by region, so every region is one contiguous run:
+        per-region counts under any mask are one reduceat, and a county's count is the
+        sum of its regions. Types and price buckets have few values, so each gets a
+        boolean column and is counted with count_nonzero.
+        """
+        order = np.argsort(self.region, kind="stable")
+        region = self.facet_region = self.region[order]
+        self.facet_county = self.county[order]
+        self.facet_type = self.type[order]
+        self.facet_price = self.price[order]
+        self.region_starts = np.flatnonzero(np.diff(region, prepend=region[:1] - 1))
+        self.region_values = region[self.region_starts]
+        self.region_sizes = np.diff(self.region_starts, append=len(region))
+        self.county_values, self.region_county = np.unique(self.facet_county[self.region_starts], return_inverse=True)
+        self.type_columns = [self.facet_type == code for code in range(len(self.type_names))]
+        bucket = np.searchsorted(self.price_edges, self.facet_price, side="right")
+        priced = ~np.isnan(self.facet_price)
+        self.price_columns = [priced & (bucket == i) for i in range(len(self.price_edges) + 1)]
+
+    def refresh(self):
+        """
+        Re-derive after regions_cache reloaded (county of a region, region centroids).
+        """
+        if self.regions_fingerprint != regions_cache.fingerprint:
+            self._derive()
+
+    # --- Facet counts ---
+    def facets(
+        self,
+        region_id: int = None,
+        county_id: int = None,
+        type: str = None,
+        price_min: float = None,
+        price_max: float = None,
+    ) -> dict:
+        """
+        Listing counts per type, price bucket, region and county.
+        Each facet applies every filter except its own, so the counts show what
+        picking another value of that facet would return. `total` applies them all.
+        Results are cached per filter set until the snapshot changes.
+        """
+        self.refresh()
+        key = (self.version, region_id, county_id, type.lower() if type else type, price_min, price_max)
+        result = self.facet_cache.get(key)
+        if result is None:
+            result = self._facets(region_id, county_id, type, price_min, price_max)
+            self.facet_cache.set(key, result)
+        return result
+
+    def _facets(self, region_id, county_id, type, price_min, price_max) -> dict:
+        masks = {}  # facet -> rows (in the facet layout) passing that facet's own filter
+        if type is not None:
+            masks["type"] = self.facet_type == self.type_code(type, add=False)
+        if price_min is not None or price_max is not None:
+            price_mask = np.ones(len(self.facet_price), dtype=bool)
+            if price_min is not None:
+                price_mask &= self.facet_price >= price_min
+            if price_max is not None:
+                price_mask &= self.facet_price <= price_max
+            masks["price"] = price_mask
+        if region_id is not None:
+            masks["region"] = self.facet_region == region_id
+        if county_id is not None:
+            masks["county"] = self.facet_county == county_id
+
+        def passing(exclude: str = None):
+            """
+            Rows passing every filter but `exclude`'s (None: no filter applies).
+            """
+            selected = [mask for facet, mask in masks.items() if facet != exclude]
+            if not selected:
+                return None
+            rows = selected[0]
+            for mask in selected[1:]:
+                rows = rows & mask
+            return rows
+
+        def column_counts(columns: list, rows) -> list:
+            return [int(np.count_nonzero(column if rows is None else column & rows)) for column in columns]
+
+        def region_counts(rows) -> np.ndarray:
+            if rows is None or not len(self.region_starts):
+                return self.region_sizes
+            return np.add.reduceat(rows, self.region_starts, dtype=np.int64)
+
+        rows = passing()
+        total = len(self.ids) if rows is None else int(np.count_nonzero(rows))
+        type_counts = column_counts(self.type_columns, passing("type"))
+        price_counts = column_counts(self.price_columns, passing("price"))
+        by_region = region_counts(passing("region"))
+        county_counts = np.bincount(
+            self.region_county, weights=region_counts(passing("county")), minlength=len(self.county_values)
+        ).astype(np.int64)
+
+        lows = [0.0, *self.price_edges.tolist()]
+        highs = [*self.price_edges.tolist(), None]
+        return {
+            "total": total,
+            "type": sorted(
+                ({"value": self.type_names[code], "count": c} for code, c in enumerate(type_counts) if c),
+                key=lambda item: (-item["count"], item["value"]),
+            ),
+            "price": [{"min": low, "max": high, "count": c} for low, high, c in zip(lows, highs, price_counts)],
+            "region": self._value_counts(self.region_values, by_region, regions_cache.by_id),
+            "county": self._value_counts(self.county_values, county_counts, counties_cache.by_id),
+        }
+
+    @staticmethod
+    def _value_counts(values: np.ndarray, counts: np.ndarray, rows_by_id) -> list:
+        items = []
+        for value, c in zip(values.tolist(), counts.tolist()):
+            if c and value >= 0:
+                item = {"id": value, "count": c}
+                if rows_by_id is not None and value in rows_by_id:
+                    item["name"] = rows_by_id[value].get("name")
+                items.append(item)
+        items.sort(key=lambda item: (-item["count"], item["id"]))
+        return items
+
+    def stats(self) -> dict:
+        return {"listings": len(self.ids), "types": len(self.type_names), "version": self.version}
+
+listing_snapshot = ListingSnapshot()
+listing_feed.subscribe(listing_snapshot)
+CACHES["listing_snapshot"] = listing_snapshot
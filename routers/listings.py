@@ -1,21 +1,197 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import Optional
-from .crud import read_records
+from .crud import read_records, read_records_raw, keyset_filter
+from .coalesce import coalesced_read_records
+from .cache import counties_cache, regions_cache
+from .listing_feed import LISTING_VERSION_COLUMN, listing_feed
+from .conditional import (
+    LISTINGS_CACHE_CONTROL, PRIVATE_CACHE_CONTROL, bytes_fingerprint, conditional_response, make_etag, not_modified, rows_fingerprint,
+)
+from .search_index import search_index
+from .geo_index import GEO_MAX_RADIUS_KM, geo_index
+from .listing_snapshot import listing_snapshot
+from .export import export_response
+from .imaging import PHOTO_VARIANTS, with_photo_variant
+from .favourites import favourite_ids, mark_favourites
+import base64
+import json
+from datetime import datetime
 import os
+import re
+from urllib.parse import quote
 from dotenv import load_dotenv
 
 # Load .env variables for local dev
 load_dotenv()
 
 LISTINGS_TABLE = "listings"
+SORT_COLUMNS = ("created_at", "price")  # Keyset sort keys; `id` is always the tie-breaker
+# Sparse fieldsets: columns a client may ask for with fields=, embeds with embed=
+LISTING_FIELDS = ("id", "title", "type", "price", "region_id", "description", "lat", "lng", "created_at", "updated_at")
+# Columns in /listings/export: the core ones, not the optional lat/lng and updated_at
+LISTING_EXPORT_FIELDS = "id,title,type,price,region_id,description,created_at"
+LISTING_EMBEDS = {
+    "photos": "photos(*)",
+    "regions": "regions(*)",
+    "counties": "counties(*)",
+}
 
 router = APIRouter(
     prefix="/listings",
     tags=["listings"]
 )
 
+# --- Keyset (cursor) pagination helpers ---
+def parse_sort(sort: str) -> tuple:
+    """
+    'created_at' / '-created_at' / 'price' / '-price' -> (column, descending)
+    """
+    descending = sort.startswith("-")
+    column = sort.lstrip("-")
+    if column not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(SORT_COLUMNS)} (prefix '-' for descending).")
+    return column, descending
+
+def encode_cursor(sort: str, value, last_id) -> str:
+    """
+    Opaque cursor pointing just after the row with sort key `value` and id `last_id`.
+    """
+    raw = json.dumps([sort, value, last_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def cursor_value_valid(column: str, value) -> bool:
+    """
+    A cursor's sort key must be NULL or a scalar of the column's type.
+    """
+    if value is None:
+        return True
+    if column == "price":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    try:
+        datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+def decode_cursor(cursor: str, sort: str) -> tuple:
+    """
+    (value, last_id) from a cursor issued for `sort`; 400 for anything else.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, last_id = json.loads(raw)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor was issued for a different sort order.")
+    if (
+        isinstance(last_id, bool)
+        or not isinstance(last_id, int)
+        or not cursor_value_valid(parse_sort(sort)[0], value)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return value, last_id
+
+def parse_list(value: Optional[str], allowed, name: str):
+    """
+    'a,b' -> ['a', 'b'] (None stays None, '' is an empty list); 400 on names outside `allowed`.
+    """
+    if value is None:
+        return None
+    names = [item.strip() for item in value.split(",") if item.strip()]
+    unknown = [item for item in names if item not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown {name}: {', '.join(unknown)}. Allowed: {', '.join(allowed)}.")
+    return list(dict.fromkeys(names))
+
+def listing_select(fields: Optional[str] = None, embed: Optional[str] = None, required: tuple = ()) -> str:
+    """
+    Minimal PostgREST select for fields= / embed=. Without fields every column is
+    returned; without embed all of LISTING_EMBEDS (embed= with no value: none).
+    `id` and `required` columns (e.g. the cursor sort key) are always selected.
+    """
+    columns = parse_list(fields, LISTING_FIELDS, "fields")
+    embeds = parse_list(embed, tuple(LISTING_EMBEDS), "embed")
+    if columns is None:
+        parts = ["*"]
+    else:
+        parts = list(dict.fromkeys(["id", *required, *columns]))
+    parts += [LISTING_EMBEDS[name] for name in (LISTING_EMBEDS if embeds is None else embeds)]
+    return ",".join(parts)
+
+def check_photo_size(photo_size: Optional[str]):
+    if photo_size is not None and photo_size != "original" and photo_size not in PHOTO_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"photo_size must be one of: original, {', '.join(PHOTO_VARIANTS)}.")
+
+async def with_favourites(listings: list, user_id) -> list:
+    """
+    Mark `is_favourite` on each listing for `user_id` (from the cached favourite-id set).
+    """
+    if user_id is None:
+        return listings
+    try:
+        ids = await favourite_ids(user_id)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return mark_favourites(listings, ids)
+
+def listings_etag(items: list, *parts) -> str:
+    """
+    ETag from listing ids + versions (and their photos), the embedded reference
+    data, favourite marks and any response options in `parts`.
+    """
+    return make_etag(
+        LISTINGS_TABLE,
+        rows_fingerprint(items, LISTING_VERSION_COLUMN, nested=("photos",)),
+        regions_cache.fingerprint,
+        counties_cache.fingerprint,
+        tuple(item.get("is_favourite") for item in items),
+        *parts,
+    )
+
+def feed_etag(*parts):
+    """
+    ETag from the listing feed's state (newest updated_at seen, listings known) and
+    the reference data, so it can be checked before reading Supabase. Changes show
+    up once the feed has synced them. None until the feed has synced with a version column.
+    """
+    if not (listing_feed.ready and listing_feed.incremental):
+        return None
+    return make_etag(
+        LISTINGS_TABLE,
+        listing_feed.watermark,
+        len(listing_snapshot),
+        regions_cache.fingerprint,
+        counties_cache.fingerprint,
+        *parts,
+    )
+
+def listings_cache_control(user_id) -> str:
+    return PRIVATE_CACHE_CONTROL if user_id is not None else LISTINGS_CACHE_CONTROL
+
+def listing_filters(county_id=None, region_id=None, price_min=None, price_max=None, type=None) -> list:
+    """
+    PostgREST filters shared by the listing list, page and export routes.
+    `type` matches whole values case-insensitively, like the search, nearby and facet indexes.
+    """
+    filters = []
+    if county_id is not None:
+        filters.append(f"region_id=in.(select id from regions where county_id=eq.{county_id})")
+    if region_id is not None:
+        filters.append(f"region_id=eq.{region_id}")
+    if price_min is not None:
+        filters.append(f"price=gte.{price_min}")
+    if price_max is not None:
+        filters.append(f"price=lte.{price_max}")
+    if type is not None:
+        filters.append(f"type=imatch.{quote('^' + re.escape(type) + '$', safe='')}")
+    return filters
+
 @router.get("/")
 async def get_listings(
+    request: Request,
     skip: int = 0,
     limit: int = 20,
     county_id: Optional[int] = Query(None, description="Filter by county id"),
@@ -23,25 +199,35 @@ async def get_listings(
     price_min: Optional[float] = Query(None, description="Minimum price"),
     price_max: Optional[float] = Query(None, description="Maximum price"),
     type: Optional[str] = Query(None, description="Filter by house type (e.g. bedsitter, 1BR, 2BR)"),
+    paginate: str = Query("offset", description="'offset' (skip/limit) or 'cursor' (keyset, returns next_cursor)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (implies paginate=cursor)"),
+    sort: str = Query("-created_at", description="Cursor mode order: created_at or price, '-' prefix for descending"),
+    photo_size: Optional[str] = Query(None, description="Photo rendition to return as url: thumb, medium, webp or original"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated columns to return ({', '.join(LISTING_FIELDS)}); default all"),
+    embed: Optional[str] = Query(None, description=f"Comma-separated related rows to embed ({', '.join(LISTING_EMBEDS)}); default all, empty for none"),
+    user_id: Optional[int] = Query(None, description="Mark listings this user has favourited (is_favourite)"),
 ):
     """
     Get a list of property listings with optional filters.
+    Offset mode returns a plain list; cursor mode returns { "items": [...], "next_cursor": ... }
+    and costs the same on every page.
+    fields= and embed= trim the upstream select to what the client renders.
+    Sends an ETag; If-None-Match with the current one gets a 304 and no body.
     """
-    # Construct filters
-    filters = []
-    if county_id is not None:
-        filters.append(f"region_id=in.(select id from regions where county_id=eq.{county_id})")
-    if region_id is not None:
-        filters.append(f"region_id=eq.{region_id}")
-    if price_min is not None:
-        filters.append(f"price=gte.{price_min}")
-    if price_max is not None:
-        filters.append(f"price=lte.{price_max}")
-    if type is not None:
-        filters.append(f"type=eq.{type}")
+    if paginate not in ("offset", "cursor"):
+        raise HTTPException(status_code=400, detail="paginate must be 'offset' or 'cursor'.")
+    check_photo_size(photo_size)
+    filters = listing_filters(county_id, region_id, price_min, price_max, type)
+
+    cursor_mode = cursor is not None or paginate == "cursor"
+    select = listing_select(fields, embed, required=(parse_sort(sort)[0],) if cursor_mode else ())
+    if cursor_mode:
+        page = await get_listings_page(filters, select, limit, sort, cursor)
+        items = await with_favourites(with_photo_variant(page["items"], photo_size), user_id)
+        etag = listings_etag(items, select, photo_size, page["next_cursor"])
+        return conditional_response(request, etag, listings_cache_control(user_id), {**page, "items": items})
 
     query = "&".join(filters)
-    select = "*,photos(*),regions(*),counties(*)"
     query_str = query
     # Add limit and offset for pagination
     if query_str:
@@ -49,22 +235,230 @@ async def get_listings(
     else:
         query_str = f"limit={limit}&offset={skip}"
 
+    if photo_size in (None, "original") and user_id is None:
+        # Rows go out exactly as PostgREST sent them: no decode, no re-encode.
+        # A client that already has the current page gets its 304 without a Supabase read.
+        etag = feed_etag(select, query_str)
+        if etag is not None:
+            response = not_modified(request, etag, LISTINGS_CACHE_CONTROL)
+            if response is not None:
+                return response
+        try:
+            body = await read_records_raw(LISTINGS_TABLE, query_str, select)
+        except HTTPException as he:
+            raise he
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if etag is None:  # Feed not usable yet: fall back to hashing the page
+            etag = make_etag(LISTINGS_TABLE, select, bytes_fingerprint(body))
+        return conditional_response(request, etag, LISTINGS_CACHE_CONTROL, body)
+
     try:
         listings = await read_records(LISTINGS_TABLE, query_str, select)
-        return listings
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    listings = await with_favourites(with_photo_variant(listings, photo_size), user_id)
+    etag = listings_etag(listings, select, photo_size)
+    return conditional_response(request, etag, listings_cache_control(user_id), listings)
+
+async def get_listings_page(filters: list, select: str, limit: int, sort: str, cursor: Optional[str]):
+    """
+    One keyset page: rows after the cursor in (sort column, id) order, plus next_cursor.
+    """
+    column, descending = parse_sort(sort)
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        filters = filters + [keyset_filter(column, descending, value, last_id, nulls_last=True)]
+    direction = "desc" if descending else "asc"
+    # Listings without a sort key come last in either direction; fetch one extra row
+    # to know whether another page exists
+    query_str = "&".join(filters + [f"order={column}.{direction}.nullslast,id.{direction}", f"limit={limit + 1}"])
+
+    try:
+        rows = await read_records(LISTINGS_TABLE, query_str, select)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and items:
+        last = items[-1]
+        next_cursor = encode_cursor(sort, last.get(column), last.get("id"))
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/export")
+async def export_listings(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    county_id: Optional[int] = Query(None, description="Filter by county id"),
+    region_id: Optional[int] = Query(None, description="Filter by region id"),
+    price_min: Optional[float] = Query(None, description="Minimum price"),
+    price_max: Optional[float] = Query(None, description="Maximum price"),
+    type: Optional[str] = Query(None, description="Filter by house type (e.g. bedsitter, 1BR, 2BR)"),
+):
+    """
+    Stream all matching listings (flat rows, no embeds) as NDJSON or CSV.
+    """
+    query = "&".join(listing_filters(county_id, region_id, price_min, price_max, type))
+    return await export_response(LISTINGS_TABLE, query, LISTING_EXPORT_FIELDS, format, "listings")
+
+async def county_region_ids(county_id: Optional[int], region_id: Optional[int]):
+    """
+    Region ids allowed by the county/region filters, or None when neither is set.
+    """
+    region_ids = None
+    if region_id is not None:
+        region_ids = {region_id}
+    if county_id is not None:
+        county_regions = {region["id"] for region in await regions_cache.find(county_id=county_id)}
+        region_ids = county_regions if region_ids is None else region_ids & county_regions
+    return region_ids
+
+@router.get("/search")
+async def search_listings(
+    request: Request,
+    q: str = Query(..., min_length=1, description="Keywords matched against title, description and type"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    county_id: Optional[int] = Query(None, description="Filter by county id"),
+    region_id: Optional[int] = Query(None, description="Filter by region id"),
+    price_min: Optional[float] = Query(None, description="Minimum price"),
+    price_max: Optional[float] = Query(None, description="Maximum price"),
+    type: Optional[str] = Query(None, description="Filter by house type (e.g. bedsitter, 1BR, 2BR)"),
+    photo_size: Optional[str] = Query(None, description="Photo rendition to return as url: thumb, medium, webp or original"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated columns to return ({', '.join(LISTING_FIELDS)}); default all"),
+    embed: Optional[str] = Query(None, description=f"Comma-separated related rows to embed ({', '.join(LISTING_EMBEDS)}); default all, empty for none"),
+    user_id: Optional[int] = Query(None, description="Mark listings this user has favourited (is_favourite)"),
+):
+    """
+    Keyword search over listings, ranked by relevance, combined with the usual filters.
+    Matching runs on the in-memory search index; only the returned page is read from Supabase.
+    """
+    if not listing_feed.ready:
+        raise HTTPException(status_code=503, detail="Search index is warming up, try again shortly.")
+    check_photo_size(photo_size)
+    select = listing_select(fields, embed)
+    try:
+        region_ids = await county_region_ids(county_id, region_id)
+        total, hits = search_index.search(
+            q, region_ids=region_ids, type=type, price_min=price_min, price_max=price_max, limit=limit, offset=skip
+        )
+        if not hits:
+            return {"total": total, "items": []}
+        ids = ",".join(str(listing_id) for listing_id, _ in hits)
+        rows = await read_records(LISTINGS_TABLE, f"id=in.({ids})", select)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    by_id = {row["id"]: row for row in rows}
+    items = []
+    for listing_id, score in hits:
+        row = by_id.get(listing_id)
+        if row is not None:  # Deleted since the last index sync
+            items.append({**row, "score": score})
+    items = await with_favourites(with_photo_variant(items, photo_size), user_id)
+    etag = listings_etag(items, select, photo_size, total, tuple(item["score"] for item in items))
+    return conditional_response(request, etag, listings_cache_control(user_id), {"total": total, "items": items})
+
+@router.get("/nearby")
+async def nearby_listings(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90, description="Latitude of the point to search around"),
+    lng: float = Query(..., ge=-180, le=180, description="Longitude of the point to search around"),
+    radius_km: float = Query(3.0, gt=0, le=GEO_MAX_RADIUS_KM, description="Search radius in kilometres"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    county_id: Optional[int] = Query(None, description="Filter by county id"),
+    region_id: Optional[int] = Query(None, description="Filter by region id"),
+    price_min: Optional[float] = Query(None, description="Minimum price"),
+    price_max: Optional[float] = Query(None, description="Maximum price"),
+    type: Optional[str] = Query(None, description="Filter by house type (e.g. bedsitter, 1BR, 2BR)"),
+    photo_size: Optional[str] = Query(None, description="Photo rendition to return as url: thumb, medium, webp or original"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated columns to return ({', '.join(LISTING_FIELDS)}); default all"),
+    embed: Optional[str] = Query(None, description=f"Comma-separated related rows to embed ({', '.join(LISTING_EMBEDS)}); default all, empty for none"),
+    user_id: Optional[int] = Query(None, description="Mark listings this user has favourited (is_favourite)"),
+):
+    """
+    Listings within `radius_km` of a point, nearest first, combined with the usual filters.
+    Listings without their own coordinates are placed at their region's centroid
+    (`approximate_location: true`). Matching runs on the in-memory geo index; only the
+    returned page is read from Supabase.
+    """
+    if not listing_feed.ready:
+        raise HTTPException(status_code=503, detail="Geo index is warming up, try again shortly.")
+    check_photo_size(photo_size)
+    select = listing_select(fields, embed)
+    try:
+        region_ids = await county_region_ids(county_id, region_id)
+        total, hits = geo_index.nearby(
+            lat, lng, radius_km, region_ids=region_ids, type=type, price_min=price_min, price_max=price_max,
+            limit=limit, offset=skip,
+        )
+        if not hits:
+            return {"total": total, "items": []}
+        ids = ",".join(str(listing_id) for listing_id, _, _ in hits)
+        rows = await read_records(LISTINGS_TABLE, f"id=in.({ids})", select)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    by_id = {row["id"]: row for row in rows}
+    items = []
+    for listing_id, distance_km, approximate in hits:
+        row = by_id.get(listing_id)
+        if row is not None:  # Deleted since the last index sync
+            items.append({**row, "distance_km": distance_km, "approximate_location": approximate})
+    items = await with_favourites(with_photo_variant(items, photo_size), user_id)
+    etag = listings_etag(items, select, photo_size, total, tuple(item["distance_km"] for item in items))
+    return conditional_response(request, etag, listings_cache_control(user_id), {"total": total, "items": items})
+
+@router.get("/facets")
+async def listing_facets(
+    request: Request,
+    county_id: Optional[int] = Query(None, description="Filter by county id"),
+    region_id: Optional[int] = Query(None, description="Filter by region id"),
+    price_min: Optional[float] = Query(None, description="Minimum price"),
+    price_max: Optional[float] = Query(None, description="Maximum price"),
+    type: Optional[str] = Query(None, description="Filter by house type (e.g. bedsitter, 1BR, 2BR)"),
+):
+    """
+    Listing counts by type, price bucket, region and county for the given filters.
+    Each facet ignores its own filter (so the other values stay selectable); `total`
+    applies all of them. Computed on the in-memory listing snapshot, without Supabase calls.
+    """
+    if not listing_feed.ready:
+        raise HTTPException(status_code=503, detail="Listing snapshot is warming up, try again shortly.")
+    result = listing_snapshot.facets(
+        region_id=region_id, county_id=county_id, type=type, price_min=price_min, price_max=price_max,
+    )
+    etag = make_etag(LISTINGS_TABLE, "facets", result)
+    return conditional_response(request, etag, LISTINGS_CACHE_CONTROL, result)
 
 @router.get("/{listing_id}")
-async def get_listing(listing_id: int):
+async def get_listing(
+    listing_id: int,
+    request: Request,
+    photo_size: Optional[str] = Query(None, description="Photo rendition to return as url: thumb, medium, webp or original"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated columns to return ({', '.join(LISTING_FIELDS)}); default all"),
+    embed: Optional[str] = Query(None, description=f"Comma-separated related rows to embed ({', '.join(LISTING_EMBEDS)}); default all, empty for none"),
+):
     """
     Get details for a single house listing.
+    Concurrent requests for the same listing share one upstream read.
     """
-    select = "*,photos(*),regions(*),counties(*)"
+    check_photo_size(photo_size)
+    select = listing_select(fields, embed)
     try:
-        results = await read_records(LISTINGS_TABLE, f"id=eq.{listing_id}", select)
-        if not results:
-            raise HTTPException(status_code=404, detail="Listing not found")
-        return results[0]
+        results = await coalesced_read_records(LISTINGS_TABLE, f"id=eq.{listing_id}", select)
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not results:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    listing = with_photo_variant(results, photo_size)[0]
+    etag = listings_etag([listing], select, photo_size)
+    return conditional_response(request, etag, LISTINGS_CACHE_CONTROL, listing)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import time
+from email.message import EmailMessage
+import aiosmtplib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MAIL_CONCURRENCY = int(os.getenv("MAIL_CONCURRENCY", "4"))      # Parallel SMTP connections
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", "50"))        # Bcc recipients per message
+MAIL_TIMEOUT = float(os.getenv("MAIL_TIMEOUT", "30"))
+
+# --- Bulk sender: few SMTP connections, many recipients per message ---
+class BulkMailer:
+    """
+    Sends one plain-text email to many recipients. Recipients are split into
+    Bcc batches; a small pool of long-lived SMTP connections works through the
+    batches concurrently. A batch that fails is retried once on a fresh connection.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: str,
+        password: str,
+        sender: str,
+        start_tls: bool = True,
+        use_tls: bool = False,
+        concurrency: int = MAIL_CONCURRENCY,
+        batch_size: int = MAIL_BATCH_SIZE,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.start_tls = start_tls
+        self.use_tls = use_tls
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_config(cls, conf, **kwargs):
+        """
+        Build from a fastapi_mail ConnectionConfig (the MAIL_* settings).
+        """
+        return cls(
+            hostname=conf.MAIL_SERVER,
+            port=conf.MAIL_PORT,
+            username=conf.MAIL_USERNAME if conf.USE_CREDENTIALS else None,
+            password=conf.MAIL_PASSWORD.get_secret_value() if hasattr(conf.MAIL_PASSWORD, "get_secret_value") else conf.MAIL_PASSWORD,
+            sender=conf.MAIL_FROM,
+            start_tls=conf.MAIL_STARTTLS,
+            use_tls=conf.MAIL_SSL_TLS,
+            **kwargs,
+        )
+
+    def _connection(self) -> aiosmtplib.SMTP:
+        return aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls if not self.use_tls else False,
+            timeout=MAIL_TIMEOUT,
+        )
+
+    def _message(self, subject: str, body: str) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = self.sender  # Real recipients go in the envelope only (Bcc)
+        message["Subject"] = subject
+        message.set_content(body)
+        return message
+
+    async def send(self, recipients: list, subject: str, body: str) -> dict:
+        """
+        Deliver to every recipient. Returns counts, failures and throughput for the run.
+        """
+        started = time.perf_counter()
+        stats = {"recipients": len(recipients), "messages": 0, "sent": 0, "failed": [], "connections": 0}
+        batches = asyncio.Queue()
+        for i in range(0, len(recipients), self.batch_size):
+            batches.put_nowait(recipients[i:i + self.batch_size])
+        message = self._message(subject, body)
+
+        async def worker():
+            smtp = None
+            try:
+                while not batches.empty():
+                    batch = batches.get_nowait()
+                    for attempt in (1, 2):
+                        try:
+                            if smtp is None or not smtp.is_connected:
+                                smtp = self._connection()
+                                await smtp.connect()
+                                stats["connections"] += 1
+                            refused, _ = await smtp.send_message(message, recipients=batch)
+                            stats["messages"] += 1
+                            stats["sent"] += len(batch) - len(refused)
+                            stats["failed"].extend(refused)
+                            break
+                        except Exception as e:
+                            logger.warning("Mail batch of %d failed (attempt %d): %s", len(batch), attempt, e)
+                            if smtp is not None:
+                                smtp.close()
+                            smtp = None
+                            if attempt == 2:
+                                stats["failed"].extend(batch)
+            finally:
+                if smtp is not None and smtp.is_connected:
+                    try:
+                        await smtp.quit()
+                    except Exception:
+                        pass
+
+        workers = min(self.concurrency, batches.qsize())
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        elapsed = time.perf_counter() - started
+        stats["seconds"] = round(elapsed, 3)
+        stats["recipients_per_second"] = round(stats["sent"] / elapsed, 1) if elapsed > 0 else None
+        return stats
@@ -0,0 +1,183 @@
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from starlette.datastructures import MutableHeaders
+from dotenv import load_dotenv
+from database import gateway
+from resilience import CircuitBreaker
+from .cache import CACHES, cache_stats
+
+load_dotenv()
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() in ("1", "true", "yes")  # Server-Timing header on responses
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# --- Prometheus-style metrics (single event loop: no locks needed) ---
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        METRICS.append(self)
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = format_labels(self.labelnames, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        METRICS.append(self)
+
+    def inc(self, amount: float, *labels):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{{{format_labels(self.labelnames, labels)}}} {value}")
+        return lines
+
+def format_labels(names: tuple, values: tuple) -> str:
+    return ",".join(f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in zip(names, values))
+
+METRICS = []
+request_seconds = Histogram("kejahunt_request_seconds", "Time to first response byte per route.", ("method", "route", "status"))
+upstream_seconds = Histogram("kejahunt_upstream_seconds", "Supabase call latency.", ("table", "operation", "status"))
+upstream_bytes = Counter("kejahunt_upstream_response_bytes_total", "Bytes received from Supabase.", ("table", "operation"))
+
+# --- Per-request upstream breakdown ---
+class RequestTiming:
+    __slots__ = ("started", "upstream", "upstream_calls")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.upstream = {}  # (table, operation) -> seconds
+        self.upstream_calls = 0
+
+current_timing = ContextVar("current_timing", default=None)
+
+def upstream_table(path: str) -> str:
+    """
+    '/rest/v1/listings?select=*' -> 'listings'; storage and auth calls are grouped as such.
+    """
+    if path.startswith("/rest/v1/"):
+        return path[9:].split("?", 1)[0].split("/", 1)[0]
+    if path.startswith("/storage/"):
+        return "storage"
+    if path.startswith("/auth/"):
+        return "auth"
+    return "other"
+
+def record_upstream(method: str, path: str, operation: str, status, size: int, seconds: float):
+    """
+    Gateway observer: one Supabase call finished (status is 'error' if it raised).
+    """
+    table = upstream_table(path)
+    upstream_seconds.observe(seconds, table, operation, str(status))
+    if size:
+        upstream_bytes.inc(size, table, operation)
+    timing = current_timing.get()
+    if timing is not None:
+        key = (table, operation)
+        timing.upstream[key] = timing.upstream.get(key, 0.0) + seconds
+        timing.upstream_calls += 1
+
+gateway.observers.append(record_upstream)
+CACHES["supabase_gateway"] = gateway  # Breaker state, retries and hedges in /cache/stats
+
+def server_timing(timing: RequestTiming, total: float) -> str:
+    """
+    'db-listings-read;dur=12.1, upstream;dur=12.1;desc="1 call", app;dur=3.4, total;dur=15.5'
+    """
+    entries = [f"db-{table}-{operation};dur={seconds * 1000:.1f}" for (table, operation), seconds in timing.upstream.items()]
+    upstream = sum(timing.upstream.values())
+    calls = timing.upstream_calls
+    entries.append(f'upstream;dur={upstream * 1000:.1f};desc="{calls} call{"" if calls == 1 else "s"}"')
+    # Concurrent upstream calls can add up to more than the wall time
+    entries.append(f"app;dur={max(total - upstream, 0.0) * 1000:.1f}")
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+class TimingMiddleware:
+    """
+    Times every HTTP request up to its response headers, records it in
+    kejahunt_request_seconds (by route template) and adds a Server-Timing
+    header splitting the time between Supabase calls and the app.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timing = RequestTiming()
+        token = current_timing.set(timing)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - timing.started
+                route = scope.get("route")
+                request_seconds.observe(total, scope["method"], getattr(route, "path", "unmatched"), message["status"])
+                if SERVER_TIMING:
+                    MutableHeaders(raw=message["headers"]).append("Server-Timing", server_timing(timing, total))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timing.reset(token)
+
+# --- /metrics ---
+def cache_lines() -> list:
+    """
+    Numeric fields of every registered cache's stats() as gauges.
+    """
+    lines = ["# HELP kejahunt_cache In-process cache and background job stats (see /cache/stats).", "# TYPE kejahunt_cache gauge"]
+    for name, stats in sorted(cache_stats().items()):
+        for field, value in stats.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)) and value == value and value not in (float("inf"), float("-inf")):
+                lines.append(f'kejahunt_cache{{{format_labels(("cache", "stat"), (name, field))}}} {value}')
+    return lines
+
+def breaker_lines() -> list:
+    """
+    One series per breaker state, 1 for the current one (alert on state="open").
+    """
+    lines = ["# HELP kejahunt_upstream_circuit_state Supabase circuit breaker state.", "# TYPE kejahunt_upstream_circuit_state gauge"]
+    for state in CircuitBreaker.STATES:
+        lines.append(f'kejahunt_upstream_circuit_state{{state="{state}"}} {int(gateway.breaker.state == state)}')
+    return lines
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += breaker_lines()
+    lines += cache_lines()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,369 @@
+"""
+Durable, idempotent M-PESA callback ingestion.
+
+The webhook only appends the raw callback to a local SQLite journal and
+acknowledges. A background worker applies journaled confirmations to the
+payments table in batches. Replay journaled callbacks with:
+
+    python -m routers.mpesa_journal stats
+    python -m routers.mpesa_journal replay --status unmatched,mismatched [--since-seq N] [--txn ID]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from .cache import CACHES
+from .crud import read_records, update_record
+from .licensing import license_state
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MPESA_JOURNAL_PATH = os.getenv("MPESA_JOURNAL_PATH", "mpesa_journal.sqlite3")
+MPESA_MATCH_COLUMN = os.getenv("MPESA_MATCH_COLUMN", "checkout_request_id")  # payments column holding the M-PESA request id
+MPESA_BATCH_SIZE = int(os.getenv("MPESA_BATCH_SIZE", "100"))
+MPESA_POLL_INTERVAL = float(os.getenv("MPESA_POLL_INTERVAL", "2"))
+MPESA_BATCH_LINGER = float(os.getenv("MPESA_BATCH_LINGER", "0.05"))  # Wait this long after a wakeup so bursts share a batch
+MPESA_MAX_ATTEMPTS = int(os.getenv("MPESA_MAX_ATTEMPTS", "10"))  # Before a callback with no matching payment is parked
+MPESA_RETRY_BACKOFF = float(os.getenv("MPESA_RETRY_BACKOFF", "5"))  # Seconds before re-checking an unmatched callback, doubled per attempt
+MPESA_RETRY_BACKOFF_MAX = float(os.getenv("MPESA_RETRY_BACKOFF_MAX", "300"))
+MPESA_APPLY_ENABLED = os.getenv("MPESA_APPLY_ENABLED", "true").lower() in ("1", "true", "yes")  # Run the batch applier; on in exactly one worker
+PAYMENTS_TABLE = "payments"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS callbacks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    txn_id TEXT NOT NULL UNIQUE,
+    received_at REAL NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | applied | rejected | unmatched | mismatched
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    applied_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS callbacks_status_seq ON callbacks (status, seq);
+"""
+
+def retry_delay(attempts: int) -> float:
+    """
+    Wait before re-checking a callback that has failed to match `attempts` times.
+    """
+    return min(MPESA_RETRY_BACKOFF * 2 ** max(attempts - 1, 0), MPESA_RETRY_BACKOFF_MAX)
+
+def amount_matches(paid, expected) -> bool:
+    try:
+        return round(float(paid), 2) == round(float(expected), 2)
+    except (TypeError, ValueError):
+        return False
+
+def parse_callback(body: dict) -> dict:
+    """
+    Pull the transaction id, result and receipt out of an STK push callback
+    (Body.stkCallback) or a C2B confirmation (TransID). Callbacks without an id
+    are keyed by a hash of their payload so retries still deduplicate.
+    """
+    callback = (body.get("Body") or {}).get("stkCallback") or body
+    items = {
+        item.get("Name"): item.get("Value")
+        for item in (callback.get("CallbackMetadata") or {}).get("Item", [])
+    }
+    txn_id = callback.get("CheckoutRequestID") or body.get("TransID")
+    if not txn_id:
+        txn_id = "sha256:" + hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+    result_code = callback.get("ResultCode", 0)
+    return {
+        "txn_id": str(txn_id),
+        "success": str(result_code) == "0",
+        "receipt": items.get("MpesaReceiptNumber") or body.get("TransID"),
+        "amount": items.get("Amount") or body.get("TransAmount"),
+    }
+
+# --- Journal + batch applier ---
+class MpesaJournal:
+    """
+    SQLite journal of raw callbacks (WAL, synchronous=FULL: an acknowledged
+    callback survives a crash). Duplicate transaction ids are dropped on append.
+    """
+
+    def __init__(self, path: str = MPESA_JOURNAL_PATH):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._task = None
+        self.appended = 0
+        self.duplicates = 0
+        self.applied = 0
+        self.rejected = 0
+        self.mismatched = 0
+        self.unmatched_attempts = 0
+        self.batches = 0
+        self.last_batch = None
+        CACHES["mpesa_journal"] = self
+
+    def open(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=FULL")
+            self._db.executescript(SCHEMA)
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(callbacks)")}
+            if "next_attempt_at" not in columns:  # Journals created before retries were spaced out
+                self._db.execute("ALTER TABLE callbacks ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+        return self
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _execute(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self.open()._db.execute(sql, params).fetchall()
+
+    # --- Ingest ---
+    def append_sync(self, body: dict) -> bool:
+        """
+        Journal one callback; False if its transaction id was already journaled.
+        """
+        txn_id = parse_callback(body)["txn_id"]
+        with self._lock:
+            cursor = self.open()._db.execute(
+                "INSERT OR IGNORE INTO callbacks (txn_id, received_at, payload) VALUES (?, ?, ?)",
+                (txn_id, time.time(), json.dumps(body)),
+            )
+        accepted = cursor.rowcount == 1
+        if accepted:
+            self.appended += 1
+        else:
+            self.duplicates += 1
+        return accepted
+
+    async def append(self, body: dict) -> bool:
+        accepted = await asyncio.to_thread(self.append_sync, body)
+        if accepted and self._wakeup is not None:
+            self._wakeup.set()
+        return accepted
+
+    # --- Apply ---
+    def _pending(self, limit: int) -> list:
+        """
+        Oldest pending callbacks that are due; ones waiting out a retry delay don't hold up newer ones.
+        """
+        return self._execute(
+            "SELECT seq, txn_id, payload, attempts FROM callbacks"
+            " WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY seq LIMIT ?",
+            (time.time(), limit),
+        )
+
+    def _mark(self, seqs: list, status: str, error: str = None):
+        if seqs:
+            placeholders = ",".join("?" * len(seqs))
+            self._execute(
+                f"UPDATE callbacks SET status = ?, applied_at = ?, error = ? WHERE seq IN ({placeholders})",
+                (status, time.time(), error, *seqs),
+            )
+
+    def _note_error(self, seqs: list, error: str):
+        """
+        Record an upstream failure without spending an attempt: the callback itself is fine.
+        """
+        if seqs:
+            placeholders = ",".join("?" * len(seqs))
+            self._execute(f"UPDATE callbacks SET error = ? WHERE seq IN ({placeholders})", (error, *seqs))
+
+    def _retry_later(self, rows: list, error: str):
+        """
+        Count a failed match for each (seq, attempts) and push it back by retry_delay();
+        park it as 'unmatched' after MPESA_MAX_ATTEMPTS.
+        """
+        now = time.time()
+        params = [
+            (attempts + 1, now + retry_delay(attempts + 1), error, MPESA_MAX_ATTEMPTS, seq)
+            for seq, attempts in rows
+        ]
+        if params:
+            with self._lock:
+                self.open()._db.executemany(
+                    "UPDATE callbacks SET attempts = ?1, next_attempt_at = ?2, error = ?3,"
+                    " status = CASE WHEN ?1 >= ?4 THEN 'unmatched' ELSE status END WHERE seq = ?5",
+                    params,
+                )
+
+    async def apply_batch(self, limit: int = MPESA_BATCH_SIZE) -> tuple:
+        """
+        Apply up to `limit` due callbacks: one payments read to match them, one update
+        to confirm the ones whose amount agrees. Returns (read, settled), where settled
+        counts callbacks that left the queue (applied, rejected or mismatched).
+        """
+        started = time.perf_counter()
+        rows = await asyncio.to_thread(self._pending, limit)
+        if not rows:
+            return 0, 0
+        confirmations = {}  # txn_id -> {"rows": [(seq, attempts)], "amount"} (dedupes replays of the same transaction)
+        rejected = []
+        for seq, txn_id, payload, attempts in rows:
+            callback = parse_callback(json.loads(payload))
+            if callback["success"]:
+                confirmation = confirmations.setdefault(txn_id, {"rows": [], "amount": None})
+                confirmation["rows"].append((seq, attempts))
+                confirmation["amount"] = callback["amount"]
+            else:
+                rejected.append(seq)
+        await asyncio.to_thread(self._mark, rejected, "rejected")
+        self.rejected += len(rejected)
+        settled = len(rejected)
+
+        if confirmations:
+            ids = ",".join('"' + txn_id.replace("\\", "\\\\").replace('"', '\\"') + '"' for txn_id in confirmations)
+            try:
+                payments = await read_records(
+                    PAYMENTS_TABLE, f"{MPESA_MATCH_COLUMN}=in.({ids})", f"id,amount,{MPESA_MATCH_COLUMN}"
+                )
+                by_txn = {str(payment.get(MPESA_MATCH_COLUMN)): payment for payment in payments}
+                confirm = [
+                    by_txn[txn_id]["id"] for txn_id, confirmation in confirmations.items()
+                    if txn_id in by_txn and amount_matches(confirmation["amount"], by_txn[txn_id]["amount"])
+                ]
+                confirmed = []
+                if confirm:
+                    confirmed = await update_record(
+                        PAYMENTS_TABLE, f"id=in.({','.join(str(i) for i in confirm)})", {"confirmed": True}, return_rows=True
+                    )
+            except Exception as e:
+                seqs = [seq for confirmation in confirmations.values() for seq, _ in confirmation["rows"]]
+                await asyncio.to_thread(self._note_error, seqs, str(e))
+                raise
+            for payment in confirmed:
+                license_state.record_payment(payment["user_id"], payment["created_at"])
+            applied, mismatched, waiting = [], {}, []
+            for txn_id, confirmation in confirmations.items():
+                payment = by_txn.get(txn_id)
+                if payment is None:
+                    waiting += confirmation["rows"]
+                elif payment["id"] in confirm:
+                    applied += [seq for seq, _ in confirmation["rows"]]
+                else:
+                    error = f"Amount {confirmation['amount']} does not match payment {payment['id']} amount {payment['amount']}"
+                    mismatched[error] = [seq for seq, _ in confirmation["rows"]]
+            await asyncio.to_thread(self._mark, applied, "applied")
+            for error, seqs in mismatched.items():
+                await asyncio.to_thread(self._mark, seqs, "mismatched", error)
+            await asyncio.to_thread(self._retry_later, waiting, "No matching payment yet")
+            self.applied += len(applied)
+            self.mismatched += sum(len(seqs) for seqs in mismatched.values())
+            self.unmatched_attempts += len(waiting)
+            settled += len(applied) + sum(len(seqs) for seqs in mismatched.values())
+
+        self.batches += 1
+        self.last_batch = {"callbacks": len(rows), "settled": settled, "seconds": round(time.perf_counter() - started, 4)}
+        return len(rows), settled
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        backoff = MPESA_POLL_INTERVAL
+        while True:
+            try:
+                # Drain full batches back to back while they make progress, then wait for
+                # the next callback or poll (unmatched callbacks come due on their own schedule)
+                while True:
+                    read, settled = await self.apply_batch()
+                    if read < MPESA_BATCH_SIZE or not settled:
+                        break
+                backoff = MPESA_POLL_INTERVAL
+            except Exception as e:
+                logger.warning("Applying M-PESA callbacks failed: %s", e)
+                backoff = min(backoff * 2, 60)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=backoff)
+                await asyncio.sleep(MPESA_BATCH_LINGER)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self.open()
+        if MPESA_APPLY_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.close()
+
+    # --- Replay + metrics ---
+    def replay(self, statuses: list = None, since_seq: int = None, txn_id: str = None) -> int:
+        """
+        Put journaled callbacks back in the pending queue. Returns how many were requeued.
+        """
+        conditions, params = [], []
+        if statuses:
+            conditions.append(f"status IN ({','.join('?' * len(statuses))})")
+            params += statuses
+        if since_seq is not None:
+            conditions.append("seq >= ?")
+            params.append(since_seq)
+        if txn_id:
+            conditions.append("txn_id = ?")
+            params.append(txn_id)
+        where = " AND ".join(conditions) or "1 = 1"
+        with self._lock:
+            cursor = self.open()._db.execute(
+                f"UPDATE callbacks SET status = 'pending', attempts = 0, next_attempt_at = 0, error = NULL WHERE {where}", params
+            )
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        depth, oldest = self._execute(
+            "SELECT COUNT(*), MIN(received_at) FROM callbacks WHERE status = 'pending'"
+        )[0]
+        return {
+            "queue_depth": depth,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "appended": self.appended,
+            "duplicates": self.duplicates,
+            "applied": self.applied,
+            "rejected": self.rejected,
+            "mismatched": self.mismatched,
+            "unmatched_attempts": self.unmatched_attempts,
+            "batches": self.batches,
+            "last_batch": self.last_batch,
+        }
+
+mpesa_journal = MpesaJournal()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or replay the M-PESA callback journal.")
+    parser.add_argument("--path", default=MPESA_JOURNAL_PATH)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Queue depth, lag and counts by status")
+    replay = commands.add_parser("replay", help="Requeue journaled callbacks for the running app to apply")
+    replay.add_argument("--status", default="unmatched", help="Comma-separated statuses to requeue: unmatched, mismatched, rejected (default: unmatched)")
+    replay.add_argument("--since-seq", type=int)
+    replay.add_argument("--txn", help="Requeue a single transaction id")
+    args = parser.parse_args(argv)
+
+    journal = MpesaJournal(args.path)
+    if args.command == "stats":
+        counts = dict(journal._execute("SELECT status, COUNT(*) FROM callbacks GROUP BY status"))
+        print(json.dumps({**journal.stats(), "by_status": counts}, indent=2))
+    else:
+        statuses = [status.strip() for status in args.status.split(",") if status.strip()] if not args.txn else None
+        print(f"Requeued {journal.replay(statuses, args.since_seq, args.txn)} callbacks.")
+    journal.close()
+
+if __name__ == "__main__":
+    main()
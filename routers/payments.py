@@ -1,5 +1,11 @@
 from fastapi import APIRouter, HTTPException, Query, Request
-from .crud import read_records, create_record, update_record
+from .crud import read_records, read_records_raw, create_record, update_record
+from .responses import RawJSONResponse
+from .export import export_response
+from .licensing import license_state
+from .mpesa_journal import mpesa_journal
+from .validation import validate_references
+import asyncio
 import os
 from typing import Optional
 from datetime import datetime
@@ -8,48 +14,52 @@ from dotenv import load_dotenv
 load_dotenv()
 
 PAYMENTS_TABLE = "payments"
-USERS_TABLE = "users"
-LISTINGS_TABLE = "listings"
+PAYMENT_EXPORT_FIELDS = "id,user_id,listing_id,amount,confirmed,checkout_request_id,created_at"
 
 router = APIRouter(
     prefix="/payments",
     tags=["payments"]
 )
 
-# Helper: Validate foreign key existence using crud helpers
-async def validate_user_and_listing(user_id: int, listing_id: int) -> None:
-    try:
-        user = await read_records(USERS_TABLE, f"id=eq.{user_id}", "id")
-        if not user:
-            raise HTTPException(status_code=400, detail="Invalid user_id")
-        listing = await read_records(LISTINGS_TABLE, f"id=eq.{listing_id}", "id")
-        if not listing:
-            raise HTTPException(status_code=400, detail="Invalid listing_id")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+def payment_filters(user_id: Optional[int] = None, listing_id: Optional[int] = None) -> str:
+    params = []
+    if user_id is not None:
+        params.append(f"user_id=eq.{user_id}")
+    if listing_id is not None:
+        params.append(f"listing_id=eq.{listing_id}")
+    return "&".join(params) if params else ""
 
 @router.get("/")
 async def get_payments(user_id: Optional[int] = Query(None), listing_id: Optional[int] = Query(None)):
     """
     Get all payments. Optionally filter by user_id and/or listing_id.
     """
-    params = []
-    if user_id is not None:
-        params.append(f"user_id=eq.{user_id}")
-    if listing_id is not None:
-        params.append(f"listing_id=eq.{listing_id}")
-    query = "&".join(params) if params else ""
+    query = payment_filters(user_id, listing_id)
     try:
-        payments = await read_records(PAYMENTS_TABLE, query)
-        return payments
+        return RawJSONResponse(await read_records_raw(PAYMENTS_TABLE, query))
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/export")
+async def export_payments(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    user_id: Optional[int] = Query(None),
+    listing_id: Optional[int] = Query(None),
+):
+    """
+    Stream all matching payments as NDJSON or CSV (e.g. the monthly finance export).
+    """
+    return await export_response(PAYMENTS_TABLE, payment_filters(user_id, listing_id), PAYMENT_EXPORT_FIELDS, format, "payments")
+
 @router.post("/")
 async def create_payment(payload: dict):
     """
     Create a payment record.
-    Payload must include 'user_id', 'amount', 'listing_id'.
+    Payload must include 'user_id', 'amount', 'listing_id'; for an M-PESA payment also
+    'checkout_request_id' (the CheckoutRequestID returned by the STK push), which is
+    what the webhook callback is matched on.
     """
     user_id = payload.get("user_id")
     listing_id = payload.get("listing_id")
@@ -57,7 +67,7 @@ async def create_payment(payload: dict):
     if not user_id or not listing_id or amount is None:
         raise HTTPException(status_code=400, detail="user_id, listing_id, and amount are required.")
 
-    await validate_user_and_listing(user_id, listing_id)
+    await validate_references(user_id=user_id, listing_id=listing_id)
 
     payment_data = {
         "user_id": user_id,
@@ -66,9 +76,16 @@ async def create_payment(payload: dict):
         "confirmed": payload.get("confirmed", False),
         "created_at": datetime.utcnow().isoformat()
     }
+    checkout_request_id = payload.get("checkout_request_id")
+    if checkout_request_id is not None:
+        if not isinstance(checkout_request_id, str) or not checkout_request_id.strip():
+            raise HTTPException(status_code=400, detail="checkout_request_id must be a non-empty string.")
+        payment_data["checkout_request_id"] = checkout_request_id.strip()
     try:
         result = await create_record(PAYMENTS_TABLE, payment_data)
         return {"success": True, "msg": "Payment recorded.", "payment": result}
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -78,8 +95,12 @@ async def confirm_payment(payment_id: int):
     Mark payment as confirmed.
     """
     try:
-        await update_record(PAYMENTS_TABLE, f"id=eq.{payment_id}", {"confirmed": True})
+        payments = await update_record(PAYMENTS_TABLE, f"id=eq.{payment_id}", {"confirmed": True}, return_rows=True)
+        for payment in payments:
+            license_state.record_payment(payment["user_id"], payment["created_at"])
         return {"success": True, "msg": "Payment confirmed."}
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -93,6 +114,8 @@ async def get_payment(payment_id: int):
         if not result:
             raise HTTPException(status_code=404, detail="Payment not found.")
         return result[0]
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -101,8 +124,22 @@ async def mpesa_webhook(request: Request):
     """
     M-PESA payment notification webhook.
     Expects JSON data from payment provider.
+    The callback is written to the durable journal and acknowledged at once;
+    a background worker applies confirmations to payments in batches.
     """
-    body = await request.json()
-    print("Received M-PESA webhook:", body)
-    # TODO: Validate, map, and update payments accordingly using CRUD helpers!
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON body.")
+    try:
+        await mpesa_journal.append(body)  # Provider retries of the same transaction are dropped here
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
     return {"success": True}
+
+@router.get("/mpesa/stats")
+async def mpesa_stats():
+    """
+    Webhook journal metrics: queue depth, lag of the oldest pending callback, counts.
+    """
+    return await asyncio.to_thread(mpesa_journal.stats)
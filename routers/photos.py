@@ -1,27 +1,128 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from .crud import read_records, create_record, delete_record
-import httpx
+from starlette.datastructures import Headers
+from typing import List
+from .crud import read_records, read_records_raw, create_record, delete_record
+from .responses import FastJSONResponse, RawJSONResponse
+from .validation import validate_references
+from .imaging import derivatives_enabled, make_variants, variant_filename
+from database import SUPABASE_URL, SUPABASE_BUCKET, gateway, get_supabase_headers
+from dotenv import load_dotenv
+import asyncio
+import hashlib
 import os
+import tempfile
 import uuid
-from dotenv import load_dotenv
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "listing-photos")  # Supabase storage bucket name
 PHOTOS_TABLE = "photos"
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", str(20 * 1024 * 1024)))  # Per-file upload limit
+UPLOAD_CHUNK_SIZE = 256 * 1024  # Bytes read from the upload and sent to storage at a time
+PHOTO_BATCH_MAX_FILES = int(os.getenv("PHOTO_BATCH_MAX_FILES", "30"))
+PHOTO_UPLOAD_CONCURRENCY = int(os.getenv("PHOTO_UPLOAD_CONCURRENCY", "4"))  # Parallel storage writes per batch
+UPLOAD_OVERHEAD_BYTES = 64 * 1024  # Multipart boundaries and form fields on top of the file limit
 
 router = APIRouter(
     prefix="/photos",
     tags=["photos"]
 )
 
-def get_supabase_headers():
+class UploadTooLarge(Exception):
+    pass
+
+class StreamingUpload:
+    """
+    Reads an UploadFile in fixed-size chunks for httpx to stream to storage,
+    hashing (SHA-256) and counting bytes on the way. Stops with UploadTooLarge
+    as soon as the size passes `max_bytes`, so memory per upload stays at one chunk.
+    """
+
+    def __init__(self, file: UploadFile, max_bytes: int = PHOTO_MAX_BYTES, copy_to=None):
+        self.file = file
+        self.max_bytes = max_bytes
+        self.copy_to = copy_to  # Optional binary file that receives a copy of every chunk
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    async def __aiter__(self):
+        while True:
+            chunk = await self.file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            self.size += len(chunk)
+            if self.size > self.max_bytes:
+                raise UploadTooLarge()
+            self.sha256.update(chunk)
+            if self.copy_to is not None:
+                self.copy_to.write(chunk)
+            yield chunk
+
+async def put_object(filename: str, content, content_type: str):
+    """
+    Write one object into the Supabase Storage bucket; returns its public URL.
+    """
+    headers = get_supabase_headers()
+    headers["Content-Type"] = content_type
+    resp = await gateway.request(
+        "POST", f"/storage/v1/object/{SUPABASE_BUCKET}/{filename}", "storage", headers=headers, content=content
+    )
+    if resp.status_code not in (200, 201):
+        raise HTTPException(status_code=resp.status_code, detail=f"Upload failed: {resp.text}")
+    # Make public URL (depends on your Supabase settings, check your bucket/policy config)
+    return f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{filename}"
+
+async def store_variants(filename: str, source_path: str) -> dict:
+    """
+    Render thumbnail/medium/WebP variants in the image process pool and store them
+    next to the original. Returns {variant: public URL}; {} if rendering is unavailable.
+    """
+    rendered = await make_variants(source_path)
+    if not rendered:
+        return {}
+    names = list(rendered)
+    urls = await asyncio.gather(
+        *(put_object(variant_filename(filename, name), rendered[name], "image/webp") for name in names),
+        return_exceptions=True,
+    )
+    return {name: url for name, url in zip(names, urls) if isinstance(url, str)}
+
+async def upload_to_storage(file: UploadFile) -> dict:
+    """
+    Stream one file into the Supabase Storage bucket, then store its derivatives.
+    Returns its storage filename, public URL, variant URLs, SHA-256 and size;
+    raises HTTPException on failure.
+    """
+    # Reject early when the size is already known (spooled uploads report it)
+    size = getattr(file, "size", None)
+    if size is not None and size > PHOTO_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File too large (max {PHOTO_MAX_BYTES} bytes).")
+
+    filename = f"{uuid.uuid4().hex}_{file.filename}"
+    content_type = file.content_type or "application/octet-stream"
+    # Images are also copied to a temp file (not memory) for the derivative workers
+    copy = None
+    if derivatives_enabled() and content_type.startswith("image/"):
+        copy = tempfile.NamedTemporaryFile(prefix="kejahunt-upload-", delete=False)
+    try:
+        body = StreamingUpload(file, copy_to=copy)
+        try:
+            public_url = await put_object(filename, body, content_type)
+        except UploadTooLarge:
+            raise HTTPException(status_code=413, detail=f"File too large (max {PHOTO_MAX_BYTES} bytes).")
+        variants = {}
+        if copy is not None:
+            copy.close()
+            variants = await store_variants(filename, copy.name)
+    finally:
+        if copy is not None:
+            copy.close()
+            os.unlink(copy.name)
     return {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/json"
+        "filename": filename,
+        "url": public_url,
+        "variants": variants,
+        "sha256": body.sha256.hexdigest(),
+        "size": body.size,
     }
 
 @router.post("/upload/")
@@ -31,38 +132,107 @@ async def upload_photo(
 ):
     """
     Uploads an image file for a property listing; saves public URL in photos table.
+    The file is streamed to storage in chunks (never fully loaded into memory).
     """
+    await validate_references(listing_id=listing_id)  # Before any bytes go to storage
     # Save to Supabase Storage
-    filename = f"{uuid.uuid4().hex}_{file.filename}"
-    storage_url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{filename}"
-    file_content = await file.read()
-
-    headers = get_supabase_headers()
-    headers.pop("Content-Type")  # Required for multipart upload
-
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            storage_url,
-            headers=headers,
-            content=file_content
-        )
-        if resp.status_code not in (200, 201):
-            raise HTTPException(status_code=resp.status_code, detail=f"Upload failed: {resp.text}")
-
-    # Make public URL (depends on your Supabase settings, check your bucket/policy config)
-    public_url = f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{filename}"
+    stored = await upload_to_storage(file)
 
     # Store photo record in photos table using CRUD helper
     photo_info = {
         "listing_id": listing_id,
-        "url": public_url
+        "url": stored["url"]
     }
+    if stored["variants"]:
+        photo_info["variants"] = stored["variants"]
     try:
         result = await create_record(PHOTOS_TABLE, photo_info)
-        return {"success": True, "url": public_url, "photo": result}
+        return {
+            "success": True,
+            "url": stored["url"],
+            "variants": stored["variants"],
+            "sha256": stored["sha256"],
+            "size": stored["size"],
+            "photo": result,
+        }
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/upload/batch/")
+async def upload_photos_batch(
+    listing_id: int = Form(...),
+    files: List[UploadFile] = File(...)
+):
+    """
+    Upload many photos for one listing in a single request.
+    Files go to storage concurrently (PHOTO_UPLOAD_CONCURRENCY at a time), then all
+    photos rows are inserted in one bulk insert. Returns a result per file.
+    """
+    if len(files) > PHOTO_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {PHOTO_BATCH_MAX_FILES} files per batch.")
+    await validate_references(listing_id=listing_id)
+    semaphore = asyncio.Semaphore(PHOTO_UPLOAD_CONCURRENCY)
+
+    async def upload_one(file: UploadFile) -> dict:
+        async with semaphore:
+            try:
+                return {"file": file.filename, "ok": True, **await upload_to_storage(file)}
+            except HTTPException as he:
+                return {"file": file.filename, "ok": False, "error": he.detail}
+            except Exception as e:
+                return {"file": file.filename, "ok": False, "error": str(e)}
+
+    results = await asyncio.gather(*(upload_one(file) for file in files))
+    stored = [result for result in results if result["ok"]]
+    if stored:
+        try:
+            photo_rows = [{"listing_id": listing_id, "url": result["url"]} for result in stored]
+            if any(result["variants"] for result in stored):
+                # Bulk inserts need the same keys on every row
+                for row, result in zip(photo_rows, stored):
+                    row["variants"] = result["variants"] or None
+            rows = await create_record(PHOTOS_TABLE, photo_rows)
+        except Exception as e:
+            for result in stored:
+                result.update(ok=False, error=f"Stored but not recorded: {e}")
+        else:
+            by_url = {row.get("url"): row for row in rows}
+            for result in stored:
+                result["photo"] = by_url.get(result["url"])
+    uploaded = sum(1 for result in results if result["ok"])
+    return {"success": uploaded == len(results), "uploaded": uploaded, "results": results}
+
+def upload_size_limit(path: str) -> int:
+    """
+    Largest request body accepted for an upload route (checked by UploadSizeMiddleware before parsing).
+    """
+    if path.startswith("/photos/upload/batch"):
+        return PHOTO_MAX_BYTES * PHOTO_BATCH_MAX_FILES
+    return PHOTO_MAX_BYTES
+
+class UploadSizeMiddleware:
+    """
+    Rejects photo uploads whose Content-Length is over the limit (413) before the
+    body is read. Pure ASGI: every other request passes straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith("/photos/upload"):
+            await self.app(scope, receive, send)
+            return
+        length = Headers(scope=scope).get("content-length")
+        limit = upload_size_limit(scope["path"])
+        if length and length.isdigit() and int(length) > limit + UPLOAD_OVERHEAD_BYTES:
+            response = FastJSONResponse({"detail": f"Upload too large (max {limit} bytes)."}, status_code=413)
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
 @router.get("/")
 async def get_photos(listing_id: int = None):
     """
@@ -70,8 +240,9 @@ async def get_photos(listing_id: int = None):
     """
     query = f"listing_id=eq.{listing_id}" if listing_id else ""
     try:
-        photos = await read_records(PHOTOS_TABLE, query)
-        return photos
+        return RawJSONResponse(await read_records_raw(PHOTOS_TABLE, query))
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -83,5 +254,7 @@ async def delete_photo(photo_id: int):
     try:
         await delete_record(PHOTOS_TABLE, f"id=eq.{photo_id}")
         return {"success": True, "msg": "Photo deleted from photos table."}
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
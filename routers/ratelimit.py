@@ -0,0 +1,229 @@
+import asyncio
+import math
+import os
+import time
+from starlette.datastructures import Headers
+from dotenv import load_dotenv
+from .cache import CACHES, TTLCache
+from .auth import verify_token
+from .responses import FastJSONResponse
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")  # Per-client token buckets (429)
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() in ("1", "true", "yes")  # Per-route-class concurrency (503)
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")  # Behind a proxy
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))  # Buckets kept (LRU beyond that)
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "0.5"))  # Seconds to wait for a free slot before 503
+
+# --- Token-bucket policies: "<requests>/<seconds>", e.g. RATE_LIMIT_LOGIN=5/60 ---
+def parse_rate(value: str) -> tuple:
+    count, _, seconds = value.partition("/")
+    return int(count), float(seconds or 1)
+
+RATE_LIMITS = {
+    policy: parse_rate(os.getenv(f"RATE_LIMIT_{policy.upper()}", default))
+    for policy, default in {
+        "login": "10/60",
+        "register": "5/600",
+        "listings": "30/10",
+        "default": "60/10",
+    }.items()
+}
+
+# First match wins: (method or None for any, path prefix, policy, key by)
+# "ip" always uses the client address; "user" uses the verified JWT `sub` when there is one.
+ROUTE_POLICIES = (
+    ("POST", "/auth/login", "login", "ip"),
+    ("POST", "/auth/register", "register", "ip"),
+    ("GET", "/listings", "listings", "user"),
+)
+RATE_LIMIT_EXEMPT = ("/payments/mpesa/webhook",)  # Provider retries; only the webhook concurrency budget applies
+UNLIMITED_PATHS = ("/metrics", "/docs", "/redoc", "/openapi.json")
+
+# --- Concurrent requests per route class (e.g. ADMISSION_READ=200) ---
+ADMISSION_LIMITS = {
+    route_class: int(os.getenv(f"ADMISSION_{route_class.upper()}", default))
+    for route_class, default in {
+        "read": "200",
+        "write": "50",
+        "webhook": "20",
+    }.items()
+}
+
+def route_class(method: str, path: str) -> str:
+    if path.startswith("/payments/mpesa/webhook"):
+        return "webhook"
+    return "read" if method in ("GET", "HEAD") else "write"
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+# --- Token buckets per (policy, client) ---
+class RateLimiter:
+    """
+    Each client gets `count` requests per `seconds` per policy, refilled continuously.
+    Buckets live in a TTLCache, dropped once they would be full again.
+    """
+
+    def __init__(self, limits: dict, max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.limits = limits
+        self.buckets = TTLCache("rate_limit_buckets", maxsize=max_clients, ttl=max(s for _, s in limits.values()))
+        self.allowed = 0
+        self.limited = {policy: 0 for policy in limits}
+        CACHES["rate_limiter"] = self
+
+    def policy_for(self, method: str, path: str) -> tuple:
+        for route_method, prefix, policy, key_by in ROUTE_POLICIES:
+            if (route_method is None or route_method == method) and path.startswith(prefix):
+                return policy, key_by
+        return "default", "user"
+
+    def take(self, policy: str, client: str) -> float:
+        """
+        Spend one token; returns 0 if allowed, else seconds until a token is available.
+        """
+        count, seconds = self.limits[policy]
+        rate = count / seconds
+        now = time.monotonic()
+        key = (policy, client)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            tokens = count
+        else:
+            tokens = min(count, bucket[0] + (now - bucket[1]) * rate)
+        if tokens < 1:
+            self.buckets.set(key, (tokens, now), ttl=seconds)
+            self.limited[policy] += 1
+            return (1 - tokens) / rate
+        self.buckets.set(key, (tokens - 1, now), ttl=seconds)
+        self.allowed += 1
+        return 0.0
+
+    def stats(self) -> dict:
+        return {"clients": len(self.buckets), "allowed": self.allowed, **{f"limited_{p}": n for p, n in self.limited.items()}}
+
+# --- Admission control: concurrent requests per route class ---
+class Admission:
+    """
+    A semaphore per route class so a burst of one kind (e.g. listing reads) can't take
+    all the Supabase capacity from the others. Waits up to ADMISSION_QUEUE_TIMEOUT for a slot.
+    """
+
+    def __init__(self, limits: dict, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.limits = limits
+        self.queue_timeout = queue_timeout
+        self._semaphores = {}  # Created on first use, inside the running loop
+        self.in_flight = {name: 0 for name in limits}
+        self.rejected = {name: 0 for name in limits}
+        CACHES["admission"] = self
+
+    def semaphore(self, route_class: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(route_class)
+        if semaphore is None:
+            semaphore = self._semaphores[route_class] = asyncio.Semaphore(self.limits[route_class])
+        return semaphore
+
+    async def acquire(self, route_class: str) -> bool:
+        semaphore = self.semaphore(route_class)
+        if semaphore.locked():
+            if self.queue_timeout <= 0:
+                self.rejected[route_class] += 1
+                return False
+            try:
+                await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected[route_class] += 1
+                return False
+        else:
+            await semaphore.acquire()
+        self.in_flight[route_class] += 1
+        return True
+
+    def release(self, route_class: str):
+        self.in_flight[route_class] -= 1
+        self._semaphores[route_class].release()
+
+    def stats(self) -> dict:
+        stats = {}
+        for name, limit in self.limits.items():
+            stats[f"{name}_in_flight"] = self.in_flight[name]
+            stats[f"{name}_limit"] = limit
+            stats[f"{name}_rejected"] = self.rejected[name]
+        return stats
+
+rate_limiter = RateLimiter(RATE_LIMITS)
+admission = Admission(ADMISSION_LIMITS)
+
+def client_address(scope, headers: Headers) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()  # Appended by our proxy; earlier entries are client-supplied
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def client_key(scope, headers: Headers, key_by: str) -> str:
+    """
+    'user:<sub>' for a valid bearer token (cached verification) when keying by user, else 'ip:<address>'.
+    """
+    if key_by == "user":
+        authorization = headers.get("authorization", "")
+        if authorization[:7].lower() == "bearer ":
+            try:
+                sub = verify_token(authorization[7:]).get("sub")
+            except Exception:
+                sub = None  # Invalid tokens are limited by address; the route still rejects them
+            if sub:
+                return f"user:{sub}"
+    return f"ip:{client_address(scope, headers)}"
+
+class RateLimitMiddleware:
+    """
+    Token-bucket rate limits per client and route policy (429), then a concurrency
+    budget per route class (503). Both answer with Retry-After before the route runs,
+    so rejected requests cost no Supabase calls.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not (RATE_LIMIT_ENABLED or ADMISSION_CONTROL_ENABLED)
+            or scope["method"] == "OPTIONS"
+            or scope["path"].startswith(UNLIMITED_PATHS)
+        ):
+            await self.app(scope, receive, send)
+            return
+        method, path = scope["method"], scope["path"]
+        if RATE_LIMIT_ENABLED and not path.startswith(RATE_LIMIT_EXEMPT):
+            headers = Headers(scope=scope)
+            policy, key_by = rate_limiter.policy_for(method, path)
+            wait = rate_limiter.take(policy, client_key(scope, headers, key_by))
+            if wait:
+                response = FastJSONResponse(
+                    {"detail": "Too many requests, slow down."},
+                    status_code=429,
+                    headers={"Retry-After": retry_after_header(wait)},
+                )
+                await response(scope, receive, send)
+                return
+
+        if not ADMISSION_CONTROL_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        request_class = route_class(method, path)
+        if not await admission.acquire(request_class):
+            response = FastJSONResponse(
+                {"detail": "Server busy, try again shortly."},
+                status_code=503,
+                headers={"Retry-After": retry_after_header(1)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(request_class)
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, HTTPException, Query
-from .crud import read_records, create_record
+from fastapi import APIRouter, HTTPException, Request, Query
+from .crud import create_record
+from .cache import regions_cache
+from .conditional import REFERENCE_CACHE_CONTROL, conditional_response, make_etag
 # If you want to support updates/deletes later, import update_record, delete_record
+# (and call regions_cache.invalidate() after them)
 
 REGIONS_TABLE = "regions"
 
@@ -10,29 +13,41 @@ router = APIRouter(
 )
 
 @router.get("/")
-async def get_regions(county_id: int = Query(None, description="Filter regions by county_id")):
+async def get_regions(
+    request: Request,
+    county_id: int = Query(None, description="Filter regions by county_id"),
+):
     """
     Retrieve all regions. Optional county_id filter.
+    Served from the in-memory reference cache, with an ETag (304 on If-None-Match).
     """
-    query = f"county_id=eq.{county_id}" if county_id is not None else ""
     try:
-        regions = await read_records(REGIONS_TABLE, query)
-        return regions
+        if county_id is not None:
+            regions = await regions_cache.find(county_id=county_id)
+        else:
+            regions = await regions_cache.all()
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    etag = make_etag(REGIONS_TABLE, regions_cache.fingerprint, county_id)
+    return conditional_response(request, etag, REFERENCE_CACHE_CONTROL, regions)
 
 @router.get("/{region_id}")
-async def get_region(region_id: int):
+async def get_region(region_id: int, request: Request):
     """
-    Get details for a single region by its ID.
+    Get details for a single region by its ID (with an ETag, like the list).
     """
     try:
-        result = await read_records(REGIONS_TABLE, f"id=eq.{region_id}")
-        if not result:
-            raise HTTPException(status_code=404, detail="Region not found.")
-        return result[0]
+        result = await regions_cache.get(region_id)
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not result:
+        raise HTTPException(status_code=404, detail="Region not found.")
+    etag = make_etag(REGIONS_TABLE, regions_cache.fingerprint, "id", region_id)
+    return conditional_response(request, etag, REFERENCE_CACHE_CONTROL, result)
 
 @router.post("/")
 async def add_region(payload: dict):
@@ -46,11 +61,12 @@ async def add_region(payload: dict):
         raise HTTPException(status_code=400, detail="Both name and county_id are required.")
 
     try:
-        # Prevent duplicates by name within the same county
-        dups = await read_records(REGIONS_TABLE, f"name=eq.{name}&county_id=eq.{county_id}")
+        # Prevent duplicates by name within the same county (answered from the reference cache)
+        dups = await regions_cache.find(name=name, county_id=county_id)
         if dups:
             raise HTTPException(status_code=409, detail="Region with this name already exists in the county.")
         await create_record(REGIONS_TABLE, {"name": name, "county_id": county_id})
+        regions_cache.invalidate()
         return {"success": True, "msg": "Region added successfully."}
     except HTTPException as he:
         raise he
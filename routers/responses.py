@@ -0,0 +1,30 @@
+import json
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional: the stdlib encoder is used without it
+    orjson = None
+
+def dumps(content) -> bytes:
+    """
+    Encode plain JSON data (dicts/lists as decoded from PostgREST) to compact UTF-8 bytes.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """
+    App-wide default response class (orjson when installed). Returning one directly
+    from a route also skips FastAPI's jsonable_encoder pass over the data.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+class RawJSONResponse(Response):
+    """
+    Already-encoded JSON (e.g. a PostgREST body from read_records_raw), sent as is.
+    """
+    media_type = "application/json"
@@ -0,0 +1,177 @@
+import heapq
+import math
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from .cache import CACHES
+from .listing_feed import listing_feed
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+FIELD_WEIGHTS = {"title": 3.0, "type": 2.0, "description": 1.0}  # A title hit outranks a description hit
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def tokenize(text) -> list:
+    return TOKEN_RE.findall(str(text).lower()) if text else []
+
+# --- In-memory keyword + attribute index over listings ---
+class ListingSearchIndex:
+    """
+    Inverted index over listing title/description/type with BM25 ranking, plus
+    attribute maps (type, region) and a sorted (price, id) array for price ranges.
+    Fed by ListingFeed: rebuild() for full snapshots, apply() for changed rows.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.postings = defaultdict(dict)  # token -> {listing_id: weighted term frequency}
+        self.doc_terms = {}                # listing_id -> {token: weighted tf}, for removal
+        self.doc_length = {}               # listing_id -> total weighted terms
+        self.total_length = 0.0
+        self.docs = {}                     # listing_id -> (price, type, region_id)
+        self.by_type = defaultdict(set)
+        self.by_region = defaultdict(set)
+        self.prices = []                   # Sorted (price, listing_id)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def rebuild(self, rows: list):
+        self._reset()
+        for row in rows:
+            self._add(row, keep_sorted=False)
+        self.prices.sort()
+
+    def apply(self, rows: list):
+        for row in rows:
+            self.remove(row["id"])
+            self._add(row)
+
+    def _add(self, row: dict, keep_sorted: bool = True):
+        listing_id = row["id"]
+        terms = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(row.get(field)):
+                terms[token] += weight
+        for token, tf in terms.items():
+            self.postings[token][listing_id] = tf
+        length = sum(terms.values())
+        self.doc_terms[listing_id] = terms
+        self.doc_length[listing_id] = length
+        self.total_length += length
+
+        price = float(row["price"]) if row.get("price") is not None else None
+        listing_type = (row.get("type") or "").lower()
+        region_id = row.get("region_id")
+        self.docs[listing_id] = (price, listing_type, region_id)
+        self.by_type[listing_type].add(listing_id)
+        self.by_region[region_id].add(listing_id)
+        if price is not None:
+            if keep_sorted:
+                insort(self.prices, (price, listing_id))
+            else:
+                self.prices.append((price, listing_id))
+
+    def remove(self, listing_id):
+        doc = self.docs.pop(listing_id, None)
+        if doc is None:
+            return
+        for token in self.doc_terms.pop(listing_id):
+            postings = self.postings[token]
+            postings.pop(listing_id, None)
+            if not postings:
+                del self.postings[token]
+        self.total_length -= self.doc_length.pop(listing_id)
+        price, listing_type, region_id = doc
+        self.by_type[listing_type].discard(listing_id)
+        self.by_region[region_id].discard(listing_id)
+        if price is not None:
+            i = bisect_left(self.prices, (price, listing_id))
+            if i < len(self.prices) and self.prices[i] == (price, listing_id):
+                del self.prices[i]
+
+    def ids_in_price_range(self, price_min: float = None, price_max: float = None) -> set:
+        lo = 0 if price_min is None else bisect_left(self.prices, (price_min, float("-inf")))
+        hi = len(self.prices) if price_max is None else bisect_right(self.prices, (price_max, float("inf")))
+        return {listing_id for _, listing_id in self.prices[lo:hi]}
+
+    def score(self, query: str, within: set = None) -> dict:
+        """
+        BM25 score for every listing matching at least one query term
+        (restricted to `within` when given).
+        """
+        tokens = set(tokenize(query))
+        n = len(self.docs)
+        if not tokens or not n:
+            return {}
+        avg_length = self.total_length / n or 1.0
+        doc_length = self.doc_length
+        scores = defaultdict(float)
+        for token in tokens:
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            if within is not None and len(within) < len(postings):
+                # Walk the smaller side: probe the postings for each filtered id
+                matches = ((listing_id, postings[listing_id]) for listing_id in within if listing_id in postings)
+            else:
+                matches = postings.items() if within is None else (
+                    (listing_id, tf) for listing_id, tf in postings.items() if listing_id in within
+                )
+            for listing_id, tf in matches:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_length[listing_id] / avg_length)
+                scores[listing_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def filter_ids(self, region_ids: set = None, type: str = None, price_min: float = None, price_max: float = None):
+        """
+        Ids passing the attribute filters, or None when no filter is set.
+        Sets are intersected smallest first.
+        """
+        sets = []
+        if type is not None:
+            sets.append(self.by_type.get(type.lower(), set()))
+        if region_ids is not None:
+            allowed = set()
+            for region_id in region_ids:
+                allowed |= self.by_region.get(region_id, set())
+            sets.append(allowed)
+        if price_min is not None or price_max is not None:
+            sets.append(self.ids_in_price_range(price_min, price_max))
+        if not sets:
+            return None
+        sets.sort(key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            result &= other
+        return result
+
+    def search(
+        self,
+        query: str,
+        region_ids: set = None,
+        type: str = None,
+        price_min: float = None,
+        price_max: float = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> tuple:
+        """
+        Rank keyword matches that pass the attribute filters.
+        Returns (total matches, [(listing_id, score), ...] for the requested page).
+        """
+        within = self.filter_ids(region_ids, type, price_min, price_max)
+        scores = self.score(query, within)
+        top = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return len(scores), [(listing_id, round(score, 4)) for listing_id, score in top[offset:]]
+
+    def stats(self) -> dict:
+        return {"listings": len(self.docs), "terms": len(self.postings)}
+
+search_index = ListingSearchIndex()
+listing_feed.subscribe(search_index)
+CACHES["listing_feed"] = listing_feed
+CACHES["listing_search"] = search_index
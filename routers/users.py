@@ -1,7 +1,12 @@
 from fastapi import APIRouter, HTTPException, Query, Body
-from .crud import read_records, create_record, update_record, delete_record
+from .crud import read_records, read_records_raw, create_record, update_record, delete_record
+from .responses import RawJSONResponse
+from .export import export_response
+from .auth import invalidate_profile
+from .validation import forget_reference
 
 USERS_TABLE = "users"
+USER_EXPORT_FIELDS = "id,email,role"
 
 router = APIRouter(
     prefix="/users",
@@ -15,11 +20,23 @@ async def get_users(role: str = Query(None, description="Optional: filter by rol
     """
     query = f"role=eq.{role}" if role else ""
     try:
-        users = await read_records(USERS_TABLE, query)
-        return users
+        return RawJSONResponse(await read_records_raw(USERS_TABLE, query))
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/export")
+async def export_users(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    role: str = Query(None, description="Optional: filter by role (landlord/user)"),
+):
+    """
+    Stream all users (optional role filter) as NDJSON or CSV.
+    """
+    query = f"role=eq.{role}" if role else ""
+    return await export_response(USERS_TABLE, query, USER_EXPORT_FIELDS, format, "users")
+
 @router.get("/{user_id}")
 async def get_user_by_id(user_id: str):
     """
@@ -30,6 +47,8 @@ async def get_user_by_id(user_id: str):
         if not results:
             raise HTTPException(status_code=404, detail="User not found.")
         return results[0]
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -43,6 +62,8 @@ async def get_user_by_email(email: str):
         if not results:
             raise HTTPException(status_code=404, detail="User not found.")
         return results[0]
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -56,7 +77,10 @@ async def update_user(user_id: str, payload: dict = Body(...)):
         raise HTTPException(status_code=400, detail="No fields to update.")
     try:
         await update_record(USERS_TABLE, f"id=eq.{user_id}", payload)
+        invalidate_profile(user_id)
         return {"success": True, "msg": "User updated."}
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -67,6 +91,10 @@ async def delete_user(user_id: str):
     """
     try:
         await delete_record(USERS_TABLE, f"id=eq.{user_id}")
+        invalidate_profile(user_id)
+        forget_reference(USERS_TABLE, user_id)
         return {"success": True, "msg": "User deleted from table."}
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,65 @@
+import asyncio
+import os
+from fastapi import HTTPException
+from dotenv import load_dotenv
+from .cache import TTLCache
+from .coalesce import coalesced_read_records
+
+load_dotenv()
+
+REFERENCE_CACHE_SIZE = int(os.getenv("REFERENCE_EXISTS_CACHE_SIZE", "50000"))
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_EXISTS_CACHE_TTL", "300"))  # How long "this id exists" is trusted
+
+# Payload field -> table it must reference
+REFERENCE_TABLES = {
+    "user_id": "users",
+    "listing_id": "listings",
+}
+
+# Only ids seen to exist are remembered; a miss is always re-checked upstream
+known_ids = TTLCache("known_references", maxsize=REFERENCE_CACHE_SIZE, ttl=REFERENCE_CACHE_TTL)
+
+async def reference_exists(table: str, record_id) -> bool:
+    key = (table, str(record_id))
+    if known_ids.get(key):
+        return True
+    rows = await coalesced_read_records(table, f"id=eq.{record_id}", "id")
+    if rows:
+        known_ids.set(key, True)
+    return bool(rows)
+
+def forget_reference(table: str, record_id):
+    """
+    Drop a cached "exists" answer; call after deleting the row.
+    """
+    known_ids.pop((table, str(record_id)))
+
+async def validate_references(**references):
+    """
+    Check every `field=id` against its table (REFERENCE_TABLES) concurrently.
+    Raises 400 naming the first invalid field, 500 if a lookup fails.
+    """
+    fields = [field for field, value in references.items() if value is not None]
+    try:
+        found = await asyncio.gather(
+            *(reference_exists(REFERENCE_TABLES[field], references[field]) for field in fields)
+        )
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    for field, exists in zip(fields, found):
+        if not exists:
+            raise HTTPException(status_code=400, detail=f"Invalid {field}")
+
+async def invalid_references(field: str, ids: list) -> list:
+    """
+    The ids in `ids` that do not exist in the table `field` references (checked concurrently).
+    """
+    try:
+        found = await asyncio.gather(*(reference_exists(REFERENCE_TABLES[field], record_id) for record_id in ids))
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return [record_id for record_id, exists in zip(ids, found) if not exists]
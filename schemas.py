@@ -58,6 +58,7 @@ class ListingOut(BaseModel):
     region_id: int
     description: Optional[str] = None
     photos: Optional[List[dict]] = None
+    updated_at: Optional[str] = None  # Bumped by the listings_set_updated_at trigger
 
 # --- Photo Schemas ---
 class PhotoCreate(BaseModel):
@@ -75,6 +76,7 @@ class PaymentCreate(BaseModel):
     listing_id: int
     amount: float
     confirmed: bool = False
+    checkout_request_id: Optional[str] = None  # M-PESA CheckoutRequestID of the STK push; callbacks match on it
 
 class PaymentOut(BaseModel):
     id: int
@@ -82,6 +84,7 @@ class PaymentOut(BaseModel):
     listing_id: int
     amount: float
     confirmed: bool
+    checkout_request_id: Optional[str] = None
 
 # --- Favourites Schemas ---
 class FavouriteCreate(BaseModel):
@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+import httpx
+import pytest
+
+# Placeholder config so the routers package imports without a .env; no test talks to a real service
+for name, value in {
+    "SUPABASE_URL": "http://supabase.test",
+    "SUPABASE_KEY": "test-key",
+    "SUPABASE_JWT_SECRET": "test-secret",
+    "MAIL_USERNAME": "test",
+    "MAIL_PASSWORD": "test",
+    "MAIL_FROM": "noreply@example.com",
+    "MAIL_SERVER": "localhost",
+    "RATE_LIMIT_ENABLED": "false",  # Every TestClient request comes from one address
+    "MPESA_JOURNAL_PATH": os.path.join(tempfile.gettempdir(), "kejahunt_test_mpesa_journal.sqlite3"),
+}.items():
+    os.environ.setdefault(name, value)
+
+class StubSupabase:
+    """
+    Stands in for Supabase behind the shared gateway: `handler(request)` (sync or async)
+    answers every call, `requests` records them in order.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.handler = lambda request: httpx.Response(200, json=[])
+
+    async def __call__(self, request):
+        self.requests.append(request)
+        response = self.handler(request)
+        if not isinstance(response, httpx.Response):
+            response = await response
+        return response
+
+@pytest.fixture
+def supabase():
+    from database import gateway
+
+    stub = StubSupabase()
+    gateway._client = httpx.AsyncClient(transport=httpx.MockTransport(stub), base_url=os.environ["SUPABASE_URL"])
+    yield stub
+    gateway._client = None
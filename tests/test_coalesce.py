@@ -0,0 +1,60 @@
+import asyncio
+
+import httpx
+
+from routers.coalesce import coalesced_read_records, read_flight
+
+def test_concurrent_identical_reads_make_one_upstream_call(supabase):
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(request):
+            await release.wait()  # Hold the call open until every reader has joined
+            return httpx.Response(200, json=[{"id": 1, "name": "Nairobi"}])
+
+        supabase.handler = handler
+        shared_before = read_flight.shared
+        readers = [asyncio.create_task(coalesced_read_records("counties", "id=eq.1")) for _ in range(50)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*readers)
+        return results, read_flight.shared - shared_before
+
+    results, shared = asyncio.run(scenario())
+    assert len(supabase.requests) == 1
+    assert shared == 49
+    assert all(result == [{"id": 1, "name": "Nairobi"}] for result in results)
+
+def test_different_reads_are_not_coalesced(supabase):
+    async def scenario():
+        await asyncio.gather(
+            coalesced_read_records("counties", "id=eq.1"),
+            coalesced_read_records("counties", "id=eq.2"),
+            coalesced_read_records("regions", "id=eq.1"),
+        )
+
+    asyncio.run(scenario())
+    assert len(supabase.requests) == 3
+
+def test_failure_is_shared_then_forgotten(supabase):
+    async def scenario():
+        release = asyncio.Event()
+        status = {"code": 400}
+
+        async def handler(request):
+            await release.wait()
+            return httpx.Response(status["code"], json=[] if status["code"] == 200 else {"message": "bad"})
+
+        supabase.handler = handler
+        readers = [asyncio.create_task(coalesced_read_records("counties", "id=eq.9")) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        outcomes = await asyncio.gather(*readers, return_exceptions=True)
+        status["code"] = 200
+        retried = await coalesced_read_records("counties", "id=eq.9")  # Not served the old failure
+        return outcomes, retried
+
+    outcomes, retried = asyncio.run(scenario())
+    assert all(isinstance(outcome, Exception) for outcome in outcomes)
+    assert len(supabase.requests) == 2
+    assert retried == []
@@ -0,0 +1,37 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from routers.compression import CompressionMiddleware
+from routers.conditional import conditional_response, make_etag
+
+ROWS = [{"id": i, "title": f"Listing {i}"} for i in range(200)]  # Well over COMPRESS_MIN_BYTES
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware)
+
+@app.get("/rows")
+async def rows(request: Request):
+    return conditional_response(request, make_etag("rows", ROWS), "public, no-cache", ROWS)
+
+def test_304_carries_the_validator_of_the_compressed_200():
+    client = TestClient(app)
+    full = client.get("/rows", headers={"Accept-Encoding": "gzip"})
+    assert full.headers["content-encoding"] == "gzip"
+    assert full.headers["etag"].startswith('W/"')
+
+    revalidated = client.get("/rows", headers={"Accept-Encoding": "gzip", "If-None-Match": full.headers["etag"]})
+
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == full.headers["etag"]
+    assert "accept-encoding" in revalidated.headers["vary"].lower()
+
+def test_304_without_negotiated_encoding_keeps_the_strong_etag():
+    client = TestClient(app)
+    full = client.get("/rows", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in full.headers
+
+    revalidated = client.get("/rows", headers={"Accept-Encoding": "identity", "If-None-Match": full.headers["etag"]})
+
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == full.headers["etag"]
+    assert not revalidated.headers["etag"].startswith("W/")
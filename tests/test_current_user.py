@@ -0,0 +1,26 @@
+import httpx
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from routers.auth import get_current_user, profile_cache
+
+def test_profile_is_read_once_per_request_then_served_from_cache(supabase):
+    supabase.handler = lambda request: httpx.Response(200, json=[{"email": "a@example.com", "role": "landlord"}])
+    profile_cache.pop("42")
+    app = FastAPI()
+
+    async def role(user=Depends(get_current_user)):
+        return user["profile"]["role"]
+
+    @app.get("/whoami")
+    async def whoami(user=Depends(get_current_user), role=Depends(role)):
+        return {"id": user["id"], "role": role}
+
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {jwt.encode({'sub': '42'}, 'test-secret', algorithm='HS256')}"}
+
+    assert client.get("/whoami", headers=headers).json() == {"id": "42", "role": "landlord"}
+    assert len(supabase.requests) == 1
+    client.get("/whoami", headers=headers)
+    assert len(supabase.requests) == 1
@@ -0,0 +1,37 @@
+import csv
+import io
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+from main import app
+from routers.export import export_columns
+
+def test_export_columns_follow_the_select():
+    assert export_columns("id,listing:listings(id,title),photos(*),price::text") == ["id", "listing", "photos", "price"]
+
+def test_csv_export_uses_the_select_columns_and_json_literals(supabase):
+    rows = [
+        {"id": 1, "user_id": 3, "listing_id": 5, "amount": 1000.0, "confirmed": True, "checkout_request_id": None, "created_at": "2026-01-01"},
+        {"id": 2, "user_id": 4, "listing_id": 6, "amount": 1500, "confirmed": False, "checkout_request_id": "", "created_at": "2026-01-02"},
+    ]
+    supabase.handler = lambda request: httpx.Response(200, json=rows)
+    client = TestClient(app)
+
+    response = client.get("/payments/export", params={"format": "csv"})
+
+    assert response.status_code == 200
+    select = supabase.requests[0].url.params["select"]
+    lines = response.text.splitlines()
+    assert lines[0].split(",") == select.split(",")
+    assert lines[1] == "1,3,5,1000.0,true,,2026-01-01"
+    assert lines[2] == '2,4,6,1500,false,"",2026-01-02'
+    parsed = list(csv.DictReader(io.StringIO(response.text)))
+    ndjson = [json.loads(line) for line in client.get("/payments/export").text.splitlines()]
+    assert [row["confirmed"] for row in parsed] == [json.dumps(row["confirmed"]) for row in ndjson]
+
+def test_csv_export_with_no_rows_still_has_a_header(supabase):
+    response = TestClient(app).get("/users/export", params={"format": "csv"})
+
+    assert response.text == "id,email,role\r\n"
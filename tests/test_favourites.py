@@ -0,0 +1,31 @@
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+from main import app
+from routers.favourites import favourite_ids_cache
+
+def test_add_favourite_normalizes_ids(supabase):
+    def handler(request):
+        if request.method == "POST":
+            return httpx.Response(201, json=[json.loads(request.content)])
+        return httpx.Response(200, json=[{"id": 1}])  # Reference checks and the favourite-id read
+
+    supabase.handler = handler
+    favourite_ids_cache.set("3", frozenset({7}))
+    client = TestClient(app)
+
+    response = client.post("/favourites/", json={"user_id": "3", "listing_id": "5"})
+
+    assert response.status_code == 200
+    inserted = [json.loads(request.content) for request in supabase.requests if request.method == "POST"]
+    assert inserted == [{"user_id": 3, "listing_id": 5}]
+    assert favourite_ids_cache.get("3") == frozenset({5, 7})
+    assert client.get("/favourites/ids", params={"user_id": 3}).json()["listing_ids"] == [5, 7]
+
+def test_add_favourite_rejects_non_integer_ids(supabase):
+    response = TestClient(app).post("/favourites/", json={"user_id": 3, "listing_id": "5,6"})
+
+    assert response.status_code == 422
+    assert supabase.requests == []
@@ -0,0 +1,25 @@
+import httpx
+from fastapi.testclient import TestClient
+
+from main import app
+from routers.search_index import ListingSearchIndex
+
+ROWS = [
+    {"id": 1, "title": "Studio", "type": "1BR", "price": 10000, "region_id": 1},
+    {"id": 2, "title": "Bedsitter", "type": "bedsitter", "price": 8000, "region_id": 1},
+    {"id": 3, "title": "Wildcard", "type": "1B.", "price": 9000, "region_id": 1},
+]
+
+def test_type_filter_is_case_insensitive_in_the_search_index():
+    index = ListingSearchIndex()
+    index.rebuild(ROWS)
+
+    assert index.filter_ids(type="1br") == {1}
+    assert index.filter_ids(type="BEDSITTER") == {2}
+
+def test_type_filter_sent_to_postgrest_is_a_case_insensitive_exact_match(supabase):
+    supabase.handler = lambda request: httpx.Response(200, json=[])
+
+    TestClient(app).get("/listings/", params={"type": "1b.", "embed": ""})
+
+    assert supabase.requests[0].url.params["type"] == r"imatch.^1b\.$"
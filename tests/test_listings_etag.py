@@ -0,0 +1,51 @@
+import httpx
+from fastapi.testclient import TestClient
+
+from main import app
+from routers.listing_feed import listing_feed
+
+PAGE = [{"id": 1, "title": "Bedsitter in Ruiru", "updated_at": "2026-01-01T00:00:00+00:00"}]
+
+def synced_feed(monkeypatch, watermark):
+    monkeypatch.setattr(listing_feed, "last_full_sync", 1.0)
+    monkeypatch.setattr(listing_feed, "incremental", True)
+    monkeypatch.setattr(listing_feed, "watermark", watermark)
+
+def test_current_page_is_revalidated_without_a_supabase_read(supabase, monkeypatch):
+    supabase.handler = lambda request: httpx.Response(200, json=PAGE)
+    synced_feed(monkeypatch, ("2026-01-01T00:00:00+00:00", 1))
+    client = TestClient(app)
+
+    first = client.get("/listings/")
+    assert first.status_code == 200
+    assert len(supabase.requests) == 1
+
+    again = client.get("/listings/", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+    assert len(supabase.requests) == 1
+
+    other_page = client.get("/listings/", params={"skip": 20}, headers={"If-None-Match": first.headers["etag"]})
+    assert other_page.status_code == 200
+
+def test_synced_change_invalidates_the_etag(supabase, monkeypatch):
+    supabase.handler = lambda request: httpx.Response(200, json=PAGE)
+    synced_feed(monkeypatch, ("2026-01-01T00:00:00+00:00", 1))
+    client = TestClient(app)
+    etag = client.get("/listings/").headers["etag"]
+
+    synced_feed(monkeypatch, ("2026-01-02T00:00:00+00:00", 1))
+    changed = client.get("/listings/", headers={"If-None-Match": etag})
+
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+def test_without_a_synced_feed_the_etag_hashes_the_page(supabase, monkeypatch):
+    supabase.handler = lambda request: httpx.Response(200, json=PAGE)
+    monkeypatch.setattr(listing_feed, "last_full_sync", None)
+    client = TestClient(app)
+    etag = client.get("/listings/").headers["etag"]
+
+    again = client.get("/listings/", headers={"If-None-Match": etag})
+
+    assert again.status_code == 304
+    assert len(supabase.requests) == 2
@@ -0,0 +1,14 @@
+from fastapi.testclient import TestClient
+
+from main import app
+from routers.photos import upload_size_limit
+
+def test_oversized_upload_413_carries_cors_headers(supabase):
+    origin = "http://localhost:3000"
+    body = b"x" * (upload_size_limit("/photos/upload") * 2)
+
+    response = TestClient(app).post("/photos/upload", content=body, headers={"Origin": origin, "Content-Type": "application/octet-stream"})
+
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] == origin
+    assert supabase.requests == []